@@ -0,0 +1,70 @@
+"""Benchmark dashboard loads: cached precompressed assets vs per-request rendering and disk reads.
+
+Measures server time per request and bytes on the wire for the main, medical
+and patient dashboards through the Flask test client, plus a 1000-reading
+/data response with and without gzip.
+
+Usage: python benchmarks/dashboard_assets_bench.py [--requests 2000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault('TELEMETRY_LOG_DIR', '')
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+
+from flask import render_template_string, send_from_directory
+
+import app as server
+
+BROWSER = {'Accept-Encoding': 'gzip, deflate, br'}
+
+
+def measure(client, path, requests, headers=None):
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(path, headers=headers)
+        size = len(response.get_data())
+    return (time.perf_counter() - started) / requests * 1e6, size, response.status_code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    # The previous handlers, for comparison
+    with open(os.path.join(server.STATIC_DIR, 'critical_alerts.html')) as page:
+        inline_html = page.read()
+    server.app.add_url_rule('/old/', 'old_dashboard', lambda: render_template_string(inline_html))
+    server.app.add_url_rule('/old/static/<path:filename>', 'old_static',
+                            lambda filename: send_from_directory(server.STATIC_DIR, filename))
+    client = server.app.test_client()
+
+    print(f"{'request':<44} {'us/req':>8} {'bytes':>8}")
+    for label, old_path, path in (('main dashboard', '/old/', '/'),
+                                  ('patient dashboard', '/old/static/patient_dashboard.html',
+                                   '/static/patient_dashboard.html'),
+                                  ('medical dashboard', '/old/static/medical_dashboard.html', '/medical')):
+        etag = client.get(path, headers=BROWSER).headers['ETag']
+        for name, target, headers in (('before', old_path, BROWSER),
+                                      ('cached, compressed', path, BROWSER),
+                                      ('revalidated (304)', path, {**BROWSER, 'If-None-Match': etag})):
+            micros, size, status = measure(client, target, args.requests, headers)
+            print(f"{label + ': ' + name:<44} {micros:8.1f} {size:8d}  ({status})")
+
+    for index in range(1000):
+        server.processed_health_data.append({'timestamp': '2024-01-01T00:00:00', 'heart_rate': 60 + index % 60,
+                                             'fall': False, 'patient_id': f"P{index % 50:03d}",
+                                             'data': json.dumps({'heart_rate': 60 + index % 60, 'fall': 0}),
+                                             'is_critical': False, 'triggered_rules': []})
+    for name, headers in (('/data?limit=1000: identity', None), ('/data?limit=1000: gzip', BROWSER)):
+        micros, size, status = measure(client, '/data?limit=1000', max(args.requests // 10, 1), headers)
+        print(f"{name:<44} {micros:8.1f} {size:8d}  ({status})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Benchmark payload decoding: plain base64 vs AES per message vs AES batch decode.
+
+Usage: python benchmarks/decrypt_bench.py [--count 100000] [--batch 100]
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+
+from cipher import DeviceCipher
+from firmware import AES_KEY as KEY, encrypt_data as firmware_encrypt
+
+
+def report(name, count, elapsed):
+    print(f"{name:<24} {count / elapsed:>12,.0f} msg/s  ({elapsed / count * 1e6:.2f} us/msg)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=100_000)
+    parser.add_argument('--batch', type=int, default=100)
+    args = parser.parse_args()
+
+    messages = [json.dumps({'heart_rate': random.randint(55, 140), 'fall': random.randint(0, 1)})
+                for _ in range(args.count)]
+    plain = [base64.b64encode(message.encode()).decode() for message in messages]
+    encrypted = [firmware_encrypt(message) for message in messages]
+    cipher = DeviceCipher(KEY)
+
+    started = time.perf_counter()
+    for item in plain:
+        json.loads(base64.b64decode(item).decode('utf-8'))
+    report('plain base64', args.count, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for item in encrypted:
+        json.loads(cipher.decrypt(base64.b64decode(item)).decode('utf-8'))
+    report('AES per message', args.count, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for offset in range(0, args.count, args.batch):
+        payloads = [base64.b64decode(item) for item in encrypted[offset:offset + args.batch]]
+        for plaintext in cipher.decrypt_many(payloads):
+            json.loads(plaintext.decode('utf-8'))
+    report(f'AES batch of {args.batch}', args.count, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for item in encrypted[:args.count // 10]:
+        fresh = DeviceCipher(KEY)  # what an uncached key schedule per message costs
+        json.loads(fresh.decrypt(base64.b64decode(item)).decode('utf-8'))
+    report('AES uncached context', args.count // 10, time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Benchmark bulk export and daily analytics over a synthetic telemetry log.
+
+Compares the NumPy daily aggregate with the equivalent Python loop over
+reading dicts, and measures streamed CSV (and Arrow, if pyarrow is
+installed) export throughput and peak memory.
+
+Usage: python benchmarks/export_bench.py [--readings 500000] [--patients 200] [--days 7]
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+
+from export import available_formats, column_chunks, daily_aggregates, stream_export
+from telemetry_log import TelemetryLog, list_segments, read_segments
+
+
+def write_log(directory, readings, patients, days):
+    log = TelemetryLog(directory)
+    start = datetime.datetime(2024, 1, 1)
+    step = days * 86400 / readings
+    for seq in range(1, readings + 1):
+        heart_rate = random.randint(45, 140)
+        fall = random.random() < 0.001
+        log.append('reading', {
+            'timestamp': (start + datetime.timedelta(seconds=seq * step)).isoformat(),
+            'heart_rate': heart_rate,
+            'fall': fall,
+            'patient_id': f"P{random.randrange(patients):04d}",
+            'data': f'{{"heart_rate":{heart_rate},"fall":{str(fall).lower()}}}',
+            'is_critical': fall or heart_rate > 120,
+            'triggered_rules': [],
+            'seq': seq
+        })
+    log.close()
+
+
+def history(directory):
+    return (record for _, record in read_segments(list_segments(directory), ('reading',)))
+
+
+def python_aggregates(records, percentiles):
+    groups = {}
+    for record in records:
+        group = groups.setdefault((record['patient_id'], record['timestamp'][:10]), ([], [0, 0]))
+        group[0].append(record['heart_rate'])
+        group[1][0] += record['fall']
+        group[1][1] += record['is_critical']
+    rows = []
+    for (patient_id, date), (heart_rates, (falls, critical)) in groups.items():
+        quantiles = statistics.quantiles(heart_rates, n=100, method='inclusive') if len(heart_rates) > 1 else heart_rates * 99
+        rows.append({'patient_id': patient_id, 'date': date, 'readings': len(heart_rates),
+                     'mean': statistics.fmean(heart_rates), 'falls': falls, 'critical_readings': critical,
+                     **{f"p{q}": quantiles[q - 1] for q in percentiles}})
+    return rows
+
+
+def timed(label, function, baseline=None):
+    started = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - started
+    speedup = f"  ({baseline / elapsed:.1f}x)" if baseline else ""
+    print(f"  {label:<28} {elapsed * 1000:9.1f} ms{speedup}")
+    return elapsed, result
+
+
+def peak_memory(function):
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readings', type=int, default=500000)
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--days', type=int, default=7)
+    args = parser.parse_args()
+    random.seed(42)
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        write_log(directory, args.readings, args.patients, args.days)
+        size = sum(os.path.getsize(path) for path in list_segments(directory))
+        print(f"{args.readings} readings, {args.patients} patients, {args.days} days: "
+              f"{size / 2 ** 20:.1f} MiB log written in {time.perf_counter() - started:.1f}s")
+
+        _, records = timed("read + parse log", lambda: list(history(directory)))
+        print("Daily aggregates (p50/p90/p99) over parsed readings:")
+        baseline, expected = timed("Python loop over dicts", lambda: python_aggregates(records, (50, 90, 99)))
+        timed("NumPy (columns + aggregate)", lambda: daily_aggregates(column_chunks(records)), baseline)
+        chunks = list(column_chunks(records))
+        _, rows = timed("NumPy (aggregate only)", lambda: daily_aggregates(chunks), baseline)
+        assert len(rows) == len(expected)
+        del records, chunks
+
+        print("Streamed export from the log:")
+        for fmt in available_formats():
+            elapsed, size = timed(fmt, lambda: sum(len(chunk) for chunk in stream_export(history(directory), fmt)))
+            peak = peak_memory(lambda: sum(1 for _ in stream_export(history(directory), fmt)))
+            print(f"    {args.readings / elapsed:,.0f} rows/s, {size / 2 ** 20:.1f} MiB output, peak {peak:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""What firmware/health_monitor.ino puts on the wire, for benchmarks and load tests"""
+import base64
+import json
+
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+AES_KEY = 'mysecretkey12345'
+ZERO_IV = bytes(16)
+
+
+def encrypt_data(message, key=AES_KEY, iv=ZERO_IV):
+    """encryptData(): AES-128-CBC over the JSON plus its NUL terminator, then base64"""
+    padder = padding.PKCS7(128).padder()
+    plaintext = padder.update(message.encode('utf-8') + b'\x00') + padder.finalize()
+    encryptor = Cipher(algorithms.AES(key.encode()[:16]), modes.CBC(iv)).encryptor()
+    return base64.b64encode(encryptor.update(plaintext) + encryptor.finalize()).decode('ascii')
+
+
+def reading_json(heart_rate, fall, patient_id=None):
+    """serializeJson() of the StaticJsonDocument built in sendDataToServer()"""
+    document = {'heart_rate': heart_rate, 'fall': fall}
+    if patient_id is not None:
+        document['patient_id'] = patient_id
+    return json.dumps(document, separators=(',', ':'))
+
+
+def build_request(host, body, username='iotuser', password='iotpass', path='/update', content_type='text/plain'):
+    """The exact HTTP/1.1 request sendDataToServer() writes with client.print()"""
+    auth = base64.b64encode(f"{username}:{password}".encode()).decode('ascii')
+    if isinstance(body, str):
+        body = body.encode('ascii')
+    head = (f"POST {path} HTTP/1.1\r\n"
+            f"Host: {host}\r\n"
+            f"Authorization: Basic {auth}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n")
+    return head.encode('ascii') + body
@@ -0,0 +1,207 @@
+"""Simulate a fleet of ESP8266 devices against a running server.
+
+Each virtual device does what sendDataToServer() does: open a new TCP
+connection, write a raw HTTP/1.1 POST with Basic auth and an AES+base64
+body, and close. Dashboard endpoints are polled alongside to measure their
+latency under ingest load.
+
+Usage:
+    python benchmarks/fleet_sim.py --devices 1000 --interval 5 --duration 60 \\
+        [--server-pid PID] [--save-baseline base.json] [--compare base.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from firmware import build_request, encrypt_data, reading_json
+
+DASHBOARD_ENDPOINTS = ('/data?limit=100', '/critical-alerts', '/test')
+# Relative change in a metric that is reported as a regression when comparing to a baseline
+REGRESSION_TOLERANCE = 0.10
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def read_rss_kb(pid):
+    if pid is None:
+        return None
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return None
+
+
+class PatientPicker:
+    """Assigns readings to patient IDs, uniformly or with a Zipf skew (a few chatty patients)"""
+
+    def __init__(self, patients, distribution, skew=1.2):
+        self.ids = [f"P{index:05d}" for index in range(patients)]
+        if distribution == 'zipf':
+            weights = [1 / (rank + 1) ** skew for rank in range(patients)]
+            self.pick = lambda device: random.choices(self.ids, weights)[0]
+        elif distribution == 'device':
+            self.pick = lambda device: self.ids[device % patients]
+        else:
+            self.pick = lambda device: random.choice(self.ids)
+
+
+async def send_reading(host, port, request):
+    """One firmware send: connect, write, read the response, close; returns seconds taken"""
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(request)
+        await writer.drain()
+        status = await reader.readline()
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':', 1)[1])
+        await reader.readexactly(length)
+    finally:
+        writer.close()
+    if not status.startswith(b'HTTP/1.1 2') and not status.startswith(b'HTTP/1.0 2'):
+        raise RuntimeError(status.decode(errors='replace').strip())
+    return time.perf_counter() - started
+
+
+async def device_loop(device, args, picker, stats, deadline):
+    # Devices boot at random points within one interval, then report every interval
+    await asyncio.sleep(random.uniform(0, args.interval))
+    username = f"device-{device:05d}" if args.per_device_auth else 'iotuser'
+    while time.monotonic() < deadline:
+        next_send = time.monotonic() + args.interval
+        fall = int(random.random() < args.fall_rate)
+        tachycardia = random.random() < args.tachycardia_rate
+        heart_rate = random.randint(121, 170) if tachycardia else random.randint(55, 100)
+        patient_id = picker.pick(device) if args.send_patient_id else None
+        message = reading_json(heart_rate, fall, patient_id)
+        body = message if args.plain else encrypt_data(message)
+        request = build_request(args.host, body, username=username)
+        try:
+            stats['latencies'].append(await asyncio.wait_for(send_reading(args.host, args.port, request), args.timeout))
+        except Exception as error:
+            stats['errors'][type(error).__name__] = stats['errors'].get(type(error).__name__, 0) + 1
+        await asyncio.sleep(max(0.0, next_send - time.monotonic()))
+
+
+async def dashboard_loop(args, stats, deadline):
+    while time.monotonic() < deadline:
+        for path in DASHBOARD_ENDPOINTS:
+            request = (f"GET {path} HTTP/1.1\r\nHost: {args.host}\r\nConnection: close\r\n\r\n").encode()
+            try:
+                elapsed = await asyncio.wait_for(send_reading(args.host, args.port, request), args.timeout)
+                stats['dashboard'].setdefault(path, []).append(elapsed)
+            except Exception:
+                stats['errors']['dashboard'] = stats['errors'].get('dashboard', 0) + 1
+        await asyncio.sleep(1.0)
+
+
+async def run(args):
+    picker = PatientPicker(args.patients, args.distribution)
+    stats = {'latencies': [], 'errors': {}, 'dashboard': {}}
+    rss_before = read_rss_kb(args.server_pid)
+    started = time.monotonic()
+    deadline = started + args.duration
+    await asyncio.gather(
+        dashboard_loop(args, stats, deadline),
+        *(device_loop(device, args, picker, stats, deadline) for device in range(args.devices))
+    )
+    elapsed = time.monotonic() - started
+    rss_after = read_rss_kb(args.server_pid)
+
+    latencies = stats['latencies']
+    report = {
+        'devices': args.devices,
+        'interval_s': args.interval,
+        'duration_s': round(elapsed, 2),
+        'sent': len(latencies),
+        'errors': stats['errors'],
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'latency_ms': {name: round(percentile(latencies, fraction) * 1000, 3) if latencies else None
+                       for name, fraction in (('p50', 0.5), ('p99', 0.99), ('p999', 0.999))},
+        'dashboard_ms': {path: {'p50': round(percentile(values, 0.5) * 1000, 3),
+                                'p99': round(percentile(values, 0.99) * 1000, 3)}
+                         for path, values in stats['dashboard'].items()},
+        'rss_kb': {'before': rss_before, 'after': rss_after,
+                   'growth': rss_after - rss_before if rss_before is not None and rss_after is not None else None}
+    }
+    return report
+
+
+def flatten(report, prefix=''):
+    for key, value in report.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def compare(report, baseline):
+    """Print metric deltas against a saved baseline; returns True if anything regressed"""
+    lower_is_better = ('latency_ms', 'dashboard_ms', 'rss_kb.growth')
+    current = dict(flatten(report))
+    regressed = False
+    print("\nComparison with baseline:")
+    for name, old in flatten(baseline):
+        new = current.get(name)
+        if new is None or not old or name.startswith(('rss_kb.before', 'rss_kb.after', 'duration_s', 'sent')):
+            continue
+        change = (new - old) / abs(old)
+        worse = change > REGRESSION_TOLERANCE if name.startswith(lower_is_better) else \
+            (name == 'throughput_rps' and change < -REGRESSION_TOLERANCE)
+        regressed = regressed or worse
+        print(f"  {name:<36} {old:>12} -> {new:>12}  ({change:+.1%}){'  REGRESSION' if worse else ''}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--interval', type=float, default=5.0, help="seconds between reports per device (firmware: 5)")
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--fall-rate', type=float, default=0.02)
+    parser.add_argument('--tachycardia-rate', type=float, default=0.05)
+    parser.add_argument('--patients', type=int, default=100)
+    parser.add_argument('--distribution', choices=('uniform', 'zipf', 'device'), default='device')
+    parser.add_argument('--send-patient-id', action='store_true',
+                        help="add patient_id to the JSON (the firmware does not send it)")
+    parser.add_argument('--per-device-auth', action='store_true',
+                        help="authenticate as device-NNNNN (python server/devices.py generate --count N) "
+                             "instead of the shared iotuser")
+    parser.add_argument('--plain', action='store_true', help="send base64 JSON without AES")
+    parser.add_argument('--server-pid', type=int, help="server process to sample RSS from")
+    parser.add_argument('--save-baseline')
+    parser.add_argument('--compare')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, 'w') as baseline:
+            json.dump(report, baseline, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline:
+            if compare(report, json.load(baseline)):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
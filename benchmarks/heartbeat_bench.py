@@ -0,0 +1,64 @@
+"""Benchmark offline detection: timer-wheel heartbeats vs a periodic scan of every device.
+
+Usage: python benchmarks/heartbeat_bench.py [--devices 50000] [--interval 5] [--seconds 60]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+
+from heartbeat import OfflineDetector
+
+
+def simulate_wheel(devices, interval, seconds, timeout):
+    """Every device reports each interval; the wheel ticks once a second"""
+    detector = OfflineDetector(lambda *args: None, interval=interval, missed=timeout // interval)
+    heartbeat_time = tick_time = 0.0
+    for second in range(seconds):
+        started = time.perf_counter()
+        # Devices are spread evenly over the interval
+        for device in range(second % interval, devices, interval):
+            detector.heartbeat(device)
+        heartbeat_time += time.perf_counter() - started
+        started = time.perf_counter()
+        detector.check()
+        tick_time += time.perf_counter() - started
+    return heartbeat_time, tick_time, devices * seconds // interval
+
+
+def simulate_scan(devices, interval, seconds, timeout):
+    """The naive alternative: a last-seen dict and a full scan every second"""
+    last_seen = {}
+    heartbeat_time = tick_time = 0.0
+    for second in range(seconds):
+        now = time.monotonic()
+        started = time.perf_counter()
+        for device in range(second % interval, devices, interval):
+            last_seen[device] = now
+        heartbeat_time += time.perf_counter() - started
+        started = time.perf_counter()
+        [device for device, seen in last_seen.items() if now - seen > timeout]
+        tick_time += time.perf_counter() - started
+    return heartbeat_time, tick_time, devices * seconds // interval
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=50_000)
+    parser.add_argument('--interval', type=int, default=5)
+    parser.add_argument('--missed', type=int, default=3)
+    parser.add_argument('--seconds', type=int, default=60)
+    args = parser.parse_args()
+
+    timeout = args.interval * args.missed
+    for name, simulate in (('timer wheel', simulate_wheel), ('full scan', simulate_scan)):
+        heartbeat_time, tick_time, heartbeats = simulate(args.devices, args.interval, args.seconds, timeout)
+        print(f"{name:<12} {heartbeat_time / heartbeats * 1e6:6.2f} us/heartbeat  "
+              f"{tick_time / args.seconds * 1e3:8.3f} ms/tick  "
+              f"({(heartbeat_time + tick_time) / args.seconds * 100:.1f}% of one core)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Load test: ingest throughput of the multi-process (gunicorn + shared store) mode.
+
+Starts the server with 1, 2, 4, ... workers, drives /update from parallel
+client processes and reports requests/s and scaling efficiency.
+
+Usage: python benchmarks/ingest_scaling.py [--workers 1,2,4] [--clients 8] [--duration 10]
+"""
+import argparse
+import base64
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server')
+# The firmware's shared account (server/devices.json); it may name the patient in the payload
+AUTHORIZATION = 'Basic ' + base64.b64encode(b'iotuser:iotpass').decode()
+
+
+def client(port, duration, results):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    sent = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        body = base64.b64encode(json.dumps({
+            'heart_rate': random.randint(55, 140),
+            'fall': random.randint(0, 1),
+            'patient_id': f"P{random.randint(0, 999):04d}"
+        }).encode())
+        connection.request('POST', '/update', body, {'Content-Type': 'text/plain', 'Authorization': AUTHORIZATION})
+        connection.getresponse().read()
+        sent += 1
+    results.put(sent)
+
+
+def wait_ready(port, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/test')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+def run(workers, clients, duration, port, store_port):
+    env = {**os.environ, 'TELEMETRY_LOG_DIR': '', 'LOG_LEVEL': 'WARNING',
+           'HEALTH_STORE_BIND': f'127.0.0.1:{store_port}'}
+    env.pop('HEALTH_STORE_ADDRESS', None)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-w', str(workers), '-b', f'127.0.0.1:{port}', 'app:app'],
+        cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_ready(port)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=client, args=(port, duration, results)) for _ in range(clients)]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        total = sum(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+        return total / (time.perf_counter() - started)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=5100)
+    args = parser.parse_args()
+
+    baseline = None
+    for index, workers in enumerate(int(value) for value in args.workers.split(',')):
+        rate = run(workers, args.clients, args.duration, args.port + index, args.port + 100 + index)
+        baseline = baseline or rate / workers
+        print(f"{workers:>3} workers: {rate:>10,.0f} req/s  (scaling efficiency {rate / (baseline * workers):.0%})",
+              flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark the cost of /metrics instrumentation (and the sampling profiler) on /update.
+
+Usage: python benchmarks/metrics_overhead.py [--requests 20000] [--rounds 5]
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+os.environ.setdefault('TELEMETRY_LOG_DIR', '')
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+import app as server
+
+# The firmware's shared account (server/devices.json)
+HEADERS = {'Authorization': 'Basic ' + base64.b64encode(b'iotuser:iotpass').decode()}
+
+
+def run(client, bodies):
+    started = time.perf_counter()
+    for body in bodies:
+        client.post('/update', data=body, content_type='text/plain', headers=HEADERS)
+    return (time.perf_counter() - started) / len(bodies) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20_000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    bodies = [base64.b64encode(json.dumps({
+        'heart_rate': random.randint(55, 140), 'fall': int(random.random() < 0.02),
+        'patient_id': f"P{random.randrange(1000):04d}"
+    }).encode()) for _ in range(args.requests)]
+    client = server.app.test_client()
+    run(client, bodies[:1000])  # warm up
+
+    # Interleave configurations so drift affects them equally; keep the best round of each
+    results = {'metrics off': [], 'metrics on': [], 'metrics on + profiler': []}
+    for _ in range(args.rounds):
+        server.metrics.enabled = False
+        results['metrics off'].append(run(client, bodies))
+        server.metrics.enabled = True
+        results['metrics on'].append(run(client, bodies))
+        server.profiler.start()
+        results['metrics on + profiler'].append(run(client, bodies))
+        server.profiler.stop()
+
+    baseline = min(results['metrics off'])
+    for name, values in results.items():
+        best = min(values)
+        print(f"{name:<24} {best:8.2f} us/request  ({(best - baseline) / baseline:+.1%})")
+
+
+if __name__ == '__main__':
+    main()
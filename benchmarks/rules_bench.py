@@ -0,0 +1,45 @@
+"""Benchmark the streaming rule engine: cost per reading against its microsecond budget.
+
+Usage: python benchmarks/rules_bench.py [--readings 1000000] [--patients 10000] [--budget-us 50]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+
+from rules import RuleEngine, load_rule_specs
+
+RULES_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server', 'rules.json')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readings', type=int, default=1_000_000)
+    parser.add_argument('--patients', type=int, default=10_000)
+    parser.add_argument('--budget-us', type=float, default=50.0)
+    args = parser.parse_args()
+
+    engine = RuleEngine(load_rule_specs(RULES_CONFIG), budget_us=args.budget_us)
+    readings = [(f"P{random.randrange(args.patients):05d}", random.randint(55, 150), int(random.random() < 0.02))
+                for _ in range(100_000)]
+    now = time.time()
+    fired = 0
+    started = time.perf_counter()
+    for index in range(args.readings):
+        patient_id, heart_rate, fall = readings[index % len(readings)]
+        fired += len(engine.evaluate(patient_id, heart_rate, fall, now + index / 10_000))
+    elapsed = time.perf_counter() - started
+
+    stats = engine.stats()
+    per_reading = elapsed / args.readings * 1e6
+    print(f"{len(engine.rules)} rules, {args.patients} patients, {args.readings} readings, {fired} alerts")
+    print(f"mean {per_reading:.2f} us/reading ({args.readings / elapsed:,.0f} readings/s per core), "
+          f"{stats['over_budget']} over the {args.budget_us:g} us budget")
+    print(f"at 10k readings/s the rules use {per_reading * 10_000 / 1e6:.1%} of one core")
+
+
+if __name__ == '__main__':
+    main()
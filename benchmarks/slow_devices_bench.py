@@ -0,0 +1,144 @@
+"""Benchmark many slow device connections: Flask (gunicorn gthread) vs the asyncio ingest listener.
+
+Each slow device opens a connection, sends the firmware's request head and
+trickles the AES+base64 body over ``--trickle`` seconds, as a device on
+flaky WiFi would, so all of them are connected at once. Meanwhile a probe
+device sends normal readings back to back; its latency shows whether the
+server still serves anyone else.
+
+Usage: python benchmarks/slow_devices_bench.py [--devices 10000] [--trickle 10] [--servers flask,async]
+"""
+import argparse
+import asyncio
+import http.client
+import os
+import subprocess
+import sys
+import time
+
+from firmware import build_request, encrypt_data, reading_json
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server')
+
+
+def start_server(kind, port, threads):
+    env = {**os.environ, 'TELEMETRY_LOG_DIR': '', 'LOG_LEVEL': 'ERROR', 'INGEST_BODY_TIMEOUT': '60'}
+    env.pop('HEALTH_STORE_ADDRESS', None)
+    if kind == 'flask':
+        # No gunicorn.conf.py: one worker with in-process stores, like the async listener
+        command = [sys.executable, '-m', 'gunicorn', '-k', 'gthread', '-w', '1', '--threads', str(threads),
+                   '--worker-connections', '20000', '--backlog', '4096', '-b', f'127.0.0.1:{port}', 'app:app']
+    else:
+        command = [sys.executable, 'async_ingest.py', '--host', '127.0.0.1', '--port', str(port), '--api-port', '0']
+    server = subprocess.Popen(command, cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('POST', '/update', reading_json(70, 0), {'Content-Type': 'text/plain'})
+            connection.getresponse().read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"{kind} server did not become ready")
+
+
+async def read_status(reader):
+    """Status line of the response, after reading its body by Content-Length"""
+    status = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':', 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+async def slow_device(port, request, trickle, pieces, stats, timeout):
+    head_end = request.index(b'\r\n\r\n') + 4
+    head, body = request[:head_end], request[head_end:]
+    step = -(-len(body) // pieces)
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+        stats['open'] += 1
+        stats['peak_open'] = max(stats['peak_open'], stats['open'])
+        try:
+            writer.write(head)
+            for offset in range(0, len(body), step):
+                await asyncio.sleep(trickle / pieces)
+                writer.write(body[offset:offset + step])
+            status = await asyncio.wait_for(read_status(reader), timeout)
+        finally:
+            stats['open'] -= 1
+            writer.close()
+        stats['ok' if status.startswith(b'HTTP/1.1 200') else 'failed'] += 1
+    except (OSError, asyncio.TimeoutError):
+        stats['failed'] += 1
+
+
+async def probe(port, request, deadline, latencies, stats, timeout):
+    """A well-behaved device sending readings back to back"""
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+            writer.write(request)
+            status = await asyncio.wait_for(read_status(reader), timeout)
+            writer.close()
+            if status.startswith(b'HTTP/1.1 200'):
+                latencies.append(time.perf_counter() - started)
+            else:
+                stats['probe_failed'] += 1
+        except (OSError, asyncio.TimeoutError):
+            stats['probe_failed'] += 1
+        await asyncio.sleep(0.05)
+
+
+async def run(port, devices, trickle, timeout):
+    request = build_request('127.0.0.1', encrypt_data(reading_json(72, 0)))
+    stats = {'ok': 0, 'failed': 0, 'open': 0, 'peak_open': 0, 'probe_failed': 0}
+    latencies = []
+    started = time.monotonic()
+    slow = []
+    # Connect in waves so the listen backlog is not the bottleneck being measured
+    for index in range(devices):
+        slow.append(asyncio.ensure_future(slow_device(port, request, trickle, 4, stats, timeout)))
+        if index % 500 == 499:
+            await asyncio.sleep(0.05)
+    await asyncio.gather(probe(port, request, started + trickle, latencies, stats, timeout), *slow)
+    stats['elapsed_s'] = round(time.monotonic() - started, 1)
+    latencies.sort()
+    for name, fraction in (('p50', 0.5), ('p99', 0.99)):
+        stats[f'probe_{name}_ms'] = round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 1) \
+            if latencies else None
+    stats['probe_ok'] = len(latencies)
+    del stats['open']
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=10000)
+    parser.add_argument('--trickle', type=float, default=10.0, help="seconds each slow device takes to send its body")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--threads', type=int, default=4, help="gunicorn threads (WEB_THREADS)")
+    parser.add_argument('--servers', default='flask,async')
+    parser.add_argument('--port', type=int, default=5200)
+    args = parser.parse_args()
+
+    for index, kind in enumerate(args.servers.split(',')):
+        server = start_server(kind, args.port + index, args.threads)
+        try:
+            stats = asyncio.run(run(args.port + index, args.devices, args.trickle, args.timeout))
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{kind:>6}: {stats}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
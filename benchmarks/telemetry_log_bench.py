@@ -0,0 +1,64 @@
+"""Benchmark the telemetry log: sustained ingest rate and recovery time.
+
+Usage: python benchmarks/telemetry_log_bench.py [--count 10000000] [--patients 5000]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+
+from store import PatientStore
+from telemetry_log import TelemetryLog
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=10_000_000)
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--segment-mb', type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        log = TelemetryLog(directory, segment_bytes=args.segment_mb * 1024 * 1024, max_segments=1_000_000)
+        timestamp = datetime.datetime.now().isoformat()
+        started = time.perf_counter()
+        for index in range(args.count):
+            heart_rate = random.randint(55, 140)
+            fall = 1 if index % 50 == 0 else 0
+            record = {
+                'timestamp': timestamp,
+                'heart_rate': heart_rate,
+                'fall': fall,
+                'patient_id': f"P{index % args.patients:05d}",
+                'data': f'{{"heart_rate": {heart_rate}, "fall": {fall}}}',
+                'is_critical': fall == 1 and heart_rate > 100,
+                'seq': index + 1
+            }
+            log.append('reading', record)
+        log.close()
+        elapsed = time.perf_counter() - started
+        stats = log.stats()
+        print(f"ingest:   {args.count} readings in {elapsed:.2f}s "
+              f"({args.count / elapsed:,.0f} readings/s, {stats['fsyncs']} fsyncs, "
+              f"{stats['bytes_written'] / 1e6:.1f} MB, {stats['segments']} segments)")
+
+        started = time.perf_counter()
+        log = TelemetryLog(directory, max_segments=1_000_000)
+        store = PatientStore(100, 1_000_000)
+        replayed = 0
+        for _, record in log.replay():
+            store.append(record)
+            replayed += 1
+        elapsed = time.perf_counter() - started
+        log.close()
+        print(f"recovery: {replayed} readings replayed in {elapsed:.2f}s "
+              f"({replayed / elapsed:,.0f} readings/s, {len(store)} kept in memory)")
+
+
+if __name__ == '__main__':
+    main()
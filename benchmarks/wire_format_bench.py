@@ -0,0 +1,87 @@
+"""Benchmark the binary frame wire format against base64 AES JSON: CPU per message and bytes on the wire.
+
+Usage: python benchmarks/wire_format_bench.py [--count 100000] [--requests 5000]
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+os.environ.setdefault('TELEMETRY_LOG_DIR', '')
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from cipher import DeviceCipher
+from firmware import AES_KEY, ZERO_IV, build_request, encrypt_data, reading_json
+from wire import FRAME_V1, encode_frame, iter_frames
+
+BINARY_TYPE = 'application/vnd.health-monitor.reading.v1'
+
+
+def encrypt_frame(frame, key=AES_KEY, iv=ZERO_IV):
+    padder = padding.PKCS7(128).padder()
+    encryptor = Cipher(algorithms.AES(key.encode()[:16]), modes.CBC(iv)).encryptor()
+    return encryptor.update(padder.update(frame) + padder.finalize()) + encryptor.finalize()
+
+
+def report(name, count, elapsed, body_bytes, request_bytes):
+    print(f"{name:<18} {elapsed / count * 1e6:8.2f} us/msg  {body_bytes:>4} B body  {request_bytes:>4} B request")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=100_000)
+    parser.add_argument('--requests', type=int, default=5_000, help="end-to-end /update requests per format")
+    args = parser.parse_args()
+
+    readings = [(random.randint(55, 140), int(random.random() < 0.02), random.uniform(0.5, 3.0))
+                for _ in range(args.count)]
+    now = int(time.time())
+    json_bodies = [encrypt_data(reading_json(hr, fall)).encode('ascii') for hr, fall, _ in readings]
+    frames = [encode_frame(1, seq, now, hr, fall, accel) for seq, (hr, fall, accel) in enumerate(readings)]
+    aes_frames = [encrypt_frame(frame) for frame in frames]
+    cipher = DeviceCipher(AES_KEY)
+
+    def wire_size(body, content_type):
+        return len(body), len(build_request('192.168.1.10', body, content_type=content_type))
+
+    print("Decode only (what update() does before the rule check):")
+    started = time.perf_counter()
+    for body in json_bodies:
+        json.loads(cipher.decrypt(base64.b64decode(body)).decode('utf-8'))
+    report('AES+base64 JSON', args.count, time.perf_counter() - started, *wire_size(json_bodies[0], 'text/plain'))
+
+    started = time.perf_counter()
+    for body in aes_frames:
+        for _ in iter_frames(cipher.decrypt(body, text=False), FRAME_V1):
+            pass
+    report('AES binary frame', args.count, time.perf_counter() - started, *wire_size(aes_frames[0], BINARY_TYPE + '+aes'))
+
+    started = time.perf_counter()
+    for body in frames:
+        for _ in iter_frames(body, FRAME_V1):
+            pass
+    report('plain binary frame', args.count, time.perf_counter() - started, *wire_size(frames[0], BINARY_TYPE))
+
+    import app as server
+    client = server.app.test_client()
+    headers = {'Authorization': 'Basic ' + base64.b64encode(b'iotuser:iotpass').decode()}
+    print(f"\nEnd to end through /update ({args.requests} requests each):")
+    for name, bodies, content_type in (('AES+base64 JSON', json_bodies, 'text/plain'),
+                                       ('AES binary frame', aes_frames, BINARY_TYPE + '+aes')):
+        client.post('/update', data=bodies[0], content_type=content_type, headers=headers)  # warm the auth cache
+        started = time.perf_counter()
+        for body in bodies[:args.requests]:
+            client.post('/update', data=body, content_type=content_type, headers=headers)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<18} {elapsed / args.requests * 1e6:8.2f} us/request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""Alert lifecycle: repeated alerts for a patient and condition coalesce into one incident.
+
+An incident is opened by the first alert, stays ongoing while the condition
+keeps firing, escalates one severity level for every ``escalate_after``
+seconds it stays active, and resolves after ``resolve_after`` quiet seconds.
+Alerts naming a ``device`` (device offline) get an incident per device.
+Only those transitions (open, escalated, resolved) produce alert records,
+so a patient lying down with a high heart rate no longer adds an alert every
+5 s. Deadlines are kept in the same timer wheel as the offline detector.
+"""
+import datetime
+import itertools
+import logging
+import threading
+import time
+
+from heartbeat import TimerWheel
+
+SEVERITIES = ('LOW', 'MEDIUM', 'HIGH', 'CRITICAL')
+logger = logging.getLogger('health_monitor.alerts')
+
+
+def severity_rank(severity):
+    return SEVERITIES.index(severity) if severity in SEVERITIES else 1
+
+
+def escalate(severity):
+    return SEVERITIES[min(severity_rank(severity) + 1, len(SEVERITIES) - 1)]
+
+
+class Incident:
+    __slots__ = ('id', 'key', 'alert', 'severity', 'opened', 'opened_at', 'last_seen', 'escalated',
+                 'occurrences', 'sticky')
+
+    def __init__(self, incident_id, key, alert, now, sticky):
+        self.id = incident_id
+        self.key = key
+        self.alert = alert
+        self.severity = alert.get('severity', 'MEDIUM')
+        self.opened = now
+        self.opened_at = datetime.datetime.now().isoformat()
+        self.last_seen = now
+        self.escalated = now
+        self.occurrences = 1
+        self.sticky = sticky
+
+    def record(self, status, message=None):
+        """Alert record for a lifecycle transition (same fields as a rule alert plus the incident's)"""
+        record = dict(self.alert)
+        record.pop('seq', None)
+        record.update({
+            'timestamp': datetime.datetime.now().isoformat(),
+            'severity': self.severity,
+            'incident_id': self.id,
+            'status': status,
+            'occurrences': self.occurrences,
+            'opened_at': self.opened_at,
+        })
+        if message:
+            record['message'] = message
+        return record
+
+    def to_dict(self, now):
+        return {
+            'incident_id': self.id,
+            'patient_id': self.key[0],
+            'rule': self.key[1],
+            'device': self.key[2],
+            'severity': self.severity,
+            'status': 'open' if self.occurrences == 1 else 'ongoing',
+            'occurrences': self.occurrences,
+            'opened_at': self.opened_at,
+            'active_s': round(now - self.opened, 1),
+            'quiet_s': round(now - self.last_seen, 1),
+            'message': self.alert.get('message')
+        }
+
+
+class IncidentTracker:
+    """Coalesces alerts per (patient_id, rule, device); ``emit(record)`` receives each transition record"""
+
+    def __init__(self, emit, resolve_after=60.0, escalate_after=120.0, tick=1.0, slots=512):
+        self.emit = emit
+        self.resolve_after = resolve_after
+        self.escalate_after = escalate_after
+        self.tick = tick
+        self.coalesced = 0
+        self.transitions = {'open': 0, 'escalated': 0, 'resolved': 0}
+        self._active = {}
+        self._ids = itertools.count(int(time.time() * 1000))
+        self._wheel = TimerWheel(tick, slots)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _next_check(self, incident):
+        checks = [incident.escalated + self.escalate_after] if incident.severity != SEVERITIES[-1] else []
+        if not incident.sticky:
+            checks.append(incident.last_seen + self.resolve_after)
+        return min(checks) if checks else None
+
+    def trigger(self, alert, sticky=False, now=None):
+        """Record one firing; returns the 'open' record, or None when it joined an active incident.
+
+        Sticky incidents (e.g. a device offline) only end through ``resolve()``.
+        """
+        now = time.monotonic() if now is None else now
+        key = (alert['patient_id'], alert['rule'], alert.get('device'))
+        with self._lock:
+            incident = self._active.get(key)
+            if incident is not None:
+                incident.occurrences += 1
+                incident.last_seen = now
+                incident.alert = alert
+                self.coalesced += 1
+                return None
+            incident = self._active[key] = Incident(next(self._ids), key, alert, now, sticky)
+            next_check = self._next_check(incident)
+            if next_check is not None:
+                self._wheel.schedule(next_check, (key, incident.id))
+            record = incident.record('open')
+            self.transitions['open'] += 1
+        self.emit(record)
+        return record
+
+    def resolve(self, patient_id, rule, reason=None, device=None):
+        with self._lock:
+            incident = self._active.pop((patient_id, rule, device), None)
+            if incident is None:
+                return None
+            record = self._resolved_record(incident, time.monotonic(), reason)
+        self.emit(record)
+        return record
+
+    def _resolved_record(self, incident, now, reason=None):
+        self.transitions['resolved'] += 1
+        return incident.record('resolved', reason or
+                               f"Resolved after {now - incident.opened:.0f}s ({incident.occurrences} occurrences)")
+
+    def check(self, now=None):
+        """Escalate and resolve incidents whose time has come; returns the records emitted"""
+        now = time.monotonic() if now is None else now
+        records = []
+        with self._lock:
+            for key, incident_id in self._wheel.advance(now):
+                incident = self._active.get(key)
+                # Timers of incidents resolved through resolve() are dropped here
+                if incident is None or incident.id != incident_id:
+                    continue
+                if not incident.sticky and now >= incident.last_seen + self.resolve_after:
+                    del self._active[key]
+                    records.append(self._resolved_record(incident, now))
+                    continue
+                if incident.severity != SEVERITIES[-1] and now >= incident.escalated + self.escalate_after:
+                    incident.severity = escalate(incident.severity)
+                    incident.escalated = now
+                    self.transitions['escalated'] += 1
+                    records.append(incident.record('escalated', (
+                        f"{incident.alert.get('message', key[1])} - escalated to {incident.severity} after "
+                        f"{now - incident.opened:.0f}s ({incident.occurrences} occurrences)")))
+                next_check = self._next_check(incident)
+                if next_check is not None:
+                    self._wheel.schedule(next_check, (key, incident.id))
+        for record in records:
+            self.emit(record)
+        return records
+
+    def active(self):
+        now = time.monotonic()
+        with self._lock:
+            incidents = list(self._active.values())
+        incidents.sort(key=lambda incident: (-severity_rank(incident.severity), incident.opened))
+        return [incident.to_dict(now) for incident in incidents]
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='alert-lifecycle', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("alert lifecycle check failed")
+
+    def stats(self):
+        return {
+            "active": len(self._active),
+            "coalesced": self.coalesced,
+            "transitions": dict(self.transitions),
+            "resolve_after_s": self.resolve_after,
+            "escalate_after_s": self.escalate_after
+        }
@@ -1,30 +1,533 @@
-from flask import Flask, request, jsonify, send_from_directory, render_template_string
+from flask import Flask, Response, request, jsonify
+import atexit
+import base64
 import datetime
+import gzip
+import hmac
 import json
-import base64
+import logging
+import os
+import threading
+import time
+import zlib
+
+from store import PatientStore
+from stream import EventBroker, sse_events
+from telemetry_log import TelemetryLog, list_segments, read_segments
+from rollups import RESOLUTIONS, RollupEngine, lttb
+from pipeline import IngestPipeline
+from cipher import BLOCK_SIZE, CRYPTO_AVAILABLE, KeyRing
+import shared_store
+from rules import DEFAULT_RULES, RuleEngine, apply_overrides, load_rule_specs
+from metrics import REQUEST_BUCKETS, Registry, SamplingProfiler
+from devices import DeviceRegistry
+from wire import FrameError, frame_format, iter_frames
+from patients import SORT_ORDERS, PatientIndex
+from heartbeat import OfflineDetector, offline_alert
+from alerts import IncidentTracker
+from capture import CaptureRecorder
+from runtime_config import RuntimeConfig
+from assets import IMMUTABLE, REVALIDATE, AssetCache, parse_accept_encoding
+from export import DEFAULT_CHUNK_ROWS, EXTENSIONS, MIMETYPES, available_formats, column_chunks, daily_aggregates, stream_export
+
+# Static files are served from the in-memory AssetCache below, not Flask's static route
+app = Flask(__name__, static_folder=None)
+
+# Structured, level-filtered logging (LOG_LEVEL=DEBUG shows headers and raw payloads)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+logger = logging.getLogger('health_monitor')
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Retention: per-patient (per-device for raw messages) windows plus a global budget
+RAW_PER_DEVICE = int(os.environ.get('RAW_PER_DEVICE', 50))
+RAW_MAX_RECORDS = int(os.environ.get('RAW_MAX_RECORDS', 5000))
+READINGS_PER_PATIENT = int(os.environ.get('READINGS_PER_PATIENT', 100))
+READINGS_MAX_RECORDS = int(os.environ.get('READINGS_MAX_RECORDS', 100000))
+ALERTS_PER_PATIENT = int(os.environ.get('ALERTS_PER_PATIENT', 50))
+ALERTS_MAX_RECORDS = int(os.environ.get('ALERTS_MAX_RECORDS', 10000))
+
+# Hot-path instrumentation served at /metrics (METRICS_ENABLED=0 turns recording off)
+metrics = Registry(enabled=os.environ.get('METRICS_ENABLED', '1') != '0')
+stage_seconds = metrics.histogram('ingest_stage_seconds', 'Time spent in each stage of update()', ('stage',))
+request_seconds = metrics.histogram('http_request_seconds', 'Request latency per route', ('route', 'method', 'status'),
+                                    buckets=REQUEST_BUCKETS)
+decode_failures = metrics.counter('ingest_decode_failures_total', 'Payloads that could not be decoded', ('reason',))
+parse_failures = metrics.counter('ingest_parse_failures_total', 'Decoded payloads that were not valid readings', ('reason',))
+readings_accepted = metrics.counter('ingest_readings_total', 'Readings accepted')
+alerts_raised = metrics.counter('alerts_raised_total', 'Alerts raised', ('rule',))
+auth_failures = metrics.counter('auth_failures_total', 'Rejected device credentials', ('reason',))
+profiler = SamplingProfiler()
 
-app = Flask(__name__)
+# Multi-process mode: worker processes share one store broker (see shared_store.py / gunicorn.conf.py)
+HEALTH_STORE_ADDRESS = os.environ.get('HEALTH_STORE_ADDRESS')
+SHARED_STORE = bool(HEALTH_STORE_ADDRESS)
+SHARED_RELAY_INTERVAL = float(os.environ.get('SHARED_RELAY_INTERVAL', 0.5))
 
 # Store the received data (in memory)
-received_data = []
-processed_health_data = []
-critical_alerts = []  # New: Store only critical alerts
+if SHARED_STORE:
+    # The broker also evaluates the rules, tracks alert incidents and sends notifications, once for all workers
+    (processed_health_data, critical_alerts, received_data,
+     shared_incidents, shared_notifications, shared_rules) = shared_store.connect(HEALTH_STORE_ADDRESS)
+else:
+    received_data = PatientStore(RAW_PER_DEVICE, RAW_MAX_RECORDS, key='auth_user', default_key='anonymous')
+    processed_health_data = PatientStore(READINGS_PER_PATIENT, READINGS_MAX_RECORDS)
+    critical_alerts = PatientStore(ALERTS_PER_PATIENT, ALERTS_MAX_RECORDS)  # New: Store only critical alerts
+
+# Per-patient min/max/mean HR and fall-count rollups for charts
+rollups = RollupEngine()
+SERIES_MAX_POINTS = int(os.environ.get('SERIES_MAX_POINTS', 500))
+
+# Current status per patient for the /patients roster (stale after PATIENT_STALE_SECONDS without a reading)
+patient_index = PatientIndex(open_seconds=float(os.environ.get('ALERT_OPEN_SECONDS', 300)),
+                             stale_seconds=float(os.environ.get('PATIENT_STALE_SECONDS', 30)))
+
+# Push channel for dashboards (/stream)
+# Every SSE client holds a server thread for as long as it is connected; the cap keeps them from
+# taking the threads ingest needs (gunicorn.conf.py sizes its thread pool as WEB_THREADS + this)
+STREAM_MAX_CLIENTS = int(os.environ.get('STREAM_MAX_CLIENTS', 16))
+event_broker = EventBroker(int(os.environ.get('STREAM_HISTORY', 1000)), STREAM_MAX_CLIENTS)
+
+# Durable append-only log behind the in-memory windows (set TELEMETRY_LOG_DIR='' to disable).
+# With a shared store the broker process owns the log instead.
+TELEMETRY_LOG_DIR = os.environ.get('TELEMETRY_LOG_DIR', os.path.join(DATA_DIR, 'telemetry'))
+REPLAY_SEGMENTS = int(os.environ.get('REPLAY_SEGMENTS', 4))
+telemetry_log = None
+
+def index_reading(entry):
+    """Update the derived per-patient views for a stored reading"""
+    epoch_seconds = datetime.datetime.fromisoformat(entry['timestamp']).timestamp()
+    rollups.add(entry['patient_id'], epoch_seconds, entry['heart_rate'], entry['fall'])
+    patient_index.add_reading(entry, epoch_seconds)
+
+def index_alert(alert):
+    patient_index.add_alert(alert, datetime.datetime.fromisoformat(alert['timestamp']).timestamp())
+
+def restore_from_log():
+    """Rebuild the in-memory windows from the most recent log segments"""
+    started = time.perf_counter()
+    restored = 0
+    for kind, record in telemetry_log.replay(REPLAY_SEGMENTS):
+        if kind == 'reading':
+            processed_health_data.append(record)
+            index_reading(record)
+        else:
+            critical_alerts.append(record)
+            index_alert(record)
+        restored += 1
+    logger.info("💾 Restored %d records from %s in %.2fs", restored, TELEMETRY_LOG_DIR, time.perf_counter() - started)
+
+if TELEMETRY_LOG_DIR and not SHARED_STORE:
+    telemetry_log = TelemetryLog(TELEMETRY_LOG_DIR)
+    restore_from_log()
+    atexit.register(telemetry_log.close)
+
+# Opt-in recorder of raw /update and /update/batch requests for replay.py (CAPTURE_DIR, or POST /capture).
+# With a shared store each worker records to its own subdirectory.
+CAPTURE_DIR = os.environ.get('CAPTURE_DIR')
+CAPTURE_SEGMENT_BYTES = int(os.environ.get('CAPTURE_SEGMENT_BYTES', 64 * 1024 * 1024))
+CAPTURE_MAX_SEGMENTS = int(os.environ.get('CAPTURE_MAX_SEGMENTS', 16))
+capture = None
+
+def start_capture(directory):
+    global capture
+    if capture is None:
+        if SHARED_STORE:
+            directory = os.path.join(directory, f"worker-{os.getpid()}")
+        capture = CaptureRecorder(directory, CAPTURE_SEGMENT_BYTES, CAPTURE_MAX_SEGMENTS)
+    return capture
+
+def stop_capture():
+    global capture
+    if capture is not None:
+        capture.close()
+        capture = None
+
+if CAPTURE_DIR:
+    start_capture(CAPTURE_DIR)
+atexit.register(stop_capture)
+
+# Side effects of ingest (logging, alert fan-out, persistence) run on worker threads;
+# the request thread only validates, stores the in-memory window and enqueues. Only log lines
+# are subject to the overflow policy: readings and alerts queue reliably (blocking when full)
+pipeline = IngestPipeline(
+    workers=int(os.environ.get('INGEST_WORKERS', 2)),
+    max_queue=int(os.environ.get('INGEST_QUEUE_SIZE', 10000)),
+    policy=os.environ.get('INGEST_OVERFLOW_POLICY', 'drop_oldest'),
+    spill_path=os.environ.get('INGEST_SPILL_PATH', os.path.join(DATA_DIR, 'ingest-spill.jsonl'))
+)
+
+# Outbound alert notification sinks (e.g. SMS/voice calls), called with each open, escalated and
+# resolved alert through a token bucket (NOTIFY_RATE/s, NOTIFY_BURST) with retries and backoff;
+# NOTIFY_WEBHOOK_URL adds a webhook sink. With a shared store the broker sends them.
+if SHARED_STORE:
+    notifications = shared_notifications
+else:
+    notifications = shared_store.notification_dispatcher()
+    atexit.register(notifications.close)
+
+def log_event(level, message, **fields):
+    """Queue a structured log line; filtered by level before anything is formatted"""
+    if logger.isEnabledFor(level):
+        pipeline.submit('log', (level, message, fields), key=fields.get('patient_id'))
+
+def write_log(payload):
+    level, message, fields = payload
+    logger.log(level, "%s %s", message, json.dumps(fields, default=str, ensure_ascii=False))
+
+def fan_out_reading(entry):
+    if not SHARED_STORE:
+        event_broker.publish('reading', entry)
+    if telemetry_log:
+        telemetry_log.append('reading', entry)
+
+def fan_out_alert(alert):
+    if not SHARED_STORE:
+        event_broker.publish('alert', alert)
+    if telemetry_log:
+        telemetry_log.append('alert', alert)
+    notifications.submit(alert)
+
+pipeline.register('log', write_log)
+pipeline.register('reading', fan_out_reading, reliable=True)
+pipeline.register('alert', fan_out_alert, reliable=True)
+# Events spilled by a previous run
+pipeline.replay_spill()
 
-def decode_data(enc_data):
-    """Decode Base64 data from ESP8266"""
+def relay_shared_events():
+    """Feed this worker's SSE clients, rollups and patient index with readings ingested by any worker"""
+    last_reading = last_alert = 0
+    while True:
+        try:
+            for entry in processed_health_data.query(since=last_reading):
+                index_reading(entry)
+                event_broker.publish('reading', entry)
+                last_reading = entry['seq']
+            for alert in critical_alerts.query(since=last_alert):
+                index_alert(alert)
+                event_broker.publish('alert', alert)
+                last_alert = alert['seq']
+        except (ConnectionError, EOFError, OSError) as e:
+            logger.warning("Shared store relay failed: %s", e)
+        time.sleep(SHARED_RELAY_INTERVAL)
+
+metrics.counter('buffer_evictions_total', 'Records evicted from the in-memory windows', ('store',), lambda: {
+    ('readings',): processed_health_data.evictions,
+    ('alerts',): critical_alerts.evictions,
+    ('raw',): received_data.evictions,
+})
+metrics.gauge('ingest_queue_depth', 'Events waiting for the side-effect workers',
+              lambda: {(): pipeline.metrics()['queue_depth']})
+metrics.counter('ingest_queue_dropped_total', 'Side-effect events dropped or spilled on a full queue', ('outcome',),
+                lambda: {('dropped',): pipeline.dropped, ('spilled',): pipeline.spilled})
+
+if SHARED_STORE:
+    threading.Thread(target=relay_shared_events, name='shared-store-relay', daemon=True).start()
+
+# Alert lifecycle: repeats of a rule for a patient join one incident, which escalates a severity level
+# every ALERT_ESCALATE_AFTER seconds and resolves after ALERT_RESOLVE_AFTER quiet seconds; only those
+# transitions are stored in critical_alerts and notified. With a shared store the broker's tracker is
+# used, so workers seeing the same condition share one incident.
+def store_alert(record):
+    critical_alerts.append(record)
+    if not SHARED_STORE:
+        index_alert(record)
+    pipeline.submit('alert', record, key=record['patient_id'])
+    log_event(logging.INFO if record['status'] == 'resolved' else logging.WARNING, "🚨 ALERT " + record['status'],
+              patient_id=record['patient_id'], rule=record['rule'], severity=record['severity'],
+              incident_id=record['incident_id'])
+
+if SHARED_STORE:
+    incidents = shared_incidents
+else:
+    incidents = IncidentTracker(store_alert,
+                                resolve_after=float(os.environ.get('ALERT_RESOLVE_AFTER', 60)),
+                                escalate_after=float(os.environ.get('ALERT_ESCALATE_AFTER', 120)))
+    incidents.start()
+metrics.gauge('alert_incidents_active', 'Open or ongoing alert incidents', lambda: {(): incidents.stats()['active']})
+metrics.counter('alert_transitions_total', 'Alert incident transitions', ('status',), lambda: {
+    (status,): value for status, value in incidents.stats()['transitions'].items()
+})
+metrics.counter('notifications_total', 'Alert notifications by outcome', ('outcome',), lambda: {
+    (outcome,): value for outcome, value in notifications.stats().items()
+    if outcome in ('delivered', 'retried', 'failed', 'dropped')
+})
+
+# Devices report every REPORT_INTERVAL seconds (firmware: delay(5000)); OFFLINE_AFTER_MISSED missed
+# reports in a row raise a DEVICE_OFFLINE alert, resolved when the device reports again or after
+# OFFLINE_RETIRE_AFTER seconds of silence (a decommissioned device). Devices are told apart by their
+# Basic Auth user (plus device_id for binary frames, or the patient for a login not bound to one, which
+# every unit of the fleet may share); anonymous readings are not tracked.
+# With a shared store the broker runs the detector.
+REPORT_INTERVAL = float(os.environ.get('REPORT_INTERVAL', 5))
+OFFLINE_AFTER_MISSED = int(os.environ.get('OFFLINE_AFTER_MISSED', 3))
+OFFLINE_RETIRE_AFTER = float(os.environ.get('OFFLINE_RETIRE_AFTER', 86400))
+
+def device_identity(auth_user, device_id=None, patient_id=None):
+    """Key a device is tracked by for offline detection; None when the reading cannot be attributed.
+
+    ``patient_id`` is given for logins not bound to a patient: units sharing one are told apart by it.
+    """
+    if device_id is not None:
+        return f"{auth_user}/{device_id}" if auth_user else f"device-{device_id}"
+    if auth_user and patient_id is not None:
+        return f"{auth_user}@{patient_id}"
+    return auth_user
+
+def raise_offline_alert(device, last_seen, patient_id, silence):
+    alerts_raised.inc('device_offline')
+    incidents.trigger(offline_alert(patient_id, last_seen, device, silence, int(silence // REPORT_INTERVAL)), sticky=True)
+
+def resolve_offline_alert(device, patient_id, offline_seconds):
+    incidents.resolve(patient_id, 'device_offline', f"Device reporting again after {offline_seconds:.0f}s offline",
+                      device)
+
+def retire_offline_device(device, patient_id, offline_seconds):
+    incidents.resolve(patient_id, 'device_offline',
+                      f"Device retired after {offline_seconds:.0f}s offline (no longer tracked)", device)
+
+offline_detector = None
+if OFFLINE_AFTER_MISSED > 0 and not SHARED_STORE:
+    offline_detector = OfflineDetector(raise_offline_alert, resolve_offline_alert, REPORT_INTERVAL, OFFLINE_AFTER_MISSED,
+                                       on_retire=retire_offline_device, retire_after=OFFLINE_RETIRE_AFTER)
+    offline_detector.start()
+    metrics.gauge('devices_offline', 'Devices that missed OFFLINE_AFTER_MISSED reports in a row',
+                  lambda: {(): offline_detector.stats()['offline']})
+
+# AES-128 keys used by the firmware's encryptData(), per device (Basic Auth user)
+key_ring = KeyRing(os.environ.get('AES_KEY', 'mysecretkey12345'))
+if not CRYPTO_AVAILABLE:
+    logger.warning("cryptography is not installed - AES payloads cannot be decrypted")
+
+def needs_decryption(payload):
+    """Plain JSON passes straight through; block-aligned binary is AES ciphertext"""
+    return bool(payload) and len(payload) % BLOCK_SIZE == 0 and not payload.lstrip().startswith(b'{')
+
+def decode_data(enc_data, device=None):
+    """Decode Base64 data from ESP8266, decrypting AES payloads with the device key"""
     try:
         # Try to decode as base64
         decoded_bytes = base64.b64decode(enc_data)
-        decoded_str = decoded_bytes.decode('utf-8', errors='ignore')
-        return decoded_str.strip()
     except Exception as e:
-        print(f"❌ Base64 decoding error: {e}")
+        decode_failures.inc('base64')
+        log_event(logging.WARNING, "❌ Base64 decoding error", error=str(e))
         # If base64 fails, maybe it's plain text
         return enc_data.strip()
+    if needs_decryption(decoded_bytes):
+        cipher = key_ring.get(device)
+        if cipher is not None:
+            decoded_bytes = cipher.decrypt(decoded_bytes)
+    return decoded_bytes.decode('utf-8', errors='ignore').strip()
+
+def decode_batch(items, device=None):
+    """Base64-decode a batch and decrypt all of its AES payloads in one call"""
+    payloads = []
+    for item in items:
+        try:
+            payloads.append(base64.b64decode(item))
+        except Exception:
+            payloads.append(None)
+    
+    cipher = key_ring.get(device)
+    encrypted = [index for index, payload in enumerate(payloads) if payload is not None and needs_decryption(payload)]
+    if cipher is not None and encrypted:
+        plaintexts = cipher.decrypt_many([payloads[index] for index in encrypted])
+        for index, plaintext in zip(encrypted, plaintexts):
+            payloads[index] = plaintext
+    
+    return [item.strip() if payload is None else payload.decode('utf-8', errors='ignore').strip()
+            for item, payload in zip(items, payloads)]
+
+# Device registry: verified Basic Auth credentials -> patient_id and AES key (DEVICE_REGISTRY='' disables)
+DEVICE_REGISTRY = os.environ.get('DEVICE_REGISTRY', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'devices.json'))
+device_registry = None
+if DEVICE_REGISTRY and os.path.exists(DEVICE_REGISTRY):
+    device_registry = DeviceRegistry.load(DEVICE_REGISTRY, cache_size=int(os.environ.get('AUTH_CACHE_SIZE', 10000)),
+                                          cache_ttl=float(os.environ.get('AUTH_CACHE_TTL', 300)))
+    for device in device_registry.devices.values():
+        if device.aes_key:
+            key_ring.set_key(device.username, device.aes_key)
+else:
+    logger.warning("no device registry - Basic Auth usernames are recorded but not verified")
+# With a registry, requests without credentials are rejected unless REQUIRE_DEVICE_AUTH=0; those
+# are then filed under ANONYMOUS_PATIENT_ID whatever patient_id their payload claims
+REQUIRE_DEVICE_AUTH = os.environ.get('REQUIRE_DEVICE_AUTH', '1' if device_registry else '0') == '1'
+ANONYMOUS_PATIENT_ID = 'Unknown'
+
+# Streaming anomaly rules (fall + HR > 100 is one of them), compiled once from RULES_CONFIG
+RULES_CONFIG = os.environ.get('RULES_CONFIG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json'))
+if SHARED_STORE:
+    # Per-patient rule state lives in the broker, which sees every worker's readings
+    rule_engine = shared_store.RemoteRuleEngine(
+        shared_rules, load_rule_specs(RULES_CONFIG) if os.path.exists(RULES_CONFIG) else DEFAULT_RULES)
+else:
+    rule_engine = RuleEngine(load_rule_specs(RULES_CONFIG) if os.path.exists(RULES_CONFIG) else None,
+                             budget_us=float(os.environ.get('RULE_BUDGET_US', 50)))
+
+# Retention sizes, rule thresholds (global, per cohort, per patient) and verbose logging can change without a
+# restart: RUNTIME_CONFIG is polled every RUNTIME_CONFIG_POLL seconds and /config updates it. The env values
+# above are the defaults. Changing it needs CONFIG_ADMIN_TOKEN (as a Bearer token); without one set
+# the settings are read-only over HTTP.
+RUNTIME_CONFIG = os.environ.get('RUNTIME_CONFIG', os.path.join(DATA_DIR, 'runtime_config.json'))
+CONFIG_ADMIN_TOKEN = os.environ.get('CONFIG_ADMIN_TOKEN')
+
+def apply_settings(settings, previous):
+    """Put a runtime config version into effect; a ValueError rejects it before anything changes"""
+    # Cohorts nobody is in yet are not compiled below, so their overrides are checked here
+    for name, cohort in settings.cohorts.items():
+        try:
+            apply_overrides(rule_engine.specs, cohort.get('thresholds', {}))
+        except ValueError as e:
+            raise ValueError(f"cohorts.{name}.thresholds: {e}")
+    if (settings.thresholds, settings.patient_thresholds) != (previous.thresholds, previous.patient_thresholds):
+        rule_engine.configure(settings.thresholds, settings.patient_thresholds)
+    new, old = settings.retention, previous.retention
+    for store, per_key, total in ((received_data, 'raw_per_device', 'raw_max_records'),
+                                  (processed_health_data, 'readings_per_patient', 'readings_max_records'),
+                                  (critical_alerts, 'alerts_per_patient', 'alerts_max_records')):
+        if new[per_key] != old[per_key] or new[total] != old[total]:
+            store.configure(new[per_key] if new[per_key] != old[per_key] else None,
+                            new[total] if new[total] != old[total] else None)
+    # NOTSET falls back to LOG_LEVEL; the level check in log_event() is cached by logging, so this costs nothing
+    logger.setLevel(logging.DEBUG if settings.verbose_logging else logging.NOTSET)
 
-def is_critical_condition(heart_rate, fall_detected):
-    """Check if condition is critical (both fall AND high heart rate)"""
-    return fall_detected == 1 and heart_rate > 100
+runtime_config = RuntimeConfig(RUNTIME_CONFIG, {
+    'raw_per_device': RAW_PER_DEVICE, 'raw_max_records': RAW_MAX_RECORDS,
+    'readings_per_patient': READINGS_PER_PATIENT, 'readings_max_records': READINGS_MAX_RECORDS,
+    'alerts_per_patient': ALERTS_PER_PATIENT, 'alerts_max_records': ALERTS_MAX_RECORDS
+}, apply_settings, poll_interval=float(os.environ.get('RUNTIME_CONFIG_POLL', 2)))
+runtime_config.start()
+atexit.register(runtime_config.stop)
+
+# Dashboards and other static files, precompressed in memory at startup (restart to pick up edits)
+STATIC_DIR = os.environ.get('STATIC_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static'))
+assets = AssetCache(STATIC_DIR)
+
+# JSON responses of at least JSON_GZIP_MIN_BYTES (and streamed ones) are gzipped (JSON_GZIP_LEVEL=0 disables)
+JSON_GZIP_MIN_BYTES = int(os.environ.get('JSON_GZIP_MIN_BYTES', 1024))
+JSON_GZIP_LEVEL = int(os.environ.get('JSON_GZIP_LEVEL', 1))
+
+def gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+@app.after_request
+def compress_json(response):
+    if (not JSON_GZIP_LEVEL or response.mimetype != 'application/json' or response.status_code != 200
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or parse_accept_encoding(request.headers.get('Accept-Encoding')).get('gzip', 0) <= 0):
+        return response
+    if response.is_streamed:
+        response.response = gzip_stream(response.iter_encoded(), JSON_GZIP_LEVEL)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < JSON_GZIP_MIN_BYTES:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=JSON_GZIP_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.before_request
+def start_request_timer():
+    request.started_at = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started_at = getattr(request, 'started_at', None)
+    if started_at is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_seconds.observe(time.perf_counter() - started_at, route, request.method, response.status_code)
+    return response
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics: per-stage ingest timings, failure/alert counters, request latency"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/profiler', methods=['GET', 'POST'])
+def sampling_profiler():
+    """Opt-in sampling profiler: POST action=start|stop|reset (admin token), GET returns collapsed stacks"""
+    if request.method == 'POST':
+        rejection = admin_rejection()
+        if rejection is not None:
+            return rejection
+        action = request.args.get('action', 'start')
+        if action == 'start':
+            try:
+                profiler.start(request.args.get('interval', type=float))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        elif action == 'stop':
+            profiler.stop()
+        elif action == 'reset':
+            profiler.reset()
+        else:
+            return jsonify({"error": "action must be start, stop or reset"}), 400
+        log_event(logging.INFO, "🔬 Profiler", action=action)
+        return jsonify({"running": profiler.running, "interval": profiler.interval, "samples": profiler.samples,
+                        "stacks_overflowed": profiler.overflowed})
+    return Response(profiler.collapsed(), mimetype='text/plain')
+
+@app.route('/capture', methods=['GET', 'POST'])
+def capture_control():
+    """Opt-in request capture for replay.py: POST action=start|stop (admin token), GET returns its stats"""
+    if request.method == 'POST':
+        rejection = admin_rejection()
+        if rejection is not None:
+            return rejection
+        action = request.args.get('action', 'start')
+        if action == 'start':
+            start_capture(CAPTURE_DIR or os.path.join(DATA_DIR, 'capture'))
+        elif action == 'stop':
+            stop_capture()
+        else:
+            return jsonify({"error": "action must be start or stop"}), 400
+        log_event(logging.INFO, "🎥 Capture", action=action)
+    return jsonify({"recording": capture is not None, "capture": capture.stats() if capture else None})
+
+def admin_rejection():
+    """None if the request carries the admin token, else the error response (403 when none is configured)"""
+    if not CONFIG_ADMIN_TOKEN:
+        return jsonify({"error": "admin endpoints are disabled; set CONFIG_ADMIN_TOKEN to enable them"}), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {CONFIG_ADMIN_TOKEN}"):
+        return jsonify({"error": "admin token required"}), 401, {'WWW-Authenticate': 'Bearer'}
+    return None
+
+@app.route('/config', methods=['GET', 'PATCH'])
+def runtime_settings():
+    """Current runtime config; PATCH merges a JSON object into it (null removes a key) and saves it"""
+    if request.method == 'PATCH':
+        rejection = admin_rejection()
+        if rejection is not None:
+            return rejection
+        changes = request.get_json(silent=True)
+        if not isinstance(changes, dict):
+            return jsonify({"error": "body must be a JSON object"}), 400
+        try:
+            runtime_config.update(changes)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        log_event(logging.INFO, "⚙️ Runtime config updated", version=runtime_config.current.version,
+                  changes=changes)
+    return jsonify({"settings": runtime_config.current.to_dict(), "config": runtime_config.stats()})
+
+@app.route('/config/reload', methods=['POST'])
+def reload_runtime_settings():
+    """Re-read RUNTIME_CONFIG now instead of at the next poll"""
+    rejection = admin_rejection()
+    if rejection is not None:
+        return rejection
+    try:
+        runtime_config.reload()
+    except ValueError as e:
+        return jsonify({"error": str(e), "config": runtime_config.stats()}), 400
+    return jsonify({"settings": runtime_config.current.to_dict(), "config": runtime_config.stats()})
 
 @app.route('/test', methods=['GET'])
 def test():
@@ -34,528 +537,587 @@ def test():
         "server_ip": request.host,
         "total_messages": len(received_data),
         "health_data": len(processed_health_data),
-        "critical_alerts": len(critical_alerts)
+        "critical_alerts": len(critical_alerts),
+        "patients": len(processed_health_data.keys()),
+        "buffer_evictions": processed_health_data.evictions + critical_alerts.evictions + received_data.evictions,
+        "storage": telemetry_log.stats() if telemetry_log else None,
+        "pipeline": pipeline.metrics(),
+        "rules": rule_engine.stats(),
+        "devices": device_registry.stats() if device_registry else None,
+        "heartbeats": offline_detector.stats() if offline_detector else None,
+        "incidents": incidents.stats(),
+        "notifications": notifications.stats(),
+        "static_assets": assets.stats(),
+        "runtime_config": runtime_config.stats(),
+        "stream": {"clients": event_broker.subscriber_count, "max_clients": STREAM_MAX_CLIENTS,
+                   "refused": event_broker.rejected}
     })
 
-@app.route('/update', methods=['POST'])
-def update():
-    current_time = datetime.datetime.now()
-    
-    print(f"\n=== DATA RECEIVED ===")
-    print(f"Time: {current_time}")
-    print(f"Headers: {dict(request.headers)}")
-    
-    # Get raw data
-    raw_data = request.data.decode('utf-8', errors='ignore')
-    print(f"Raw Data: {raw_data}")
-    print(f"Raw Data Length: {len(raw_data)}")
+def get_auth_user(auth_header):
+    """Return the Basic Auth username sent by the ESP8266, if any (no registry: unverified)"""
+    if not auth_header or not auth_header.startswith("Basic "):
+        return None
+    try:
+        auth_decoded = base64.b64decode(auth_header.split(" ")[1]).decode()
+        username, password = auth_decoded.split(":", 1)
+        log_event(logging.DEBUG, "👤 Auth user", user=username)
+        return username
+    except:
+        return "decode_failed"
+
+def authenticate_device(auth_header, remote_addr=None):
+    """Resolve a request's device as (auth_user, patient_id, rejection), rejection being (body, 401, headers)"""
+    if device_registry is None:
+        return get_auth_user(auth_header), None, None
+    if auth_header is None and not REQUIRE_DEVICE_AUTH:
+        # Accepted, but nothing vouches for a patient_id in the payload
+        return None, ANONYMOUS_PATIENT_ID, None
+    device, reason = device_registry.authenticate(auth_header)
+    if device is None:
+        auth_failures.inc(reason)
+        log_event(logging.WARNING, "🔒 Rejected device credentials", reason=reason, remote=remote_addr)
+        return None, None, ({"status": "unauthorized", "error": reason}, 401,
+                            {'WWW-Authenticate': 'Basic realm="health-monitor"'})
+    return device.username, device.patient_id, None
+
+def record_reading(current_time, patient_id, heart_rate, fall_detected, data, data_info, extra=None, bound=True):
+    """Run the rules on a parsed reading, store it and raise its alerts, filling in data_info.
+
+    ``bound`` is False when the patient comes from the payload rather than from the device's login.
+    """
+    checked = time.perf_counter()
+    fired = rule_engine.evaluate(patient_id, heart_rate, fall_detected, current_time.timestamp())
+    critical = bool(fired)
+    started = time.perf_counter()
+    stage_seconds.observe(started - checked, 'rule_check')
     
-    # Store raw data info
-    data_info = {
-        "timestamp": current_time.isoformat(),
-        "headers": dict(request.headers),
-        "raw_data": raw_data,
-        "data_length": len(request.data),
-        "content_type": request.headers.get('Content-Type', 'unknown')
+    # Store all health data (for logging purposes)
+    processed_entry = {
+        'timestamp': current_time.isoformat(),
+        'heart_rate': heart_rate,
+        'fall': fall_detected,
+        'patient_id': patient_id,
+        'data': data,
+        'is_critical': critical,
+        'triggered_rules': [rule.name for rule in fired],
+        'device': device_identity(data_info.get("auth_user"), extra.get('device_id') if extra else None,
+                                  None if bound else patient_id)
     }
+    if extra:
+        processed_entry.update(extra)
     
-    # Check if it's Basic Auth from ESP8266
-    auth_header = request.headers.get("Authorization", "")
-    if auth_header.startswith("Basic "):
-        try:
-            auth_decoded = base64.b64decode(auth_header.split(" ")[1]).decode()
-            username, password = auth_decoded.split(":", 1)
-            data_info["auth_user"] = username
-            print(f"👤 Auth User: {username}")
-        except:
-            data_info["auth_user"] = "decode_failed"
+    processed_health_data.append(processed_entry)
+    if not SHARED_STORE:
+        index_reading(processed_entry)
+        if offline_detector is not None and processed_entry['device'] is not None:
+            offline_detector.heartbeat(processed_entry['device'], patient_id)
+    pipeline.submit('reading', processed_entry, key=patient_id)
+    readings_accepted.inc()
     
-    # Try to decode the data
-    decoded_json = decode_data(raw_data)
+    # One alert per rule that fired (e.g. Fall + High HR); repeats join the open incident
+    for rule in fired:
+        critical_alert = {
+            'timestamp': current_time.isoformat(),
+            'heart_rate': heart_rate,
+            'fall': fall_detected,
+            'patient_id': patient_id,
+            'rule': rule.name,
+            'alert_type': rule.alert_type,
+            'severity': rule.severity,
+            'message': rule.describe(heart_rate, fall_detected)
+        }
+        
+        incidents.trigger(critical_alert)
+        alerts_raised.inc(rule.name)
+    if not fired:
+        log_event(logging.INFO, "💓 Reading", patient_id=patient_id,
+                  heart_rate=heart_rate, fall=fall_detected)
+
+    stage_seconds.observe(time.perf_counter() - started, 'storage_append')
+    data_info["parsed_heart_rate"] = heart_rate
+    data_info["parsed_fall"] = fall_detected
+    data_info["parsed_patient_id"] = patient_id
+    data_info["parsing_success"] = True
+    data_info["is_critical"] = critical
+
+def process_reading(raw_data, current_time, data_info, decoded_json=None, device_patient_id=None):
+    """Decode, parse and store a single reading, filling in data_info.
+
+    A patient bound to the authenticated device takes precedence over one in the payload.
+    """
+    if decoded_json is None:
+        started = time.perf_counter()
+        decoded_json = decode_data(raw_data, data_info.get("auth_user"))
+        stage_seconds.observe(time.perf_counter() - started, 'decode_data')
     
     if decoded_json:
-        print(f"✅ Decoded Data: {decoded_json}")
+        log_event(logging.DEBUG, "✅ Decoded data", decoded=decoded_json)
         data_info["decoded"] = decoded_json
         
         # Try to parse as JSON
         try:
+            started = time.perf_counter()
             health_data = json.loads(decoded_json)
             heart_rate = health_data.get('heart_rate', 0)
             fall_detected = health_data.get('fall', 0)
-            patient_id = health_data.get('patient_id', 'Unknown')
-            
-            print(f"💓 Heart Rate: {heart_rate} BPM")
-            print(f"🚨 Fall Detected: {'Yes' if fall_detected else 'No'}")
-            print(f"👤 Patient ID: {patient_id}")
-            
-            # Store all health data (for logging purposes)
-            processed_entry = {
-                'timestamp': current_time.isoformat(),
-                'heart_rate': heart_rate,
-                'fall': fall_detected,
-                'patient_id': patient_id,
-                'data': decoded_json,
-                'is_critical': is_critical_condition(heart_rate, fall_detected)
-            }
-            
-            processed_health_data.append(processed_entry)
+            patient_id = device_patient_id or health_data.get('patient_id', 'Unknown')
+            stage_seconds.observe(time.perf_counter() - started, 'json_loads')
+            record_reading(current_time, patient_id, heart_rate, fall_detected, decoded_json, data_info,
+                           bound=device_patient_id is not None)
             
-            # Check if this is a CRITICAL condition (Fall + High HR)
-            if is_critical_condition(heart_rate, fall_detected):
-                print(f"🚨🚨🚨 CRITICAL ALERT: Fall + High HR ({heart_rate} BPM) 🚨🚨🚨")
-                
-                critical_alert = {
-                    'timestamp': current_time.isoformat(),
-                    'heart_rate': heart_rate,
-                    'fall': fall_detected,
-                    'patient_id': patient_id,
-                    'alert_type': 'CRITICAL',
-                    'severity': 'HIGH',
-                    'message': f'Fall detected with elevated heart rate ({heart_rate} BPM)'
-                }
-                
-                critical_alerts.append(critical_alert)
-                
-                # Keep only last 50 critical alerts
-                if len(critical_alerts) > 50:
-                    critical_alerts.pop(0)
-            else:
-                print(f"ℹ️ Normal condition - not critical (Fall: {fall_detected}, HR: {heart_rate})")
-            
-            # Keep only last 100 health readings
-            if len(processed_health_data) > 100:
-                processed_health_data.pop(0)
-                
-            data_info["parsed_heart_rate"] = heart_rate
-            data_info["parsed_fall"] = fall_detected
-            data_info["parsed_patient_id"] = patient_id
-            data_info["parsing_success"] = True
-            data_info["is_critical"] = is_critical_condition(heart_rate, fall_detected)
-            
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON parsing error: {e}")
-            print(f"❌ Failed to parse: '{decoded_json}'")
+        except (json.JSONDecodeError, AttributeError, TypeError) as e:
+            parse_failures.inc({json.JSONDecodeError: 'invalid_json', AttributeError: 'not_an_object'}.get(type(e), 'bad_field_type'))
+            log_event(logging.WARNING, "❌ JSON parsing error", error=str(e), decoded=decoded_json)
             data_info["json_error"] = str(e)
             data_info["parsing_success"] = False
     else:
-        print("❌ Failed to decode data")
+        decode_failures.inc('empty')
+        log_event(logging.WARNING, "❌ Failed to decode data", raw_data=raw_data)
         data_info["decoding_failed"] = True
         data_info["parsing_success"] = False
     
     # Store raw data
     received_data.append(data_info)
     
-    # Keep only last 50 raw messages
-    if len(received_data) > 50:
-        received_data.pop(0)
+    return data_info
+
+def process_frames(body, frame_spec, current_time, data_info, device_patient_id=None):
+    """Decrypt and unpack binary reading frames (wire.py) and store each reading"""
+    frame, encrypted = frame_spec
+    if encrypted:
+        started = time.perf_counter()
+        cipher = key_ring.get(data_info.get("auth_user"))
+        body = cipher.decrypt(body, text=False) if cipher is not None else None
+        stage_seconds.observe(time.perf_counter() - started, 'decode_data')
+        if body is None:
+            decode_failures.inc('aes')
+    try:
+        started = time.perf_counter()
+        frames = list(iter_frames(body, frame))
+        stage_seconds.observe(time.perf_counter() - started, 'frame_unpack')
+    except FrameError as e:
+        parse_failures.inc('bad_frame')
+        log_event(logging.WARNING, "❌ Binary frame error", error=str(e))
+        data_info["frame_error"] = str(e)
+        data_info["parsing_success"] = False
+        received_data.append(data_info)
+        return 0
+    
+    critical = False
+    for device_id, seq, device_time, heart_rate, fall_detected, accel_magnitude in frames:
+        record_reading(current_time, device_patient_id or f"device-{device_id}", heart_rate, fall_detected,
+                       f'{{"heart_rate":{heart_rate},"fall":{fall_detected}}}', data_info,
+                       {'device_id': device_id, 'device_seq': seq, 'device_time': device_time,
+                        'accel_magnitude': round(accel_magnitude, 3)})
+        critical = critical or data_info["is_critical"]
+    data_info["is_critical"] = critical
+    data_info["frames"] = len(frames)
+    received_data.append(data_info)
+    return len(frames)
+
+def json_stream(records):
+    """Stream records as a JSON array without building the full list"""
+    def generate():
+        yield '['
+        first = True
+        for record in records:
+            yield ('' if first else ',') + json.dumps(record)
+            first = False
+        yield ']'
+    return Response(generate(), mimetype='application/json')
+
+def split_batch(raw_data):
+    """Split a batch body into individual encoded readings.
+
+    Accepts either a JSON array of strings or newline-delimited readings.
+    """
+    stripped = raw_data.strip()
+    if stripped.startswith('['):
+        try:
+            items = json.loads(stripped)
+            if isinstance(items, list):
+                return [str(item) for item in items]
+        except json.JSONDecodeError:
+            pass
+    return [line for line in stripped.splitlines() if line.strip()]
+
+def ingest_update(body, headers, remote_addr=None, current_time=None):
+    """/update independent of the HTTP front end (Flask or async_ingest.py): returns (body, status, headers).
+
+    ``current_time`` overrides the receive time (replay.py uses the captured one).
+    """
+    current_time = current_time or datetime.datetime.now()
+    started = time.perf_counter()
+    recorder = capture
+    if recorder is not None:
+        recorder.record('/update', headers.get('Authorization'), headers.get('Content-Type'), body)
+    
+    # Binary frames (Content-Type selects the layout) skip base64, UTF-8 and JSON entirely
+    frame_spec = frame_format(headers.get('Content-Type'))
+    if frame_spec is not None:
+        return ingest_frames(body, headers, remote_addr, frame_spec, current_time, started)
     
-    print(f"📊 Total stored messages: {len(received_data)}")
-    print(f"💊 Total health data: {len(processed_health_data)}")
-    print(f"🚨 Critical alerts: {len(critical_alerts)}")
-    print(f"===================\n")
+    # Get raw data
+    raw_data = body.decode('utf-8', errors='ignore')
+    log_event(logging.DEBUG, "=== DATA RECEIVED ===", headers=dict(headers),
+              raw_data=raw_data, data_length=len(raw_data))
     
-    return jsonify({
+    # Store raw data info
+    data_info = {
+        "timestamp": current_time.isoformat(),
+        "headers": dict(headers),
+        "raw_data": raw_data,
+        "data_length": len(body),
+        "content_type": headers.get('Content-Type', 'unknown')
+    }
+    
+    # Check if it's Basic Auth from ESP8266
+    auth_started = time.perf_counter()
+    auth_user, device_patient_id, rejection = authenticate_device(headers.get("Authorization"), remote_addr)
+    stage_seconds.observe(time.perf_counter() - auth_started, 'auth_decode')
+    if rejection is not None:
+        return rejection
+    if auth_user is not None:
+        data_info["auth_user"] = auth_user
+    
+    process_reading(raw_data, current_time, data_info, device_patient_id=device_patient_id)
+    elapsed = time.perf_counter() - started
+    
+    return {
         "status": "received", 
-        "message_count": len(received_data),
-        "health_data_count": len(processed_health_data),
-        "critical_alerts_count": len(critical_alerts),
-        "decoding_successful": decoded_json is not None and data_info.get("parsing_success", False),
-        "is_critical": data_info.get("is_critical", False)
-    }), 200
+        "message_count": received_data.size_hint(),
+        "health_data_count": processed_health_data.size_hint(),
+        "critical_alerts_count": critical_alerts.size_hint(),
+        "decoding_successful": data_info.get("parsing_success", False),
+        "is_critical": data_info.get("is_critical", False),
+        "processing_time_ms": round(elapsed * 1000, 3)
+    }, 200, {}
+
+def ingest_frames(body, headers, remote_addr, frame_spec, current_time, started):
+    """/update for binary bodies: one or more fixed-layout frames"""
+    data_info = {
+        "timestamp": current_time.isoformat(),
+        "data_length": len(body),
+        "content_type": headers.get('Content-Type')
+    }
+    auth_started = time.perf_counter()
+    auth_user, device_patient_id, rejection = authenticate_device(headers.get("Authorization"), remote_addr)
+    stage_seconds.observe(time.perf_counter() - auth_started, 'auth_decode')
+    if rejection is not None:
+        return rejection
+    if auth_user is not None:
+        data_info["auth_user"] = auth_user
+    
+    readings = process_frames(body, frame_spec, current_time, data_info, device_patient_id)
+    elapsed = time.perf_counter() - started
+    
+    return {
+        "status": "received" if readings else "rejected",
+        "readings": readings,
+        "health_data_count": processed_health_data.size_hint(),
+        "critical_alerts_count": critical_alerts.size_hint(),
+        "decoding_successful": data_info.get("parsing_success", False),
+        "is_critical": data_info.get("is_critical", False),
+        "processing_time_ms": round(elapsed * 1000, 3)
+    }, 200 if readings else 400, {}
+
+def ingest_batch(body, headers, remote_addr=None, current_time=None):
+    """/update/batch independent of the HTTP front end: returns (body, status, headers)"""
+    current_time = current_time or datetime.datetime.now()
+    started = time.perf_counter()
+    recorder = capture
+    if recorder is not None:
+        recorder.record('/update/batch', headers.get('Authorization'), headers.get('Content-Type'), body)
+    
+    raw_data = body.decode('utf-8', errors='ignore')
+    items = split_batch(raw_data)
+    
+    auth_user, device_patient_id, rejection = authenticate_device(headers.get("Authorization"), remote_addr)
+    if rejection is not None:
+        return rejection
+    content_type = headers.get('Content-Type', 'unknown')
+    
+    decoded_items = decode_batch(items, auth_user)
+    
+    results = []
+    for index, item in enumerate(items):
+        data_info = {
+            "timestamp": current_time.isoformat(),
+            "raw_data": item,
+            "data_length": len(item),
+            "content_type": content_type,
+            "batch_index": index
+        }
+        if auth_user is not None:
+            data_info["auth_user"] = auth_user
+        process_reading(item, current_time, data_info, decoded_items[index], device_patient_id)
+        results.append({
+            "index": index,
+            "status": "accepted" if data_info.get("parsing_success") else "rejected",
+            "is_critical": data_info.get("is_critical", False),
+            "error": data_info.get("json_error") or ("decoding_failed" if data_info.get("decoding_failed") else None)
+        })
+    
+    elapsed = time.perf_counter() - started
+    accepted = sum(1 for result in results if result["status"] == "accepted")
+    log_event(logging.INFO, "📦 Batch processed", batch_size=len(items), accepted=accepted,
+              elapsed_ms=round(elapsed * 1000, 3))
+    
+    return {
+        "status": "received",
+        "batch_size": len(items),
+        "accepted": accepted,
+        "rejected": len(items) - accepted,
+        "results": results,
+        "health_data_count": processed_health_data.size_hint(),
+        "critical_alerts_count": critical_alerts.size_hint(),
+        "processing_time_ms": round(elapsed * 1000, 3),
+        "readings_per_second": round(len(items) / elapsed, 1) if elapsed > 0 else None
+    }, 200, {}
+
+@app.route('/update', methods=['POST'])
+def update():
+    body, status, headers = ingest_update(request.get_data(), request.headers, request.remote_addr)
+    return jsonify(body), status, headers
+
+@app.route('/update/batch', methods=['POST'])
+def update_batch():
+    """Ingest many readings from one request (JSON array or newline-delimited)"""
+    body, status, headers = ingest_batch(request.get_data(), request.headers, request.remote_addr)
+    return jsonify(body), status, headers
+
+def query_store(data_store):
+    """Answer a delta query (since/patient_id/limit/start/end) with ETag support"""
+    since = request.args.get('since', type=int)
+    limit = request.args.get('limit', type=int)
+    patient_id = request.args.get('patient_id')
+    if limit is not None and limit < 0:
+        return jsonify({"error": "limit must be zero or more"}), 400
+    try:
+        start, end = history_range()
+    except ValueError:
+        return jsonify({"error": "start/end must be epoch seconds or ISO timestamps"}), 400
+    
+    # Contents only change on append/eviction, so the store version plus the query identifies the response
+    etag = f'W/"{data_store.version}-{zlib.crc32(request.query_string):x}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers={'ETag': etag})
+    
+    # Read before the query: every record up to it was considered, so polling from it loses nothing
+    last_seq = data_store.last_seq
+    records = list(data_store.query(patient_id, since, limit, start, end))
+    response = json_stream(records)
+    response.headers['ETag'] = etag
+    # The last seq in this response, so a client paging with since/limit resumes right after it
+    response.headers['X-Last-Seq'] = str(records[-1]['seq'] if records else max(last_seq, since or 0))
+    return response
 
 @app.route('/data')
 def get_data():
     """API endpoint to get ALL health data for debugging"""
-    print(f"📊 All data requested - returning {len(processed_health_data)} records")
-    return jsonify(processed_health_data)
+    log_event(logging.DEBUG, "📊 All data requested", stored=processed_health_data.size_hint())
+    return query_store(processed_health_data)
 
 @app.route('/critical-alerts')
 def get_critical_alerts():
     """API endpoint to get ONLY critical alerts for UI"""
-    print(f"🚨 Critical alerts requested - returning {len(critical_alerts)} critical alerts")
-    return jsonify(critical_alerts)
+    log_event(logging.DEBUG, "🚨 Critical alerts requested", stored=critical_alerts.size_hint())
+    return query_store(critical_alerts)
+
+def parse_time_arg(name):
+    """Read a query parameter given as epoch seconds or an ISO timestamp"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+def history_records(patient_id=None, start=None, end=None):
+    """Readings for bulk export and analytics, oldest first.
+
+    Reads the whole telemetry log when there is one (in shared-store mode the
+    broker's, read-only), otherwise the in-memory window.
+    """
+    if TELEMETRY_LOG_DIR and os.path.isdir(TELEMETRY_LOG_DIR):
+        # Only frames mentioning the patient are parsed
+        needle = f'"patient_id":{json.dumps(patient_id)}'.encode('utf-8') if patient_id else None
+        records = (record for _, record in read_segments(list_segments(TELEMETRY_LOG_DIR), ('reading',), needle))
+        if patient_id:
+            records = (record for record in records if record['patient_id'] == patient_id)
+    else:
+        records = processed_health_data.iter_records(patient_id)
+    if start is not None or end is not None:
+        records = (record for record in records
+                   if (start is None or record['timestamp'] >= start)
+                   and (end is None or record['timestamp'] <= end))
+    return records
+
+def history_range():
+    """start/end query parameters (epoch seconds or ISO) as ISO timestamps comparable with stored ones"""
+    start = parse_time_arg('start')
+    end = parse_time_arg('end')
+    return (datetime.datetime.fromtimestamp(start).isoformat() if start is not None else None,
+            datetime.datetime.fromtimestamp(end).isoformat() if end is not None else None)
+
+@app.route('/export')
+def export_readings():
+    """Stream a patient/time-range selection of stored readings as Arrow IPC, Parquet or CSV"""
+    fmt = request.args.get('format', available_formats()[0])
+    if fmt not in available_formats():
+        hint = " (Arrow and Parquet need pyarrow)" if fmt in MIMETYPES else ""
+        return jsonify({"error": f"format must be one of: {', '.join(available_formats())}{hint}"}), 400
+    try:
+        start, end = history_range()
+    except ValueError:
+        return jsonify({"error": "start/end must be epoch seconds or ISO timestamps"}), 400
+    chunk_rows = min(max(request.args.get('chunk_rows', DEFAULT_CHUNK_ROWS, type=int), 1), 100000)
+    patient_id = request.args.get('patient_id')
+    log_event(logging.INFO, "📦 Export requested", format=fmt, patient_id=patient_id, start=start, end=end)
+    filename = f"readings-{patient_id or 'all'}.{EXTENSIONS[fmt]}"
+    return Response(stream_export(history_records(patient_id, start, end), fmt, chunk_rows),
+                    mimetype=MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/analytics/daily')
+def daily_analytics():
+    """Heart-rate percentiles, fall and critical counts per patient per day over the stored history"""
+    try:
+        start, end = history_range()
+        percentiles = [float(q) for q in request.args.get('percentiles', '50,90,99').split(',')]
+        if not all(0 <= q <= 100 for q in percentiles):
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "start/end must be epoch seconds or ISO timestamps, percentiles numbers in 0-100"}), 400
+    started = time.perf_counter()
+    rows = daily_aggregates(column_chunks(history_records(request.args.get('patient_id'), start, end)), percentiles)
+    return jsonify({
+        "days": rows,
+        "readings": sum(row['readings'] for row in rows),
+        "query_time_ms": round((time.perf_counter() - started) * 1000, 1)
+    })
+
+@app.route('/alerts/active')
+def get_active_alerts():
+    """Open and ongoing alert incidents, most severe first"""
+    return jsonify(incidents.active())
+
+@app.route('/patients')
+def get_patients():
+    """Patient roster from the live index: sort, status filter and cursor pagination"""
+    sort = request.args.get('sort', 'severity')
+    status = request.args.get('status')
+    if status not in (None, 'critical', 'normal'):
+        return jsonify({"error": "status must be critical or normal"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        items, next_cursor, summary = patient_index.roster(time.time(), sort, status, request.args.get('cursor'), limit)
+    except ValueError as e:
+        return jsonify({"error": str(e), "sort_orders": SORT_ORDERS}), 400
+    return jsonify({"patients": items, "next_cursor": next_cursor, "summary": summary})
+
+@app.route('/patients/<patient_id>/series')
+def get_patient_series(patient_id):
+    """Bounded heart-rate series for charts: rollup buckets or LTTB-downsampled raw readings"""
+    resolution = request.args.get('resolution', 'raw')
+    # LTTB keeps both end points plus one per bucket, so fewer than 3 points is not a downsampling
+    max_points = max(3, min(request.args.get('points', SERIES_MAX_POINTS, type=int), SERIES_MAX_POINTS))
+    try:
+        start = parse_time_arg('start')
+        end = parse_time_arg('end')
+    except ValueError:
+        return jsonify({"error": "start/end must be epoch seconds or ISO timestamps"}), 400
+    
+    if resolution == 'raw':
+        points = []
+        for record in processed_health_data.iter_records(patient_id):
+            epoch = datetime.datetime.fromisoformat(record['timestamp']).timestamp()
+            if (start is None or epoch >= start) and (end is None or epoch < end):
+                points.append({
+                    'x': epoch,
+                    'y': record['heart_rate'],
+                    'timestamp': record['timestamp'],
+                    'fall': record['fall'],
+                    'is_critical': record['is_critical']
+                })
+        points = lttb(points, max_points)
+    elif resolution in RESOLUTIONS:
+        points = rollups.series(patient_id, resolution, start, end, max_points)
+    else:
+        return jsonify({"error": f"resolution must be one of: raw, {', '.join(RESOLUTIONS)}"}), 400
+    
+    return jsonify({
+        "patient_id": patient_id,
+        "resolution": resolution,
+        "points": points
+    })
+
+@app.route('/stream')
+def stream():
+    """Server-Sent Events stream of new readings and critical alerts"""
+    patient_id = request.args.get('patient_id')
+    types = request.args.get('types')
+    event_types = set(types.split(',')) if types else None
+    
+    # Resume after a reconnect from Last-Event-ID (sent by EventSource) or ?since=
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    subscription, missed, gap = event_broker.subscribe(patient_id, event_types, last_event_id)
+    if subscription is None:
+        log_event(logging.WARNING, "📡 Stream client refused", active=event_broker.subscriber_count)
+        return jsonify({"error": "too many stream clients, retry later"}), 503, {'Retry-After': '10'}
+    log_event(logging.INFO, "📡 Stream client connected", active=event_broker.subscriber_count)
+    return Response(
+        sse_events(event_broker, subscription, missed, gap),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/raw-data')
 def get_raw_data():
     """API endpoint to get raw received data"""
-    return jsonify(received_data)
+    return json_stream(received_data.iter_records())
+
+def serve_asset(name):
+    """A cached static asset in the best encoding the client accepts, or 304 if its copy is current"""
+    asset, immutable = assets.get(name)
+    if asset is None:
+        return jsonify({"error": "not found"}), 404
+    coding, body, etag = asset.select(request.headers.get('Accept-Encoding'))
+    headers = {'ETag': etag, 'Cache-Control': IMMUTABLE if immutable else REVALIDATE, 'Vary': 'Accept-Encoding'}
+    if coding != 'identity':
+        headers['Content-Encoding'] = coding
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype=asset.mimetype, headers=headers)
 
 @app.route('/static/<path:filename>')
 def static_files(filename):
     """Serve static files (your HTML dashboards)"""
-    return send_from_directory('static', filename)
+    return serve_asset(filename)
 
 @app.route('/medical')
 def medical_dashboard():
     """Medical Dashboard route - redirect to static file"""
-    return send_from_directory('static', 'medical_dashboard.html')
+    return serve_asset('medical_dashboard.html')
 
 @app.route('/')
 def dashboard():
     """Main dashboard route - ONLY shows critical alerts"""
-    dashboard_html = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>ESP8266 Critical Health Alerts</title>
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <style>
-            * {
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }
-            
-            body {
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                background: linear-gradient(135deg, #dc3545 0%, #c82333 100%);
-                min-height: 100vh;
-                padding: 20px;
-            }
-            
-            .container {
-                max-width: 1200px;
-                margin: 0 auto;
-            }
-            
-            .header {
-                background: white;
-                padding: 20px;
-                border-radius: 10px;
-                box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                margin-bottom: 20px;
-                text-align: center;
-            }
-            
-            .header h1 {
-                color: #dc3545;
-                margin-bottom: 10px;
-            }
-            
-            .critical-notice {
-                background: #f8d7da;
-                color: #721c24;
-                padding: 15px;
-                border-radius: 8px;
-                margin: 15px 0;
-                border: 1px solid #f5c6cb;
-                font-weight: bold;
-            }
-            
-            .nav-links {
-                margin-top: 15px;
-                display: flex;
-                gap: 10px;
-                justify-content: center;
-                flex-wrap: wrap;
-            }
-            
-            .nav-link {
-                background: #dc3545;
-                color: white;
-                padding: 10px 20px;
-                text-decoration: none;
-                border-radius: 5px;
-                transition: background 0.3s;
-            }
-            
-            .nav-link:hover {
-                background: #c82333;
-                text-decoration: none;
-                color: white;
-            }
-            
-            .stats {
-                display: grid;
-                grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-                gap: 15px;
-                margin-bottom: 20px;
-            }
-            
-            .stat-card {
-                background: white;
-                padding: 20px;
-                border-radius: 10px;
-                box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                text-align: center;
-            }
-            
-            .stat-number {
-                font-size: 2em;
-                font-weight: bold;
-                color: #dc3545;
-            }
-            
-            .stat-label {
-                color: #666;
-                margin-top: 5px;
-            }
-            
-            .status-indicator {
-                width: 12px;
-                height: 12px;
-                border-radius: 50%;
-                display: inline-block;
-                margin-right: 8px;
-                animation: pulse 1s infinite;
-            }
-            
-            .status-critical { background: #dc3545; }
-            .status-normal { background: #28a745; }
-            .status-warning { background: #ffc107; }
-            
-            @keyframes pulse {
-                0% { opacity: 1; transform: scale(1); }
-                50% { opacity: 0.7; transform: scale(1.1); }
-                100% { opacity: 1; transform: scale(1); }
-            }
-            
-            .alerts-section {
-                background: white;
-                border-radius: 10px;
-                box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                overflow: hidden;
-                margin-bottom: 20px;
-            }
-            
-            .section-header {
-                background: #dc3545;
-                color: white;
-                padding: 15px 20px;
-                font-weight: bold;
-                display: flex;
-                align-items: center;
-                gap: 10px;
-            }
-            
-            .alerts-content {
-                padding: 20px;
-                max-height: 500px;
-                overflow-y: auto;
-            }
-            
-            .critical-alert {
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                padding: 20px;
-                margin: 15px 0;
-                background: linear-gradient(135deg, #fff5f5 0%, #ffeaea 100%);
-                border-radius: 10px;
-                border-left: 5px solid #dc3545;
-                box-shadow: 0 2px 4px rgba(220, 53, 69, 0.2);
-                animation: alertPulse 2s infinite;
-            }
-            
-            @keyframes alertPulse {
-                0% { box-shadow: 0 2px 4px rgba(220, 53, 69, 0.2); }
-                50% { box-shadow: 0 4px 8px rgba(220, 53, 69, 0.4); }
-                100% { box-shadow: 0 2px 4px rgba(220, 53, 69, 0.2); }
-            }
-            
-            .alert-info {
-                flex: 1;
-            }
-            
-            .alert-title {
-                font-size: 1.3em;
-                font-weight: bold;
-                color: #dc3545;
-                margin-bottom: 8px;
-            }
-            
-            .alert-details {
-                font-size: 1.1em;
-                color: #333;
-                margin-bottom: 5px;
-            }
-            
-            .alert-patient {
-                font-size: 0.95em;
-                color: #666;
-                margin-bottom: 5px;
-            }
-            
-            .alert-timestamp {
-                font-size: 0.9em;
-                color: #666;
-            }
-            
-            .alert-badge {
-                background: #dc3545;
-                color: white;
-                padding: 8px 15px;
-                border-radius: 20px;
-                font-weight: bold;
-                font-size: 0.95em;
-                animation: blink 1s infinite;
-            }
-            
-            @keyframes blink {
-                0%, 50% { opacity: 1; }
-                51%, 100% { opacity: 0.8; }
-            }
-            
-            .no-alerts {
-                text-align: center;
-                color: #28a745;
-                font-size: 1.2em;
-                font-weight: bold;
-                padding: 60px 20px;
-                background: #d4edda;
-                border-radius: 10px;
-                border: 2px solid #c3e6cb;
-            }
-            
-            .system-status {
-                background: white;
-                padding: 15px 20px;
-                border-radius: 10px;
-                box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                margin-bottom: 20px;
-                text-align: center;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>🚨 Critical Health Alert System</h1>
-                <p><span id="connectionStatus" class="status-indicator status-normal"></span>Monitoring for critical conditions only</p>
-                
-                <div class="critical-notice">
-                    ⚠️ This system ONLY displays alerts when BOTH fall detection AND high heart rate (>100 BPM) occur together
-                </div>
-                
-                <div class="nav-links">
-                    <a href="/static/patient_dashboard.html" class="nav-link">👤 Patient Dashboard</a>
-                    <a href="/medical" class="nav-link">👨‍⚕️ Medical Dashboard</a>
-                    <a href="/data" class="nav-link">📊 All Data (Debug)</a>
-                    <a href="/test" class="nav-link">🔧 Test API</a>
-                </div>
-            </div>
-            
-            <div class="system-status">
-                <p>System Status: <span id="systemStatus">Monitoring...</span></p>
-                <p>Last Update: <span id="lastUpdate">--</span></p>
-            </div>
-            
-            <div class="stats">
-                <div class="stat-card">
-                    <div class="stat-number" id="criticalCount">0</div>
-                    <div class="stat-label">Critical Alerts</div>
-                </div>
-                <div class="stat-card">
-                    <div class="stat-number" id="lastCriticalHR">--</div>
-                    <div class="stat-label">Last Critical HR</div>
-                </div>
-                <div class="stat-card">
-                    <div class="stat-number" id="monitoringTime">0</div>
-                    <div class="stat-label">Minutes Monitoring</div>
-                </div>
-            </div>
-            
-            <div class="alerts-section">
-                <div class="section-header">
-                    <span>🚨</span>
-                    <span>CRITICAL ALERTS (Fall + High Heart Rate Only)</span>
-                </div>
-                <div class="alerts-content" id="criticalAlerts">Loading...</div>
-            </div>
-        </div>
-
-        <script>
-            let startTime = Date.now();
-            
-            async function fetchCriticalAlerts() {
-                try {
-                    let response = await fetch('/critical-alerts');
-                    let criticalAlerts = await response.json();
-                    
-                    updateCriticalAlerts(criticalAlerts);
-                    updateStats(criticalAlerts);
-                    updateSystemStatus();
-                    
-                } catch (error) {
-                    console.error('Error fetching critical alerts:', error);
-                    document.getElementById('systemStatus').textContent = 'Connection Error';
-                    document.getElementById('connectionStatus').className = 'status-indicator status-warning';
-                }
-            }
-            
-            function updateCriticalAlerts(alerts) {
-                let container = document.getElementById('criticalAlerts');
-                
-                if (alerts.length === 0) {
-                    container.innerHTML = `
-                        <div class="no-alerts">
-                            ✅ No Critical Alerts<br>
-                            <small>System is monitoring... Critical alerts appear only when fall is detected AND heart rate > 100 BPM</small>
-                        </div>
-                    `;
-                    return;
-                }
-                
-                let html = '';
-                // Show most recent alerts first
-                for (let i = alerts.length - 1; i >= 0; i--) {
-                    let alert = alerts[i];
-                    
-                    html += `
-                        <div class="critical-alert">
-                            <div class="alert-info">
-                                <div class="alert-title">🚨 CRITICAL EMERGENCY</div>
-                                <div class="alert-details">❤️ Heart Rate: ${alert.heart_rate} BPM + 🤕 Fall Detected</div>
-                                <div class="alert-patient">👤 Patient: ${alert.patient_id}</div>
-                                <div class="alert-timestamp">⏰ ${new Date(alert.timestamp).toLocaleString()}</div>
-                            </div>
-                            <div class="alert-badge">EMERGENCY</div>
-                        </div>
-                    `;
-                }
-                
-                container.innerHTML = html;
-            }
-            
-            function updateStats(criticalAlerts) {
-                document.getElementById('criticalCount').textContent = criticalAlerts.length;
-                
-                if (criticalAlerts.length > 0) {
-                    let lastAlert = criticalAlerts[criticalAlerts.length - 1];
-                    document.getElementById('lastCriticalHR').textContent = lastAlert.heart_rate + ' bpm';
-                    document.getElementById('connectionStatus').className = 'status-indicator status-critical';
-                } else {
-                    document.getElementById('lastCriticalHR').textContent = '--';
-                    document.getElementById('connectionStatus').className = 'status-indicator status-normal';
-                }
-                
-                let monitoringMinutes = Math.floor((Date.now() - startTime) / 60000);
-                document.getElementById('monitoringTime').textContent = monitoringMinutes;
-            }
-            
-            function updateSystemStatus() {
-                document.getElementById('systemStatus').textContent = 'Active - Monitoring for Critical Conditions';
-                document.getElementById('lastUpdate').textContent = new Date().toLocaleTimeString();
-            }
-            
-            // Initial load and auto-refresh every 3 seconds
-            document.addEventListener('DOMContentLoaded', function() {
-                console.log('Critical Alert System Started');
-                fetchCriticalAlerts();
-                setInterval(fetchCriticalAlerts, 3000);
-            });
-        </script>
-    </body>
-    </html>
-    """
-    return render_template_string(dashboard_html)
+    return serve_asset('critical_alerts.html')
 
 if __name__ == '__main__':
     print("🚨 Starting CRITICAL ALERTS ONLY health monitor server...")
-    print("⚠️  This version ONLY shows alerts when BOTH fall AND high heart rate (>100) occur")
+    print(f"⚠️  Alert rules: {', '.join(rule.name for rule in rule_engine.rules)} (from {RULES_CONFIG})")
     print("📡 Test URL: http://0.0.0.0:5000/test")
     print("🚨 Critical Alerts Dashboard: http://0.0.0.0:5000/")
     print("📊 All Data (Debug): http://0.0.0.0:5000/data")
     print("🚨 Critical Alerts API: http://0.0.0.0:5000/critical-alerts")
+    print("🔔 Active incidents: http://0.0.0.0:5000/alerts/active")
     
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""Static dashboard assets, loaded and precompressed once at startup.
+
+Every file is kept in memory as identity, gzip and (with the brotli package)
+brotli variants with a strong ETag each, so serving a dashboard is a dict
+lookup and a write. Each asset is also reachable under a fingerprinted name
+(``patient_dashboard.3f2a9c1b0d.html``) that can be cached for a year; the
+plain names revalidate with If-None-Match and cost a 304.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:  # gzip and identity only
+    BROTLI_AVAILABLE = False
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+# Only worth it for text; images and fonts are already compressed
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+
+def parse_accept_encoding(header):
+    """Accept-Encoding as {coding: quality}"""
+    qualities = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    return qualities
+
+
+class Asset:
+    __slots__ = ('name', 'mimetype', 'digest', 'variants')
+
+    def __init__(self, name, data, mimetype=None):
+        self.name = name
+        self.mimetype = mimetype or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.digest = hashlib.sha256(data).hexdigest()
+        self.variants = {'identity': data}
+        if self.mimetype.startswith(COMPRESSIBLE):
+            compressed = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+            if BROTLI_AVAILABLE:
+                compressed['br'] = brotli.compress(data, quality=11)
+            self.variants.update((coding, body) for coding, body in compressed.items() if len(body) < len(data))
+
+    @property
+    def fingerprinted_name(self):
+        stem, extension = os.path.splitext(self.name)
+        return f"{stem}.{self.digest[:10]}{extension}"
+
+    def etag(self, coding):
+        return f'"{self.digest[:16]}{"" if coding == "identity" else "-" + coding}"'
+
+    def select(self, accept_encoding):
+        """(coding, body, etag) of the smallest variant the client accepts"""
+        accepted = parse_accept_encoding(accept_encoding)
+        best = 'identity'
+        for coding, body in self.variants.items():
+            if accepted.get(coding, accepted.get('*', 0)) > 0 and len(body) < len(self.variants[best]):
+                best = coding
+        return best, self.variants[best], self.etag(best)
+
+
+class AssetCache:
+    """All files of a directory, by plain and fingerprinted name"""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._assets = {}
+        self._fingerprinted = {}
+        if directory and os.path.isdir(directory):
+            self.load(directory)
+
+    def load(self, directory):
+        raw = {}
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                with open(path, 'rb') as asset:
+                    raw[os.path.relpath(path, directory).replace(os.sep, '/')] = asset.read()
+        # Files that reference no other asset are fingerprinted first; references to them elsewhere
+        # are rewritten to the fingerprinted URL, so a changed file is never hidden behind a cached page
+        leaves = {name: data for name, data in raw.items() if b'/static/' not in data}
+        for name, data in leaves.items():
+            self.add(name, data)
+        for name, data in raw.items():
+            if name not in leaves:
+                self.add(name, self.rewrite_references(data, leaves))
+
+    def rewrite_references(self, data, names):
+        pattern = re.compile(rb'/static/(' + b'|'.join(re.escape(name.encode()) for name in names) + rb')\b')
+        return pattern.sub(lambda match: b'/static/' + self.url_name(match.group(1).decode()).encode(), data) \
+            if names else data
+
+    def add(self, name, data, mimetype=None):
+        asset = self._assets[name] = Asset(name, data, mimetype)
+        self._fingerprinted[asset.fingerprinted_name] = asset
+        return asset
+
+    def get(self, name):
+        """(asset, immutable) for a plain or fingerprinted name, or (None, False)"""
+        asset = self._fingerprinted.get(name)
+        if asset is not None:
+            return asset, True
+        return self._assets.get(name), False
+
+    def url_name(self, name):
+        asset = self._assets.get(name)
+        return asset.fingerprinted_name if asset is not None else name
+
+    def stats(self):
+        return {
+            "assets": len(self._assets),
+            "bytes": sum(len(asset.variants['identity']) for asset in self._assets.values()),
+            "compressed_bytes": {coding: sum(len(asset.variants.get(coding, asset.variants['identity']))
+                                             for asset in self._assets.values())
+                                 for coding in ('gzip', 'br') if coding != 'br' or BROTLI_AVAILABLE},
+            "brotli": BROTLI_AVAILABLE
+        }
@@ -0,0 +1,231 @@
+"""Asyncio ingest front end for device traffic (/update and /update/batch).
+
+Usage:
+    python async_ingest.py [--port 5000] [--api-port 5001]
+
+Every device connection is a coroutine on one event loop, so a device
+trickling its request over flaky WiFi holds a socket and a small buffer,
+not a worker thread. Requests run through the same ingest_update() and
+ingest_batch() as the Flask routes, into the same stores, rules, incidents
+and side-effect pipeline. ``--api-port`` serves the Flask app (dashboards,
+/data, /stream, ...) from a thread in the same process; with a shared store
+the API can also stay on gunicorn.
+
+Slow or stalled clients are bounded by a header timeout, a body timeout and
+a keep-alive idle timeout, and answered 408 (or just closed) when they run
+out. Credentials not yet in the auth cache are verified on a thread, as
+PBKDF2 would otherwise stall every other connection for ~50 ms; batches, and
+every request while the reliable pipeline queues are backing up, run on a
+thread too, so a blocking enqueue never stalls the loop.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import app
+
+logger = logging.getLogger('health_monitor.async_ingest')
+
+HEADER_TIMEOUT = float(os.environ.get('INGEST_HEADER_TIMEOUT', 10))
+BODY_TIMEOUT = float(os.environ.get('INGEST_BODY_TIMEOUT', 30))
+IDLE_TIMEOUT = float(os.environ.get('INGEST_IDLE_TIMEOUT', 5))
+MAX_HEADER_BYTES = int(os.environ.get('INGEST_MAX_HEADER_BYTES', 8192))
+MAX_BODY_BYTES = int(os.environ.get('INGEST_MAX_BODY_BYTES', 1024 * 1024))
+MAX_CONNECTIONS = int(os.environ.get('INGEST_MAX_CONNECTIONS', 20000))
+
+ROUTES = {'/update': app.ingest_update, '/update/batch': app.ingest_batch}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_head(head):
+    """(method, path, version, headers) from a request head ending in a blank line"""
+    try:
+        request_line, *header_lines = head[:-4].decode('latin-1').split('\r\n')
+        method, target, version = request_line.split(' ')
+    except ValueError:
+        raise HTTPError(400, "malformed request line")
+    headers = {}
+    for line in header_lines:
+        name, separator, value = line.partition(':')
+        if not separator:
+            raise HTTPError(400, "malformed header")
+        headers[name.strip().title()] = value.strip()
+    return method, target.split('?', 1)[0], version, headers
+
+
+def render_response(status, body, headers=None, keep_alive=True):
+    payload = json.dumps(body).encode('utf-8')
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+             "Content-Type: application/json",
+             f"Content-Length: {len(payload)}"]
+    lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+    if not keep_alive:
+        lines.append("Connection: close")
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload
+
+
+class IngestServer:
+    """HTTP/1.1 listener for the device protocol: Content-Length POST bodies, keep-alive optional"""
+
+    def __init__(self, routes=ROUTES, header_timeout=HEADER_TIMEOUT, body_timeout=BODY_TIMEOUT,
+                 idle_timeout=IDLE_TIMEOUT, max_body_bytes=MAX_BODY_BYTES, max_connections=MAX_CONNECTIONS,
+                 offload_all=app.SHARED_STORE):
+        self.routes = routes
+        self.header_timeout = header_timeout
+        self.body_timeout = body_timeout
+        self.idle_timeout = idle_timeout
+        self.max_body_bytes = max_body_bytes
+        self.max_connections = max_connections
+        # Shared-store calls are blocking IPC, so with a broker every request runs on a thread
+        self.offload_all = offload_all
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='ingest-offload')
+        self.connections = 0
+        self.peak_connections = 0
+        self.requests = 0
+        self.timeouts = {'header': 0, 'body': 0}
+        self.rejected = 0
+        self.aborted = 0
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        self.peak_connections = max(self.peak_connections, self.connections)
+        try:
+            if self.connections > self.max_connections:
+                self.rejected += 1
+                writer.write(render_response(503, {"error": "too many connections"}, keep_alive=False))
+                return
+            peer = writer.get_extra_info('peername')
+            remote_addr = peer[0] if peer else None
+            timeout = self.header_timeout
+            while await self._serve_one(reader, writer, remote_addr, timeout):
+                timeout = self.idle_timeout
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # The firmware closes right after client.print(); anything unread is gone with it
+            self.aborted += 1
+        except Exception:
+            logger.exception("ingest connection failed")
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _serve_one(self, reader, writer, remote_addr, head_timeout):
+        """Read and answer one request; returns whether the connection stays open"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), head_timeout)
+        except asyncio.TimeoutError:
+            # Idle keep-alive connections are just closed; a stalled first request is told why
+            if head_timeout == self.header_timeout:
+                self.timeouts['header'] += 1
+                writer.write(render_response(408, {"error": "request header timeout"}, keep_alive=False))
+            return False
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                self.aborted += 1
+            return False
+        except asyncio.LimitOverrunError:
+            writer.write(render_response(431, {"error": "request header too large"}, keep_alive=False))
+            return False
+        started = time.perf_counter()
+        method = path = None
+        try:
+            method, path, version, headers = parse_head(head)
+            keep_alive = headers.get('Connection', '').lower() != 'close' and version == 'HTTP/1.1'
+            handler = self.routes.get(path)
+            if handler is None:
+                raise HTTPError(404, f"the ingest listener only serves {', '.join(self.routes)}")
+            if method != 'POST':
+                raise HTTPError(405, "method not allowed")
+            if 'Transfer-Encoding' in headers or 'Content-Length' not in headers:
+                raise HTTPError(411, "Content-Length required")
+            try:
+                length = int(headers['Content-Length'])
+            except ValueError:
+                raise HTTPError(400, "bad Content-Length")
+            if not 0 <= length <= self.max_body_bytes:
+                raise HTTPError(413, f"body over {self.max_body_bytes} bytes")
+            try:
+                body = await asyncio.wait_for(reader.readexactly(length), self.body_timeout)
+            except asyncio.TimeoutError:
+                self.timeouts['body'] += 1
+                raise HTTPError(408, "request body timeout")
+            response_body, status, response_headers = await self._dispatch(handler, body, headers, remote_addr)
+        except HTTPError as e:
+            response_body, status, response_headers, keep_alive = {"error": str(e)}, e.status, None, False
+        self.requests += 1
+        writer.write(render_response(status, response_body, response_headers, keep_alive))
+        app.request_seconds.observe(time.perf_counter() - started,
+                                    path if path in self.routes else 'unmatched', method, status)
+        await asyncio.wait_for(writer.drain(), self.body_timeout)
+        return keep_alive
+
+    async def _dispatch(self, handler, body, headers, remote_addr):
+        """Run a handler inline only when it cannot block: cached credentials, a single reading,
+        and reliable pipeline queues with room (a full one blocks submit() until it drains)"""
+        auth_header = headers.get('Authorization')
+        if self.offload_all or handler is not app.ingest_update or app.pipeline.backlogged() or \
+                (app.device_registry is not None and auth_header and auth_header not in app.device_registry.cache):
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, handler, body, headers, remote_addr)
+        return handler(body, headers, remote_addr)
+
+    def stats(self):
+        return {
+            "connections": self.connections,
+            "peak_connections": self.peak_connections,
+            "requests": self.requests,
+            "timeouts": dict(self.timeouts),
+            "rejected": self.rejected,
+            "aborted": self.aborted
+        }
+
+
+def serve_api(host, port):
+    """Serve the Flask app (dashboards and queries) from a background thread"""
+    from werkzeug.serving import make_server
+    server = make_server(host, port, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='api-server', daemon=True).start()
+    return server
+
+
+async def serve(host, port, backlog, ingest):
+    server = await asyncio.start_server(ingest.handle, host, port, limit=MAX_HEADER_BYTES, backlog=backlog)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000, help="device ingest port (the firmware posts to 5000)")
+    parser.add_argument('--api-port', type=int, default=5001, help="Flask API/dashboard port (0 disables)")
+    parser.add_argument('--backlog', type=int, default=4096)
+    args = parser.parse_args()
+
+    ingest = IngestServer()
+    app.metrics.gauge('ingest_connections', 'Open device connections on the async ingest listener',
+                      lambda: {(): ingest.connections})
+    app.metrics.gauge('ingest_timeouts_total', 'Device requests that timed out', lambda: {
+        (stage,): count for stage, count in ingest.timeouts.items()}, ('stage',))
+    if args.api_port:
+        serve_api(args.host, args.api_port)
+        print(f"📊 API and dashboards: http://{args.host}:{args.api_port}/")
+    print(f"📡 Async device ingest: http://{args.host}:{args.port}/update")
+    try:
+        asyncio.run(serve(args.host, args.port, args.backlog, ingest))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
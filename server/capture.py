@@ -0,0 +1,171 @@
+"""Opt-in recorder of ingest requests, for replaying real traffic with replay.py.
+
+A capture is a directory of rotating segment files. Each segment starts with
+MAGIC and holds two kinds of records:
+
+    string:  <uint8 0, uint32 id, uint16 length> bytes
+    request: <uint8 1, float64 unix time, uint8 route, uint32 auth id, uint32 content-type id, uint32 length> body
+
+Authorization and Content-Type values are written once per segment and then
+referenced by id, so a request costs 22 bytes plus its body. Requests are
+queued by the request thread and encoded and written by a background thread.
+When that thread falls behind, requests are dropped and counted, so ingest
+never waits on the capture.
+"""
+import os
+import struct
+import threading
+import time
+
+MAGIC = b'HMCAP1\n'
+STRING = struct.Struct('<BIH')
+REQUEST = struct.Struct('<BdBIII')
+STRING_KIND, REQUEST_KIND = 0, 1
+NO_VALUE = 0xFFFFFFFF
+ROUTES = ('/update', '/update/batch')
+SEGMENT_PREFIX = 'capture-'
+SEGMENT_SUFFIX = '.cap'
+
+
+def list_captures(path):
+    """Segment files of a capture directory (oldest first), or the file itself"""
+    if os.path.isfile(path):
+        return [path]
+    names = sorted(name for name in os.listdir(path)
+                   if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+    return [os.path.join(path, name) for name in names]
+
+
+def read_capture(paths):
+    """Yield (unix_time, route, authorization, content_type, body) from segment files in order.
+
+    A segment ends at its first incomplete record (a torn tail from a crash).
+    """
+    for path in paths:
+        with open(path, 'rb') as segment:
+            data = segment.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{path} is not a capture segment")
+        strings = {NO_VALUE: None}
+        offset, size = len(MAGIC), len(data)
+        while offset < size:
+            kind = data[offset]
+            if kind == STRING_KIND:
+                if offset + STRING.size > size:
+                    break
+                _, string_id, length = STRING.unpack_from(data, offset)
+                offset += STRING.size
+                strings[string_id] = data[offset:offset + length].decode('latin-1')
+                offset += length
+            elif kind == REQUEST_KIND:
+                if offset + REQUEST.size > size:
+                    break
+                _, timestamp, route, auth_id, type_id, length = REQUEST.unpack_from(data, offset)
+                offset += REQUEST.size
+                if offset + length > size:
+                    break
+                yield timestamp, ROUTES[route], strings[auth_id], strings[type_id], data[offset:offset + length]
+                offset += length
+            else:
+                break
+
+
+class CaptureRecorder:
+    """Writes recorded requests to ``directory``, rotating at ``segment_bytes`` and keeping ``max_segments``"""
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, max_segments=16, max_pending=10000,
+                 flush_interval=0.2):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self.started_at = time.time()
+        os.makedirs(directory, exist_ok=True)
+        segments = list_captures(directory)
+        self._segment_id = int(os.path.basename(segments[-1])[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) + 1 \
+            if segments else 1
+        self._open_segment()
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name='capture-writer', daemon=True)
+        self._writer.start()
+
+    def record(self, route, authorization, content_type, body):
+        """Queue one request; never blocks"""
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending.append((time.time(), ROUTES.index(route), authorization, content_type, body))
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._segment_id:08d}{SEGMENT_SUFFIX}")
+        self._file = open(path, 'ab')
+        self._file.write(MAGIC)
+        self._strings = {None: NO_VALUE}
+
+    def _string_id(self, value, out):
+        string_id = self._strings.get(value)
+        if string_id is None:
+            string_id = self._strings[value] = len(self._strings) - 1
+            encoded = value.encode('latin-1', errors='replace')[:0xFFFF]
+            out.append(STRING.pack(STRING_KIND, string_id, len(encoded)) + encoded)
+        return string_id
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                if not self._pending and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                batch, self._pending = self._pending, []
+                closed = self._closed
+            if batch:
+                self._write(batch)
+            if closed:
+                return
+
+    def _write(self, batch):
+        out = []
+        for timestamp, route, authorization, content_type, body in batch:
+            auth_id = self._string_id(authorization, out)
+            type_id = self._string_id(content_type, out)
+            out.append(REQUEST.pack(REQUEST_KIND, timestamp, route, auth_id, type_id, len(body)))
+            out.append(body)
+        data = b''.join(out)
+        self._file.write(data)
+        self._file.flush()
+        self.recorded += len(batch)
+        self.bytes_written += len(data)
+        if self._file.tell() >= self.segment_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        self._segment_id += 1
+        self._open_segment()
+        segments = list_captures(self.directory)
+        for path in segments[:max(0, len(segments) - self.max_segments)]:
+            os.remove(path)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._writer.join()
+        self._file.close()
+
+    def stats(self):
+        return {
+            "directory": self.directory,
+            "segments": len(list_captures(self.directory)),
+            "recorded": self.recorded,
+            "pending": len(self._pending),
+            "dropped": self.dropped,
+            "bytes_written": self.bytes_written,
+            "since": self.started_at
+        }
@@ -0,0 +1,103 @@
+"""Server-side AES decryption of firmware payloads with cached cipher contexts"""
+import threading
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    CRYPTO_AVAILABLE = True
+except ImportError:  # Decryption stage is disabled; plain base64 payloads still work
+    CRYPTO_AVAILABLE = False
+
+BLOCK_SIZE = 16
+ZERO_IV = bytes(BLOCK_SIZE)
+
+
+def normalize_key(key):
+    """AES-128 key from a string/bytes (the firmware key is truncated to 16 bytes)"""
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    if len(key) < BLOCK_SIZE:
+        raise ValueError("AES-128 key must be at least 16 bytes")
+    return bytes(key[:BLOCK_SIZE])
+
+
+def unpad(plaintext, text=True):
+    """Strip PKCS#7 padding and the C string terminator the firmware encrypts.
+
+    Binary payloads (``text=False``) keep trailing NULs and must be padded.
+    """
+    pad = plaintext[-1] if plaintext else 0
+    if 1 <= pad <= BLOCK_SIZE and plaintext[-pad:] == bytes([pad]) * pad:
+        plaintext = plaintext[:-pad]
+    elif not text:
+        return None
+    return plaintext.rstrip(b'\x00') if text else plaintext
+
+
+class DeviceCipher:
+    """AES-128-CBC decryption for one device key.
+
+    The key schedule is set up once: a single ECB decryptor context is reused
+    for every message (ECB keeps no state between blocks) and the CBC chaining
+    is applied on top, so many messages can be decrypted in one call.
+    """
+
+    def __init__(self, key, iv=ZERO_IV):
+        if not CRYPTO_AVAILABLE:
+            raise RuntimeError("the cryptography package is required for AES decryption")
+        self.iv = iv
+        self._ecb = Cipher(algorithms.AES(normalize_key(key)), modes.ECB()).decryptor()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _xor(left, right):
+        return (int.from_bytes(left, 'big') ^ int.from_bytes(right, 'big')).to_bytes(len(left), 'big')
+
+    def decrypt(self, ciphertext, text=True):
+        return self.decrypt_many([ciphertext], text)[0]
+
+    def decrypt_many(self, ciphertexts, text=True):
+        """Decrypt a list of ciphertexts; entries that are not block-aligned (or badly padded binary) give None"""
+        valid = [ciphertext for ciphertext in ciphertexts if ciphertext and len(ciphertext) % BLOCK_SIZE == 0]
+        with self._lock:
+            blocks = self._ecb.update(b''.join(valid))
+        results = []
+        offset = 0
+        for ciphertext in ciphertexts:
+            if not ciphertext or len(ciphertext) % BLOCK_SIZE:
+                results.append(None)
+                continue
+            decrypted = blocks[offset:offset + len(ciphertext)]
+            offset += len(ciphertext)
+            # CBC: each plaintext block is the decrypted block XOR the previous ciphertext block
+            results.append(unpad(self._xor(decrypted, self.iv + ciphertext[:-BLOCK_SIZE]), text))
+        return results
+
+
+class KeyRing:
+    """Per-device AES keys with their cipher contexts cached"""
+
+    def __init__(self, default_key=None, iv=ZERO_IV):
+        self.default_key = default_key
+        self.iv = iv
+        self._keys = {}
+        self._ciphers = {}
+        self._lock = threading.Lock()
+
+    def set_key(self, device, key):
+        with self._lock:
+            self._keys[device] = key
+            self._ciphers.pop(device, None)
+
+    def get(self, device):
+        """Cached DeviceCipher for a device (falling back to the default key), or None"""
+        cipher = self._ciphers.get(device)
+        if cipher is not None:
+            return cipher
+        key = self._keys.get(device, self.default_key)
+        if key is None or not CRYPTO_AVAILABLE:
+            return None
+        with self._lock:
+            cipher = self._ciphers.get(device)
+            if cipher is None:
+                cipher = self._ciphers[device] = DeviceCipher(key, self.iv)
+        return cipher
@@ -0,0 +1,194 @@
+"""Device registry: Basic-auth credentials mapped to a patient and an AES key.
+
+Passwords are stored as PBKDF2-SHA256 hashes and checked in constant time;
+results are kept in an LRU cache with a TTL keyed on the raw Authorization
+header, so a known device skips the base64 decode and the hash on repeat
+requests.
+
+Manage the registry file with ``python devices.py add|generate|list``.
+"""
+import argparse
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+HASH_ALGORITHM = 'pbkdf2_sha256'
+DEFAULT_ITERATIONS = 100_000
+
+
+def hash_password(password, iterations=DEFAULT_ITERATIONS, salt=None):
+    """Encode a password as ``pbkdf2_sha256$iterations$salt$digest``"""
+    salt = salt or os.urandom(16).hex()
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('ascii'), iterations)
+    return f"{HASH_ALGORITHM}${iterations}${salt}${digest.hex()}"
+
+
+def verify_password(password, encoded):
+    try:
+        algorithm, iterations, salt, expected = encoded.split('$')
+    except ValueError:
+        return False
+    if algorithm != HASH_ALGORITHM:
+        return False
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('ascii'), int(iterations))
+    return hmac.compare_digest(digest.hex(), expected)
+
+
+class Device:
+    __slots__ = ('username', 'password_hash', 'patient_id', 'aes_key')
+
+    def __init__(self, username, password_hash, patient_id=None, aes_key=None):
+        self.username = username
+        self.password_hash = password_hash
+        self.patient_id = patient_id
+        self.aes_key = aes_key
+
+    def to_dict(self):
+        return {"username": self.username, "password_hash": self.password_hash,
+                "patient_id": self.patient_id, "aes_key": self.aes_key}
+
+
+class AuthCache:
+    """LRU of Authorization header -> (expiry, device, reason)"""
+
+    def __init__(self, max_entries=10000, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, header, now):
+        with self._lock:
+            entry = self._entries.get(header)
+            if entry is None or entry[0] < now:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(header)
+            self.hits += 1
+            return entry
+
+    def __contains__(self, header):
+        """Whether ``header`` has a live entry (no LRU or hit-rate side effects)"""
+        entry = self._entries.get(header)
+        return entry is not None and entry[0] >= time.monotonic()
+
+    def put(self, header, device, reason, now):
+        with self._lock:
+            self._entries[header] = (now + self.ttl, device, reason)
+            self._entries.move_to_end(header)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DeviceRegistry:
+    """Devices loaded from a JSON file (``{"devices": [...]}``)"""
+
+    def __init__(self, devices=(), cache_size=10000, cache_ttl=300.0):
+        self.devices = {device.username: device for device in devices}
+        self.cache = AuthCache(cache_size, cache_ttl)
+        # Unknown users are hashed against this so a miss costs the same as a wrong password
+        self._dummy_hash = hash_password('', salt='0' * 32)
+
+    @classmethod
+    def load(cls, path, **cache_options):
+        with open(path) as registry:
+            entries = json.load(registry)['devices']
+        return cls([Device(entry['username'], entry['password_hash'], entry.get('patient_id'),
+                           entry.get('aes_key')) for entry in entries], **cache_options)
+
+    def save(self, path):
+        with open(path, 'w') as registry:
+            json.dump({"devices": [device.to_dict() for device in self.devices.values()]}, registry, indent=2)
+            registry.write('\n')
+
+    def add(self, username, password, patient_id=None, aes_key=None, iterations=DEFAULT_ITERATIONS):
+        device = self.devices[username] = Device(username, hash_password(password, iterations), patient_id, aes_key)
+        self.cache.clear()
+        return device
+
+    def authenticate(self, header):
+        """Check a Basic Authorization header; returns (device, None) or (None, reason)"""
+        if not header:
+            return None, 'missing'
+        now = time.monotonic()
+        cached = self.cache.get(header, now)
+        if cached is not None:
+            return cached[1], cached[2]
+        device, reason = self._verify(header)
+        self.cache.put(header, device, reason, now)
+        return device, reason
+
+    def _verify(self, header):
+        if not header.startswith('Basic '):
+            return None, 'malformed'
+        try:
+            username, password = base64.b64decode(header[6:], validate=True).decode('utf-8').split(':', 1)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None, 'malformed'
+        device = self.devices.get(username)
+        valid = verify_password(password, device.password_hash if device is not None else self._dummy_hash)
+        if device is None:
+            return None, 'unknown_device'
+        if not valid:
+            return None, 'bad_password'
+        return device, None
+
+    def stats(self):
+        return {
+            "devices": len(self.devices),
+            "cache_entries": len(self.cache),
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the device registry")
+    parser.add_argument('--registry', default=os.environ.get(
+        'DEVICE_REGISTRY', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'devices.json')))
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help="add or replace one device")
+    add.add_argument('username')
+    add.add_argument('password')
+    add.add_argument('--patient-id')
+    add.add_argument('--aes-key')
+    generate = commands.add_parser('generate', help="add device-NNNNN -> PNNNNN entries for fleet_sim.py")
+    generate.add_argument('--count', type=int, default=100)
+    generate.add_argument('--password', default='iotpass')
+    commands.add_parser('list')
+    args = parser.parse_args()
+
+    registry = DeviceRegistry.load(args.registry) if os.path.exists(args.registry) else DeviceRegistry()
+    if args.command == 'list':
+        for device in registry.devices.values():
+            print(f"{device.username:<24} patient={device.patient_id or '-':<12} aes_key={'set' if device.aes_key else 'default'}")
+        return
+    if args.command == 'add':
+        registry.add(args.username, args.password, args.patient_id, args.aes_key, args.iterations)
+    else:
+        # One salt per fleet keeps generation fast; every device still gets its own entry
+        shared_hash = hash_password(args.password, args.iterations)
+        for index in range(args.count):
+            registry.devices[f"device-{index:05d}"] = Device(f"device-{index:05d}", shared_hash, f"P{index:05d}")
+    registry.save(args.registry)
+    print(f"💾 {len(registry.devices)} devices in {args.registry}")
+
+
+if __name__ == '__main__':
+    main()
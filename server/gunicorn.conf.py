@@ -0,0 +1,45 @@
+"""Production serving mode: gunicorn workers sharing one store broker.
+
+Run from the server directory:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The shared store broker is started before the workers fork, unless
+HEALTH_STORE_ADDRESS already points at a running one (then set
+HEALTH_STORE_AUTHKEY to the key it was started with).
+"""
+import multiprocessing
+import os
+import secrets
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# SSE clients hold a thread each for as long as they are connected. app.py refuses more than
+# STREAM_MAX_CLIENTS of them per worker, and the pool has that many threads on top of
+# WEB_THREADS, so /update and the API always keep WEB_THREADS threads of their own
+threads = int(os.environ.get('WEB_THREADS', 4)) + int(os.environ.get('STREAM_MAX_CLIENTS', 16))
+worker_class = 'gthread'
+keepalive = 5
+
+_store_process = None
+
+
+def on_starting(server):
+    global _store_process
+    if os.environ.get('HEALTH_STORE_ADDRESS'):
+        return
+    import shared_store
+    # A fresh random key per start, inherited by the broker and the forked workers
+    if not os.environ.get('HEALTH_STORE_AUTHKEY'):
+        os.environ['HEALTH_STORE_AUTHKEY'] = secrets.token_hex(32)
+    address = os.environ.get('HEALTH_STORE_BIND', '127.0.0.1:50000')
+    log_dir = os.environ.get('TELEMETRY_LOG_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'telemetry'))
+    _store_process = shared_store.start_store_server(address, log_dir=log_dir or None)
+    # Workers read this when they import app
+    os.environ['HEALTH_STORE_ADDRESS'] = address
+    server.log.info("Shared store broker running on %s", address)
+
+
+def on_exit(server):
+    if _store_process is not None:
+        _store_process.terminate()
@@ -0,0 +1,189 @@
+"""Missed-heartbeat detection for devices that stop reporting.
+
+Deadlines live in a hashed timer wheel: scheduling is O(1) and each tick
+only visits the one slot that is due, so the cost does not grow with the
+number of devices. A heartbeat only moves the device's deadline in a dict;
+the timer already in the wheel re-arms itself at the new deadline when it
+fires, so a device reporting on time costs about one wheel operation per
+timeout, not one per reading.
+"""
+import datetime
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger('health_monitor.heartbeat')
+
+
+class TimerWheel:
+    """Hashed timing wheel; deadlines past one lap stay in their slot until their tick comes round"""
+
+    def __init__(self, tick=1.0, slots=512, now=None):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.current = int((time.monotonic() if now is None else now) / tick)
+        self.size = 0
+
+    def schedule(self, deadline, key):
+        target = max(math.ceil(deadline / self.tick), self.current + 1)
+        self.slots[target % len(self.slots)].append((target, key))
+        self.size += 1
+
+    def advance(self, now):
+        """Move the wheel up to ``now`` and return the keys whose deadline has passed"""
+        due = []
+        last_tick = int(now / self.tick)
+        # After a long stall, one lap visits every slot once
+        if last_tick - self.current > len(self.slots):
+            self.current = last_tick - len(self.slots)
+        while self.current < last_tick:
+            self.current += 1
+            index = self.current % len(self.slots)
+            slot = self.slots[index]
+            if not slot:
+                continue
+            pending = []
+            for target, key in slot:
+                if target <= self.current:
+                    due.append(key)
+                else:
+                    pending.append((target, key))
+            self.slots[index] = pending
+            self.size -= len(slot) - len(pending)
+        return due
+
+
+class OfflineDetector:
+    """Calls ``on_offline`` once when a device misses ``missed`` reports in a row.
+
+    Devices are keyed by their identity (e.g. the Basic Auth user), and each
+    heartbeat names the patient the device reports for. A device still
+    silent ``retire_after`` seconds after going offline is forgotten
+    (decommissioned), with a call to ``on_retire``.
+
+    ``on_offline(key, last_seen, patient_id, silence_seconds)``,
+    ``on_online(key, patient_id, offline_seconds)`` and
+    ``on_retire(key, patient_id, offline_seconds)`` run on the detector
+    thread (or the heartbeat caller for ``on_online``).
+    """
+
+    def __init__(self, on_offline, on_online=None, interval=5.0, missed=3, tick=1.0, slots=512,
+                 on_retire=None, retire_after=None):
+        self.on_offline = on_offline
+        self.on_online = on_online
+        self.on_retire = on_retire
+        self.interval = interval
+        self.missed = missed
+        self.timeout = interval * missed
+        self.retire_after = retire_after
+        self.tick = tick
+        self.alerts = 0
+        self.retired = 0
+        self._wheel = TimerWheel(tick, slots)
+        # (key, offline_since) of offline devices, due when they should be retired
+        self._retirements = TimerWheel(tick, slots)
+        self._deadlines = {}
+        self._devices = {}
+        self._armed = set()
+        self._offline = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def heartbeat(self, key, patient_id=None):
+        now = time.monotonic()
+        offline_since = None
+        with self._lock:
+            self._deadlines[key] = now + self.timeout
+            # on_online reports the patient the device went offline for, even if it now reports for another
+            previous = self._devices.get(key)
+            if patient_id is not None:
+                self._devices[key] = patient_id
+            if key not in self._armed:
+                self._armed.add(key)
+                self._wheel.schedule(now + self.timeout, key)
+            if self._offline:
+                offline_since = self._offline.pop(key, None)
+        if offline_since is not None and self.on_online is not None:
+            self.on_online(key, previous if previous is not None else patient_id, now - offline_since)
+
+    def check(self, now=None):
+        """Fire on_offline for every device whose deadline passed (and on_retire); returns how many went offline"""
+        now = time.monotonic() if now is None else now
+        expired = []
+        retired = []
+        with self._lock:
+            for key, offline_since in self._retirements.advance(now):
+                # Skipped if the device came back (or went offline again) since
+                if self._offline.get(key) != offline_since:
+                    continue
+                del self._offline[key]
+                del self._deadlines[key]
+                retired.append((key, self._devices.pop(key, None), now - offline_since))
+            for key in self._wheel.advance(now):
+                deadline = self._deadlines[key]
+                if deadline > now:
+                    # Reported since the timer was set: re-arm at the current deadline
+                    self._wheel.schedule(deadline, key)
+                    continue
+                self._armed.discard(key)
+                self._offline[key] = now
+                if self.retire_after:
+                    self._retirements.schedule(now + self.retire_after, (key, now))
+                silence = now - deadline + self.timeout
+                expired.append((key, time.time() - silence, self._devices.get(key), silence))
+        for key, last_seen, patient_id, silence in expired:
+            self.alerts += 1
+            self.on_offline(key, last_seen, patient_id, silence)
+        for key, patient_id, offline_seconds in retired:
+            self.retired += 1
+            if self.on_retire is not None:
+                self.on_retire(key, patient_id, offline_seconds)
+        return len(expired)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='offline-detector', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            try:
+                self.check()
+            except Exception:
+                # A failing callback must not stop detection for every other device
+                logger.exception("offline check failed")
+
+    def stats(self):
+        return {
+            "devices": len(self._deadlines),
+            "offline": len(self._offline),
+            "timers": self._wheel.size,
+            "timeout_s": self.timeout,
+            "retire_after_s": self.retire_after,
+            "offline_alerts": self.alerts,
+            "retired": self.retired
+        }
+
+
+def offline_alert(patient_id, last_seen, device, silence, missed):
+    """Alert record (same shape as rule alerts) for a device that stopped reporting"""
+    return {
+        'timestamp': datetime.datetime.now().isoformat(),
+        'heart_rate': None,
+        'fall': None,
+        'patient_id': patient_id,
+        'rule': 'device_offline',
+        'alert_type': 'DEVICE_OFFLINE',
+        'severity': 'MEDIUM',
+        'message': f"No reading for {silence:.0f}s ({missed} missed reports)",
+        'device': device,
+        'last_seen': datetime.datetime.fromtimestamp(last_seen).isoformat()
+    }
@@ -0,0 +1,196 @@
+"""Low-overhead metrics (Prometheus text format) and an opt-in sampling profiler"""
+import bisect
+import math
+import sys
+import threading
+from collections import Counter as StackCounter
+
+STAGE_BUCKETS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2)
+REQUEST_BUCKETS = (5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Collapsed-stack line the profiler counts new stacks under once it holds max_stacks
+OTHER_STACKS = '[other stacks]'
+# Shorter profiler intervals would keep a core busy walking stacks
+MIN_PROFILER_INTERVAL = 0.001
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Metric:
+    def __init__(self, registry, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._registry = registry
+        self._lock = threading.Lock()
+        registry.metrics.append(self)
+
+
+class Counter(Metric):
+    """Monotonic count, incremented with inc() or, for totals another component keeps,
+    read from ``callback() -> {label_values: value}`` at scrape time"""
+    kind = 'counter'
+
+    def __init__(self, registry, name, help_text, labels=(), callback=None):
+        super().__init__(registry, name, help_text, labels)
+        self._values = {}
+        self._callback = callback
+
+    def inc(self, *label_values, amount=1):
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        if self._callback is not None:
+            items = self._callback().items()
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge(Metric):
+    """Value read from a callback at scrape time: fn() -> {label_values: value}"""
+    kind = 'gauge'
+
+    def __init__(self, registry, name, help_text, callback, labels=()):
+        super().__init__(registry, name, help_text, labels)
+        self._callback = callback
+
+    def samples(self):
+        for label_values, value in self._callback().items():
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labels=(), buckets=STAGE_BUCKETS):
+        super().__init__(registry, name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        if not self._registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, (list(series[0]), series[1], series[2])) for labels, series in self._series.items()]
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield (f'{self.name}_bucket', _format_labels(self.labels + ('le',), label_values + (le,)), cumulative)
+            yield f'{self.name}_sum', _format_labels(self.labels, label_values), total
+            yield f'{self.name}_count', _format_labels(self.labels, label_values), count
+
+
+class Registry:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.metrics = []
+
+    def counter(self, name, help_text, labels=(), callback=None):
+        return Counter(self, name, help_text, labels, callback)
+
+    def gauge(self, name, help_text, callback, labels=()):
+        return Gauge(self, name, help_text, callback, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=STAGE_BUCKETS):
+        return Histogram(self, name, help_text, labels, buckets)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads at a fixed interval while running.
+
+    Output is in collapsed-stack format (one ``frame;frame;frame count`` line
+    per stack), ready for flamegraph tools. At most ``max_stacks`` distinct
+    stacks are kept; samples of further new stacks are counted under
+    OTHER_STACKS.
+    """
+
+    def __init__(self, interval=0.01, max_depth=64, max_stacks=10000):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+        self.samples = 0
+        self.overflowed = 0
+        self._stacks = StackCounter()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        """Start sampling; ValueError unless ``interval`` is at least MIN_PROFILER_INTERVAL seconds"""
+        if interval is not None and not (math.isfinite(interval) and interval >= MIN_PROFILER_INTERVAL):
+            raise ValueError(f"interval must be a number of seconds, at least {MIN_PROFILER_INTERVAL}")
+        if self.running:
+            return
+        if interval is not None:
+            self.interval = interval
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def reset(self):
+        self._stacks.clear()
+        self.samples = 0
+        self.overflowed = 0
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{frame.f_lineno})')
+                    frame = frame.f_back
+                key = ';'.join(reversed(stack))
+                if key not in self._stacks and len(self._stacks) >= self.max_stacks:
+                    key = OTHER_STACKS
+                    self.overflowed += 1
+                self._stacks[key] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in self._stacks.most_common()) + '\n'
+
@@ -0,0 +1,131 @@
+"""Rate-limited, retrying delivery of alert notifications to outbound sinks.
+
+Each sink is a callable taking the alert record; raising means "try again".
+Deliveries pass through a token bucket (``rate`` per second, bursts of
+``burst``) and failures are retried with exponential backoff, so an incident
+storm or a flaky pager gateway cannot flood the sink or block ingest.
+"""
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+import urllib.request
+
+logger = logging.getLogger('health_monitor.notify')
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, now=None):
+        """Take one token; returns 0 on success or the seconds until one is available"""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class NotificationDispatcher:
+    """Bounded outbound queue drained by one thread through a token bucket"""
+
+    def __init__(self, sinks, rate=1.0, burst=10, max_queue=1000, max_attempts=5, backoff=1.0, max_backoff=60.0):
+        self.sinks = sinks
+        self.bucket = TokenBucket(rate, burst)
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+        self._queue = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='notify-dispatcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, alert):
+        """Queue the alert for every sink; never blocks"""
+        if not self.sinks:
+            return
+        now = time.monotonic()
+        with self._cond:
+            for sink in self.sinks:
+                if len(self._queue) >= self.max_queue:
+                    self.dropped += 1
+                    continue
+                heapq.heappush(self._queue, (now, next(self._order), 1, sink, alert))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                due, _, attempt, sink, alert = self._queue[0]
+                now = time.monotonic()
+                wait = max(due - now, 0.0) or self.bucket.take(now)
+                if wait > 0:
+                    # Woken early by submit() or close(); the head is re-examined either way
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._queue)
+            try:
+                sink(alert)
+                self.delivered += 1
+            except Exception as e:
+                with self._cond:
+                    if attempt < self.max_attempts:
+                        self.retried += 1
+                        delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+                        heapq.heappush(self._queue, (time.monotonic() + delay, next(self._order), attempt + 1, sink, alert))
+                    else:
+                        self.failed += 1
+                logger.warning("Notification to %s failed (attempt %d/%d): %s",
+                               getattr(sink, 'name', sink), attempt, self.max_attempts, e)
+
+    def close(self, timeout=5.0):
+        """Stop after draining what can be delivered within ``timeout``"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "queued": len(self._queue),
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "rate_per_s": self.bucket.rate,
+            "burst": self.bucket.burst
+        }
+
+
+class WebhookSink:
+    """POSTs each alert as JSON; non-2xx responses and network errors are retried by the dispatcher"""
+
+    def __init__(self, url, timeout=5.0):
+        self.url = url
+        self.name = url
+        self.timeout = timeout
+
+    def __call__(self, alert):
+        request = urllib.request.Request(self.url, data=json.dumps(alert).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
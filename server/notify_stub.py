@@ -0,0 +1,49 @@
+"""Local stand-in for a pager/SMS gateway that prints the alert notifications it receives.
+
+Usage:
+    python notify_stub.py --port 9000 [--fail-rate 0.2]
+    NOTIFY_WEBHOOK_URL=http://127.0.0.1:9000/notify python app.py
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class NotifyHandler(BaseHTTPRequestHandler):
+    fail_rate = 0.0
+    received = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if random.random() < self.fail_rate:
+            # Exercise the dispatcher's retries
+            self.send_response(503)
+            self.end_headers()
+            return
+        alert = json.loads(body)
+        NotifyHandler.received += 1
+        print(f"📟 {time.strftime('%H:%M:%S')} #{NotifyHandler.received} "
+              f"[{alert.get('status', '-')}/{alert.get('severity')}] {alert.get('patient_id')}: {alert.get('message')}",
+              flush=True)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+    NotifyHandler.fail_rate = args.fail_rate
+    print(f"📟 Notification stub listening on http://{args.host}:{args.port}/notify", flush=True)
+    ThreadingHTTPServer((args.host, args.port), NotifyHandler).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""Live per-patient state for the /patients roster, updated in O(1) per reading"""
+import base64
+import binascii
+import heapq
+import json
+import math
+import threading
+
+SEVERITY_RANK = {'LOW': 1, 'MEDIUM': 2, 'HIGH': 3, 'CRITICAL': 4}
+SORT_ORDERS = ('severity', 'staleness', 'heart_rate', 'patient_id')
+
+
+class PatientState:
+    """Latest reading, last-seen time, running HR stats and the most recent alert of one patient"""
+    __slots__ = ('patient_id', 'last_reading', 'last_seen', 'readings', 'critical_readings',
+                 'hr_min', 'hr_max', 'hr_mean', 'hr_m2', 'alerts', 'open_alert', 'open_severity', 'alert_seen',
+                 'incidents')
+
+    def __init__(self, patient_id):
+        self.patient_id = patient_id
+        self.last_reading = None
+        self.last_seen = 0.0
+        self.readings = 0
+        self.critical_readings = 0
+        self.hr_min = None
+        self.hr_max = None
+        self.hr_mean = 0.0
+        self.hr_m2 = 0.0
+        self.alerts = 0
+        self.open_alert = None
+        self.open_severity = 0
+        self.alert_seen = 0.0
+        # incident_id -> latest record of each incident not yet resolved (see alerts.py)
+        self.incidents = {}
+
+    def add_reading(self, entry, epoch_seconds):
+        heart_rate = entry['heart_rate']
+        self.last_reading = entry
+        self.last_seen = max(self.last_seen, epoch_seconds)
+        self.readings += 1
+        if entry.get('is_critical'):
+            self.critical_readings += 1
+        self.hr_min = heart_rate if self.hr_min is None else min(self.hr_min, heart_rate)
+        self.hr_max = heart_rate if self.hr_max is None else max(self.hr_max, heart_rate)
+        # Welford's online mean/variance
+        delta = heart_rate - self.hr_mean
+        self.hr_mean += delta / self.readings
+        self.hr_m2 += delta * (heart_rate - self.hr_mean)
+
+    def add_alert(self, alert, epoch_seconds, open_seconds):
+        incident_id = alert.get('incident_id')
+        if incident_id is not None:
+            if alert.get('status') == 'resolved':
+                self.incidents.pop(incident_id, None)
+            else:
+                self.alerts += alert.get('status') == 'open'
+                self.incidents[incident_id] = alert
+            return
+        rank = SEVERITY_RANK.get(alert.get('severity'), 0)
+        # An alert raised while another is still open keeps the higher severity
+        if not self.alert_open(epoch_seconds, open_seconds) or rank >= self.open_severity:
+            self.open_alert = alert
+            self.open_severity = rank
+        self.alert_seen = max(self.alert_seen, epoch_seconds)
+        self.alerts += 1
+
+    def alert_open(self, now, open_seconds):
+        return bool(self.incidents) or (self.open_alert is not None and now - self.alert_seen <= open_seconds)
+
+    def current_alert(self, now, open_seconds):
+        """(severity rank, alert) of the most severe open alert, or (0, None)"""
+        best_rank, best = 0, None
+        for alert in self.incidents.values():
+            rank = SEVERITY_RANK.get(alert.get('severity'), 0)
+            if best is None or rank > best_rank:
+                best_rank, best = rank, alert
+        if self.open_alert is not None and now - self.alert_seen <= open_seconds and \
+                (best is None or self.open_severity > best_rank):
+            best_rank, best = self.open_severity, self.open_alert
+        return best_rank, best
+
+    def to_dict(self, now, open_seconds, stale_seconds):
+        reading = self.last_reading
+        _, open_alert = self.current_alert(now, open_seconds)
+        return {
+            'patient_id': self.patient_id,
+            'status': 'critical' if open_alert is not None else 'normal',
+            'stale': now - self.last_seen > stale_seconds,
+            'last_seen': self.last_seen,
+            'seconds_since_seen': round(now - self.last_seen, 1),
+            'last_reading': {
+                'timestamp': reading['timestamp'],
+                'heart_rate': reading['heart_rate'],
+                'fall': reading['fall'],
+                'seq': reading.get('seq')
+            } if reading else None,
+            'readings': self.readings,
+            'critical_readings': self.critical_readings,
+            'alerts': self.alerts,
+            'heart_rate': {
+                'min': self.hr_min,
+                'max': self.hr_max,
+                'mean': round(self.hr_mean, 2) if self.readings else None,
+                'std': round(math.sqrt(self.hr_m2 / self.readings), 2) if self.readings else None
+            },
+            'open_alert': open_alert
+        }
+
+
+def encode_cursor(sort, key):
+    return base64.urlsafe_b64encode(json.dumps([sort, list(key)]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """Key of the last item of the previous page; raises ValueError on a bad or mismatched cursor"""
+    try:
+        cursor_sort, key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("malformed cursor")
+    if cursor_sort != sort:
+        raise ValueError("cursor was issued for a different sort order")
+    return tuple(key)
+
+
+class PatientIndex:
+    """All patients' PatientState, with sorted, keyset-paginated roster queries"""
+
+    def __init__(self, open_seconds=300.0, stale_seconds=30.0):
+        self.open_seconds = open_seconds
+        self.stale_seconds = stale_seconds
+        self._patients = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._patients)
+
+    def _state(self, patient_id):
+        state = self._patients.get(patient_id)
+        if state is None:
+            state = self._patients[patient_id] = PatientState(patient_id)
+        return state
+
+    def add_reading(self, entry, epoch_seconds):
+        with self._lock:
+            self._state(entry['patient_id']).add_reading(entry, epoch_seconds)
+
+    def add_alert(self, alert, epoch_seconds):
+        with self._lock:
+            self._state(alert['patient_id']).add_alert(alert, epoch_seconds, self.open_seconds)
+
+    def _sort_key(self, state, sort, now):
+        # Every key ends in the patient id so the order is total and cursors are unambiguous
+        if sort == 'severity':
+            open_rank, _ = state.current_alert(now, self.open_seconds)
+            return (-open_rank, -state.last_seen, state.patient_id)
+        if sort == 'staleness':
+            return (state.last_seen, state.patient_id)
+        if sort == 'heart_rate':
+            return (-(state.last_reading['heart_rate'] if state.last_reading else 0), state.patient_id)
+        return (state.patient_id,)
+
+    def roster(self, now, sort='severity', status=None, cursor=None, limit=50):
+        """One page of patients as (items, next_cursor, summary)"""
+        if sort not in SORT_ORDERS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_ORDERS)}")
+        after = decode_cursor(cursor, sort) if cursor else None
+        with self._lock:
+            states = list(self._patients.values())
+            summary = self._summary(states, now)
+        keyed = []
+        for state in states:
+            if status is not None and (state.alert_open(now, self.open_seconds)) != (status == 'critical'):
+                continue
+            key = self._sort_key(state, sort, now)
+            if after is None or key > after:
+                keyed.append((key, state))
+        page = heapq.nsmallest(limit + 1, keyed, key=lambda item: item[0])
+        more = len(page) > limit
+        page = page[:limit]
+        with self._lock:
+            items = [state.to_dict(now, self.open_seconds, self.stale_seconds) for _, state in page]
+        return items, encode_cursor(sort, page[-1][0]) if more else None, summary
+
+    def _summary(self, states, now):
+        latest = [state.last_reading['heart_rate'] for state in states if state.last_reading]
+        return {
+            'patients': len(states),
+            'critical': sum(1 for state in states if state.alert_open(now, self.open_seconds)),
+            'stale': sum(1 for state in states if now - state.last_seen > self.stale_seconds),
+            'readings': sum(state.readings for state in states),
+            'critical_readings': sum(state.critical_readings for state in states),
+            'mean_heart_rate': round(sum(latest) / len(latest), 1) if latest else None
+        }
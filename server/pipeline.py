@@ -0,0 +1,214 @@
+"""Asynchronous side-effect pipeline: bounded queues drained by worker threads"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+
+POLICIES = ('drop_newest', 'drop_oldest', 'spill')
+
+logger = logging.getLogger('health_monitor.pipeline')
+
+
+class IngestPipeline:
+    """Runs registered handlers for ingest events off the request thread.
+
+    Events are sharded across workers by key (the patient ID), so events for
+    one patient are handled in order. Each worker has a bounded queue; when it
+    is full the overflow policy decides what happens to the event:
+
+    - ``drop_newest``: discard the new event
+    - ``drop_oldest``: discard the oldest queued event to make room
+    - ``spill``: append the event to a JSON-lines spill file instead, which
+      is fed back through the queues once they drain (and on the next start)
+
+    Event types registered as ``reliable`` (persistence, alert fan-out) have
+    their own queues and workers and are never dropped: when their queue is
+    full, submit() blocks until there is room.
+    """
+
+    def __init__(self, workers=2, max_queue=10000, policy='drop_oldest', spill_path=None):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+        if policy == 'spill' and not spill_path:
+            raise ValueError("spill policy needs a spill_path")
+        self.policy = policy
+        self.spill_path = spill_path
+        if policy == 'spill':
+            os.makedirs(os.path.dirname(os.path.abspath(spill_path)), exist_ok=True)
+        self._handlers = {}
+        self._reliable = set()
+        self._queues = [queue.Queue(maxsize=max_queue) for _ in range(workers)]
+        self._reliable_queues = [queue.Queue(maxsize=max_queue) for _ in range(workers)]
+        self._spill_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._spill_pending = False
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.blocked = 0
+        self.handler_errors = 0
+        self.max_depth = 0
+        self.handler_seconds = 0.0
+        self._workers = []
+        for name, queues in (('worker', self._queues), ('reliable', self._reliable_queues)):
+            for index, pending in enumerate(queues):
+                worker = threading.Thread(target=self._run, args=(pending, queues is self._queues),
+                                          name=f'ingest-{name}-{index}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def register(self, event_type, handler, reliable=False):
+        """Call handler(payload) for every submitted event of this type.
+
+        Reliable event types are never dropped or spilled; their submit() may block.
+        """
+        self._handlers.setdefault(event_type, []).append(handler)
+        if reliable:
+            self._reliable.add(event_type)
+
+    def submit(self, event_type, payload, key=None):
+        """Enqueue an event; returns False if it was not queued.
+
+        Only blocks for reliable event types, and only while their queue is full.
+        """
+        shard = zlib.crc32(str(key).encode())
+        item = (event_type, payload, key)
+        if event_type in self._reliable:
+            pending = self._reliable_queues[shard % len(self._reliable_queues)]
+            try:
+                pending.put_nowait(item)
+            except queue.Full:
+                self._count('blocked')
+                pending.put(item)
+        else:
+            pending = self._queues[shard % len(self._queues)]
+            try:
+                pending.put_nowait(item)
+            except queue.Full:
+                if not self._overflow(pending, item):
+                    return False
+        with self._stats_lock:
+            self.enqueued += 1
+            depth = pending.qsize()
+            if depth > self.max_depth:
+                self.max_depth = depth
+        return True
+
+    def backlogged(self):
+        """True once a reliable queue is half full, i.e. a submit() may soon block.
+
+        Callers that must not block (an event loop) hand their work to a thread
+        from then on; the other half absorbs what is submitted in the meantime.
+        """
+        return any(pending.qsize() * 2 >= pending.maxsize for pending in self._reliable_queues)
+
+    def _overflow(self, pending, item):
+        if self.policy == 'drop_oldest':
+            try:
+                pending.get_nowait()
+                pending.task_done()
+                self._count('dropped')
+            except queue.Empty:
+                pass
+            try:
+                pending.put_nowait(item)
+                return True
+            except queue.Full:
+                pass
+        elif self.policy == 'spill':
+            line = json.dumps({'event': item[0], 'payload': item[1], 'key': item[2], 'spilled_at': time.time()},
+                              default=str)
+            with self._spill_lock:
+                with open(self.spill_path, 'a') as spill:
+                    spill.write(line + '\n')
+                self._spill_pending = True
+            self._count('spilled')
+            return False
+        self._count('dropped')
+        return False
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def replay_spill(self):
+        """Resubmit the events in the spill file (from this run or a previous one); returns how many"""
+        if not self.spill_path or not self._replay_lock.acquire(blocking=False):
+            return 0
+        try:
+            # Events spilled while replaying go to a new file, picked up by the next replay
+            replaying = self.spill_path + '.replay'
+            with self._spill_lock:
+                self._spill_pending = False
+                if not os.path.exists(replaying):
+                    try:
+                        os.replace(self.spill_path, replaying)
+                    except FileNotFoundError:
+                        return 0
+            count = 0
+            with open(replaying) as spill:
+                for line in spill:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # Torn last line of a crash
+                        continue
+                    self.submit(event['event'], event['payload'], event.get('key'))
+                    count += 1
+            os.remove(replaying)
+            self._count('replayed', count)
+            return count
+        finally:
+            self._replay_lock.release()
+
+    def _run(self, pending, droppable):
+        while True:
+            event_type, payload, _ = pending.get()
+            started = time.perf_counter()
+            for handler in self._handlers.get(event_type, ()):
+                try:
+                    handler(payload)
+                except Exception:
+                    self._count('handler_errors')
+                    logger.exception("Handler for %s event failed", event_type)
+            elapsed = time.perf_counter() - started
+            with self._stats_lock:
+                self.processed += 1
+                self.handler_seconds += elapsed
+            pending.task_done()
+            # Spilled events go back once every queue they could overflow again has drained
+            if droppable and self._spill_pending and all(shard.empty() for shard in self._queues):
+                try:
+                    self.replay_spill()
+                except Exception:
+                    logger.exception("Replaying the spill file failed")
+
+    def join(self):
+        """Wait until every queued event has been handled"""
+        for pending in self._queues + self._reliable_queues:
+            pending.join()
+
+    def metrics(self):
+        with self._stats_lock:
+            return {
+                "workers": len(self._queues),
+                "policy": self.policy,
+                "queue_depth": sum(pending.qsize() for pending in self._queues),
+                "queue_capacity": sum(pending.maxsize for pending in self._queues),
+                "reliable_queue_depth": sum(pending.qsize() for pending in self._reliable_queues),
+                "max_depth": self.max_depth,
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "spilled": self.spilled,
+                "replayed": self.replayed,
+                "blocked": self.blocked,
+                "handler_errors": self.handler_errors,
+                "mean_handler_ms": round(self.handler_seconds / self.processed * 1000, 4) if self.processed else None
+            }
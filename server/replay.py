@@ -0,0 +1,214 @@
+"""Replay a request capture (see capture.py) into the ingest path.
+
+Usage:
+    python replay.py CAPTURE [CAPTURE ...] [--speed 1|N|max] [--target http://host:5000]
+
+Requests are sent with their recorded spacing divided by ``--speed``
+(``max`` sends them back to back). Without ``--target`` they run in-process
+through ingest_update()/ingest_batch(), with a fresh in-memory store and no
+notification sink (nothing is paged) or spill file of its own, so a
+production capture can be profiled (``--profile``) and debugged locally;
+with ``--target`` they are posted over HTTP to a running server, Flask or
+async_ingest.py. Per-worker captures (``worker-<pid>`` subdirectories) are
+merged by timestamp.
+"""
+import argparse
+import asyncio
+import cProfile
+import datetime
+import heapq
+import json
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+from capture import list_captures, read_capture
+
+
+def capture_sources(path):
+    """Segment lists of a capture: one per recording worker"""
+    if os.path.isdir(path):
+        workers = sorted(name for name in os.listdir(path) if name.startswith('worker-'))
+        if workers:
+            return [list_captures(os.path.join(path, name)) for name in workers]
+    return [list_captures(path)]
+
+
+def iter_requests(paths, limit=None):
+    """Captured requests of every path, merged in timestamp order"""
+    sources = [read_capture(segments) for path in paths for segments in capture_sources(path)]
+    for count, captured in enumerate(heapq.merge(*sources, key=lambda request: request[0])):
+        if limit is not None and count >= limit:
+            return
+        yield captured
+
+
+class Pacer:
+    """Holds each request back until its recorded offset, scaled by ``speed`` (None for max)"""
+
+    def __init__(self, speed):
+        self.speed = speed
+        self.first = self.last = None
+        self.started = None
+        self.max_lateness = 0.0
+
+    def due(self, timestamp):
+        """Seconds to wait before sending a request recorded at ``timestamp``"""
+        now = time.perf_counter()
+        if self.first is None:
+            self.first, self.started = timestamp, now
+        self.last = timestamp
+        if self.speed is None:
+            return 0.0
+        delay = self.started + (timestamp - self.first) / self.speed - now
+        self.max_lateness = max(self.max_lateness, -delay)
+        return max(delay, 0.0)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))] * 1000, 3)
+
+
+def replay_in_process(requests, pacer, live_time):
+    """Feed requests to the ingest functions of this process; returns (statuses, latencies)"""
+    import app
+    handlers = {'/update': app.ingest_update, '/update/batch': app.ingest_batch}
+    statuses, latencies = {}, []
+    for timestamp, route, authorization, content_type, body in requests:
+        delay = pacer.due(timestamp)
+        if delay:
+            time.sleep(delay)
+        headers = {name: value for name, value in (('Authorization', authorization),
+                                                   ('Content-Type', content_type)) if value is not None}
+        current_time = None if live_time else datetime.datetime.fromtimestamp(timestamp)
+        started = time.perf_counter()
+        _, status, _ = handlers[route](body, headers, '127.0.0.1', current_time)
+        latencies.append(time.perf_counter() - started)
+        statuses[status] = statuses.get(status, 0) + 1
+    app.pipeline.join()
+    return statuses, latencies
+
+
+async def post(host, port, route, authorization, content_type, body):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        head = [f"POST {route} HTTP/1.1", f"Host: {host}:{port}", f"Content-Length: {len(body)}",
+                "Connection: close"]
+        if authorization is not None:
+            head.append(f"Authorization: {authorization}")
+        if content_type is not None:
+            head.append(f"Content-Type: {content_type}")
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':', 1)[1])
+        await reader.readexactly(length)
+        return status
+    finally:
+        writer.close()
+
+
+async def replay_http(requests, pacer, target, concurrency):
+    """Post requests to ``target``, at most ``concurrency`` in flight; returns (statuses, latencies)"""
+    url = urlsplit(target)
+    host, port = url.hostname, url.port or 80
+    statuses, latencies = {}, []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def send(route, authorization, content_type, body):
+        started = time.perf_counter()
+        try:
+            status = await post(host, port, route, authorization, content_type, body)
+            latencies.append(time.perf_counter() - started)
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+            status = 'error'
+        finally:
+            slots.release()
+        statuses[status] = statuses.get(status, 0) + 1
+
+    pending = set()
+    for timestamp, route, authorization, content_type, body in requests:
+        delay = pacer.due(timestamp)
+        if delay:
+            await asyncio.sleep(delay)
+        await slots.acquire()
+        task = asyncio.ensure_future(send(route, authorization, content_type, body))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.wait(pending)
+    return statuses, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('captures', nargs='+', help="capture directories or segment files")
+    parser.add_argument('--speed', default='1', help="playback speed multiplier, or 'max'")
+    parser.add_argument('--target', help="base URL of a running server (default: replay in-process)")
+    parser.add_argument('--limit', type=int, help="replay at most this many requests")
+    parser.add_argument('--concurrency', type=int, default=256, help="requests in flight over HTTP")
+    parser.add_argument('--live-time', action='store_true',
+                        help="in-process: stamp readings with the replay time instead of the captured time")
+    parser.add_argument('--profile', help="in-process: write cProfile stats of the replay to this file")
+    args = parser.parse_args()
+
+    speed = None if args.speed == 'max' else float(args.speed)
+    if speed is not None and speed <= 0:
+        parser.error("--speed must be positive or 'max'")
+    pacer = Pacer(speed)
+    requests = iter_requests(args.captures, args.limit)
+    if not args.target:
+        # A scratch instance: no telemetry log, no recording of the replay itself, no real
+        # pages for the alerts it raises, and a spill file of its own rather than the server's
+        os.environ['TELEMETRY_LOG_DIR'] = ''
+        os.environ.setdefault('LOG_LEVEL', 'ERROR')
+        os.environ.pop('CAPTURE_DIR', None)
+        os.environ.pop('HEALTH_STORE_ADDRESS', None)
+        os.environ.pop('NOTIFY_WEBHOOK_URL', None)
+        os.environ['INGEST_SPILL_PATH'] = os.path.join(tempfile.mkdtemp(prefix='replay-'), 'ingest-spill.jsonl')
+        import app
+    started = time.perf_counter()
+    if args.target:
+        statuses, latencies = asyncio.run(replay_http(requests, pacer, args.target, args.concurrency))
+        pipeline = None
+    else:
+        profiler = cProfile.Profile() if args.profile else None
+        if profiler:
+            profiler.enable()
+        statuses, latencies = replay_in_process(requests, pacer, args.live_time)
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        pipeline = app.pipeline.metrics()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    count = sum(statuses.values())
+    report = {
+        "requests": count,
+        "elapsed_s": round(elapsed, 3),
+        "capture_span_s": round(pacer.last - pacer.first, 3) if count else 0.0,
+        "speed": args.speed,
+        "achieved_rps": round(count / elapsed, 1) if elapsed else None,
+        "max_lateness_ms": round(pacer.max_lateness * 1000, 3),
+        "statuses": {str(status): total for status, total in sorted(statuses.items(), key=str)},
+        "latency_ms": {name: percentile(latencies, fraction)
+                       for name, fraction in (('p50', 0.5), ('p99', 0.99), ('p999', 0.999))}
+    }
+    if pipeline is not None:
+        report["pipeline"] = pipeline
+    print(json.dumps(report, indent=2))
+    return 1 if 'error' in statuses else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
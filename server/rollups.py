@@ -0,0 +1,126 @@
+"""Incremental per-patient heart-rate rollups and chart downsampling"""
+import threading
+from collections import deque
+
+# Resolution name -> (bucket width in seconds, buckets kept per patient)
+RESOLUTIONS = {
+    '1m': (60, 24 * 60),
+    '15m': (15 * 60, 7 * 24 * 4),
+    '1h': (60 * 60, 90 * 24),
+}
+
+
+class Bucket:
+    """Aggregate of the readings in one time bucket"""
+    __slots__ = ('start', 'count', 'hr_sum', 'hr_min', 'hr_max', 'falls')
+
+    def __init__(self, start):
+        self.start = start
+        self.count = 0
+        self.hr_sum = 0
+        self.hr_min = None
+        self.hr_max = None
+        self.falls = 0
+
+    def add(self, heart_rate, fall):
+        self.count += 1
+        self.hr_sum += heart_rate
+        self.hr_min = heart_rate if self.hr_min is None else min(self.hr_min, heart_rate)
+        self.hr_max = heart_rate if self.hr_max is None else max(self.hr_max, heart_rate)
+        if fall:
+            self.falls += 1
+
+    def to_dict(self):
+        return {
+            'start': self.start,
+            'count': self.count,
+            'hr_min': self.hr_min,
+            'hr_max': self.hr_max,
+            'hr_mean': round(self.hr_sum / self.count, 2) if self.count else None,
+            'falls': self.falls
+        }
+
+
+class RollupEngine:
+    """Maintains bounded rollup series per patient, updated in O(1) per reading"""
+
+    def __init__(self, resolutions=RESOLUTIONS):
+        self.resolutions = resolutions
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def add(self, patient_id, epoch_seconds, heart_rate, fall):
+        with self._lock:
+            series = self._series.get(patient_id)
+            if series is None:
+                series = self._series[patient_id] = {
+                    name: deque(maxlen=keep) for name, (_, keep) in self.resolutions.items()
+                }
+            for name, (width, _) in self.resolutions.items():
+                buckets = series[name]
+                start = int(epoch_seconds // width * width)
+                if buckets and buckets[-1].start == start:
+                    buckets[-1].add(heart_rate, fall)
+                elif not buckets or buckets[-1].start < start:
+                    bucket = Bucket(start)
+                    bucket.add(heart_rate, fall)
+                    buckets.append(bucket)
+                # Readings older than the newest bucket are late arrivals and are dropped
+
+    def series(self, patient_id, resolution, start=None, end=None, max_points=None):
+        """Return bucket dicts in [start, end), coarsened to at most max_points"""
+        with self._lock:
+            buckets = list(self._series.get(patient_id, {}).get(resolution, ()))
+        points = [bucket.to_dict() for bucket in buckets
+                  if (start is None or bucket.start >= start) and (end is None or bucket.start < end)]
+        if max_points and len(points) > max_points:
+            points = merge_buckets(points, max_points)
+        return points
+
+
+def merge_buckets(points, max_points):
+    """Combine adjacent rollup buckets so at most max_points remain"""
+    group = -(-len(points) // max_points)
+    merged = []
+    for index in range(0, len(points), group):
+        chunk = points[index:index + group]
+        count = sum(point['count'] for point in chunk)
+        merged.append({
+            'start': chunk[0]['start'],
+            'count': count,
+            'hr_min': min(point['hr_min'] for point in chunk),
+            'hr_max': max(point['hr_max'] for point in chunk),
+            'hr_mean': round(sum(point['hr_mean'] * point['count'] for point in chunk) / count, 2),
+            'falls': sum(point['falls'] for point in chunk)
+        })
+    return merged
+
+
+def lttb(points, threshold, x='x', y='y'):
+    """Largest-Triangle-Three-Buckets downsampling of dict points"""
+    length = len(points)
+    if threshold >= length or threshold < 3:
+        return list(points)
+    sampled = [points[0]]
+    every = (length - 2) / (threshold - 2)
+    selected = 0
+    for bucket in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        next_start = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, length)
+        next_points = points[next_start:next_end]
+        avg_x = sum(point[x] for point in next_points) / len(next_points)
+        avg_y = sum(point[y] for point in next_points) / len(next_points)
+
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        ax, ay = points[selected][x], points[selected][y]
+        best_area, best_index = -1.0, start
+        for index in range(start, end):
+            area = abs((ax - avg_x) * (points[index][y] - ay) - (ax - points[index][x]) * (avg_y - ay))
+            if area > best_area:
+                best_area, best_index = area, index
+        sampled.append(points[best_index])
+        selected = best_index
+    sampled.append(points[-1])
+    return sampled
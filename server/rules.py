@@ -0,0 +1,234 @@
+"""Streaming per-patient anomaly rules, declared in config and compiled once"""
+import json
+import math
+import time
+from collections import deque
+
+DEFAULT_RULES = [
+    {
+        "name": "fall_high_hr",
+        "type": "fall_with_high_hr",
+        "threshold": 100,
+        "alert_type": "CRITICAL",
+        "severity": "HIGH",
+        "message": "Fall detected with elevated heart rate ({heart_rate} BPM)"
+    }
+]
+
+
+class Rule:
+    """A compiled rule: per-patient state factory plus an evaluate function"""
+    __slots__ = ('name', 'kind', 'alert_type', 'severity', 'message', 'new_state', 'evaluate')
+
+    def __init__(self, spec, new_state, evaluate):
+        self.name = spec['name']
+        self.kind = spec.get('type')
+        self.alert_type = spec.get('alert_type', spec['name'].upper())
+        self.severity = spec.get('severity', 'MEDIUM')
+        self.message = spec.get('message', spec['name'].replace('_', ' '))
+        self.new_state = new_state
+        self.evaluate = evaluate
+
+    def describe(self, heart_rate, fall):
+        return self.message.format(heart_rate=heart_rate, fall=fall)
+
+
+def _fall_with_high_hr(spec):
+    threshold = spec.get('threshold', 100)
+
+    def evaluate(state, heart_rate, fall, now):
+        return fall == 1 and heart_rate > threshold
+    return None, evaluate
+
+
+def _sustained_above(spec):
+    """Heart rate above threshold for N consecutive readings (fires on every reading while that lasts)"""
+    threshold = spec.get('threshold', 120)
+    readings = spec.get('readings', 6)
+
+    def new_state():
+        return [0]
+
+    def evaluate(state, heart_rate, fall, now):
+        # Capped so the count stays small however long the episode lasts
+        state[0] = min(state[0] + 1, readings) if heart_rate > threshold else 0
+        return state[0] >= readings
+    return new_state, evaluate
+
+
+def _ewma_deviation(spec):
+    """Heart rate more than `sigmas` standard deviations from the patient's EWMA baseline.
+
+    Anomalous readings still move the baseline, with the smaller weight
+    `anomaly_alpha`: a single outlier barely shifts it, while a lasting
+    change of baseline is learned and the rule stops firing.
+    """
+    alpha = spec.get('alpha', 0.1)
+    anomaly_alpha = spec.get('anomaly_alpha', alpha / 10)
+    sigmas = spec.get('sigmas', 4.0)
+    warmup = spec.get('warmup', 20)
+    min_std = spec.get('min_std', 3.0)
+
+    def new_state():
+        # count, mean, variance
+        return [0, 0.0, 0.0]
+
+    def evaluate(state, heart_rate, fall, now):
+        count, mean, variance = state
+        if count == 0:
+            state[0], state[1] = 1, float(heart_rate)
+            return False
+        deviation = heart_rate - mean
+        anomalous = count >= warmup and abs(deviation) > sigmas * max(math.sqrt(variance), min_std)
+        weight = anomaly_alpha if anomalous else alpha
+        state[1] = mean + weight * deviation
+        state[2] = (1 - weight) * (variance + weight * deviation * deviation)
+        state[0] = count + 1
+        return anomalous
+    return new_state, evaluate
+
+
+def _repeated_falls(spec):
+    """At least `count` falls within `window_seconds` (fires on every reading until the window has passed)"""
+    count = spec.get('count', 3)
+    window = spec.get('window_seconds', 600)
+
+    def new_state():
+        return deque()
+
+    def evaluate(state, heart_rate, fall, now):
+        if fall == 1:
+            state.append(now)
+        # Trimmed here rather than by maxlen, so the state survives a change of `count`
+        while len(state) > count:
+            state.popleft()
+        return len(state) == count and now - state[0] <= window
+    return new_state, evaluate
+
+
+RULE_TYPES = {
+    'fall_with_high_hr': _fall_with_high_hr,
+    'sustained_above': _sustained_above,
+    'ewma_deviation': _ewma_deviation,
+    'repeated_falls': _repeated_falls,
+}
+
+# Parameters each rule type reads, the ones overrides may set (besides `enabled`)
+RULE_PARAMS = {
+    'fall_with_high_hr': ('threshold',),
+    'sustained_above': ('threshold', 'readings'),
+    'ewma_deviation': ('alpha', 'anomaly_alpha', 'sigmas', 'warmup', 'min_std'),
+    'repeated_falls': ('count', 'window_seconds'),
+}
+
+
+def compile_rules(specs):
+    rules = []
+    for spec in specs:
+        if spec.get('enabled', True) is False:
+            continue
+        factory = RULE_TYPES.get(spec.get('type'))
+        if factory is None:
+            raise ValueError(f"unknown rule type {spec.get('type')!r} in rule {spec.get('name')!r}")
+        new_state, evaluate = factory(spec)
+        rules.append(Rule(spec, new_state, evaluate))
+    return rules
+
+
+def apply_overrides(specs, overrides):
+    """Rule specs with parameters replaced from {rule name: {parameter: value}}"""
+    types = {spec['name']: spec.get('type') for spec in specs}
+    unknown = set(overrides) - set(types)
+    if unknown:
+        raise ValueError(f"no rule named {', '.join(sorted(unknown))}")
+    for name, params in overrides.items():
+        allowed = RULE_PARAMS.get(types[name], ())
+        unknown = set(params) - set(allowed) - {'enabled'}
+        if unknown:
+            raise ValueError(f"rule {name} ({types[name]}) has no parameter {', '.join(sorted(unknown))}; "
+                             f"it takes {', '.join(allowed + ('enabled',))}")
+    return [{**spec, **overrides.get(spec['name'], {})} for spec in specs]
+
+
+def load_rule_specs(path):
+    with open(path) as config:
+        return json.load(config)['rules']
+
+
+class RuleEngine:
+    """Evaluates every compiled rule against each reading, with O(1) state per patient and rule.
+
+    Parameters can be overridden for all patients or per patient (configure());
+    the compiled rule sets are swapped in as one tuple, so evaluate() never
+    takes a lock and a reading sees either the old thresholds or the new ones.
+    """
+
+    def __init__(self, specs=None, budget_us=50.0):
+        self.specs = DEFAULT_RULES if specs is None else specs
+        self.budget_us = budget_us
+        self.evaluations = 0
+        self.total_seconds = 0.0
+        self.over_budget = 0
+        self._states = {}
+        self._rule_sets = (compile_rules(self.specs), {})
+
+    @property
+    def rules(self):
+        """The rules of patients without overrides"""
+        return self._rule_sets[0]
+
+    def configure(self, overrides=None, patient_overrides=None):
+        """Recompile with ``overrides`` for everyone and ``patient_overrides`` ({patient: overrides}) on top.
+
+        Raises ValueError (and changes nothing) for an unknown rule or rule type.
+        """
+        specs = apply_overrides(self.specs, overrides or {})
+        rules = compile_rules(specs)
+        # Patients with the same overrides (a cohort) share one compiled rule set
+        compiled = {}
+        patient_rules = {}
+        for patient_id, patient_specs in (patient_overrides or {}).items():
+            key = json.dumps(patient_specs, sort_keys=True)
+            if key not in compiled:
+                compiled[key] = compile_rules(apply_overrides(specs, patient_specs))
+            patient_rules[patient_id] = compiled[key]
+        self._rule_sets = (rules, patient_rules)
+
+    def _patient_states(self, patient_id, rules):
+        entry = self._states.get(patient_id)
+        if entry is None or entry[0] is not rules:
+            # New patient or reconfigured: keep the state of every rule that is still there
+            previous = {(rule.name, rule.kind): state for rule, state in zip(*entry)} if entry else {}
+            entry = self._states[patient_id] = (rules, [
+                previous.get((rule.name, rule.kind), rule.new_state() if rule.new_state else None)
+                for rule in rules
+            ])
+        return entry[1]
+
+    def evaluate(self, patient_id, heart_rate, fall, now=None):
+        """Return the rules that fire for this reading"""
+        started = time.perf_counter()
+        if now is None:
+            now = time.time()
+        rules, patient_rules = self._rule_sets
+        if patient_rules:
+            rules = patient_rules.get(patient_id, rules)
+        states = self._patient_states(patient_id, rules)
+        fired = [rule for rule, state in zip(rules, states) if rule.evaluate(state, heart_rate, fall, now)]
+        elapsed = time.perf_counter() - started
+        self.evaluations += 1
+        self.total_seconds += elapsed
+        if elapsed * 1e6 > self.budget_us:
+            self.over_budget += 1
+        return fired
+
+    def stats(self):
+        return {
+            "rules": [rule.name for rule in self.rules],
+            "patients": len(self._states),
+            "patient_overrides": len(self._rule_sets[1]),
+            "evaluations": self.evaluations,
+            "mean_us": round(self.total_seconds / self.evaluations * 1e6, 3) if self.evaluations else None,
+            "budget_us": self.budget_us,
+            "over_budget": self.over_budget
+        }
@@ -0,0 +1,254 @@
+"""Settings that can change at runtime: retention sizes, alert thresholds and verbose logging.
+
+The JSON file (RUNTIME_CONFIG) looks like::
+
+    {
+      "retention": {"readings_per_patient": 200, "alerts_max_records": 20000},
+      "thresholds": {"fall_high_hr": {"threshold": 100}},
+      "cohorts": {"cardiac": {"thresholds": {"sustained_tachycardia": {"threshold": 110}}}},
+      "patients": {"P001": {"cohort": "cardiac", "thresholds": {"fall_high_hr": {"threshold": 90}}}},
+      "verbose_logging": false
+    }
+
+``thresholds`` override rule parameters (rules.json) by rule name; a
+patient's own thresholds beat its cohort's, which beat the global ones.
+Anything left out keeps its default.
+
+The active settings are an immutable Settings snapshot in
+``RuntimeConfig.current``. Readers take that one reference without a lock; a
+reload builds and applies a complete new snapshot, then swaps the reference,
+so nobody sees half a change. The file is polled for changes, and updates
+made through the admin endpoint are written back to it (atomically), so
+every worker process converges on the same settings.
+"""
+import copy
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('health_monitor.config')
+
+RETENTION_KEYS = ('raw_per_device', 'raw_max_records', 'readings_per_patient', 'readings_max_records',
+                  'alerts_per_patient', 'alerts_max_records')
+SECTIONS = ('retention', 'thresholds', 'cohorts', 'patients', 'verbose_logging')
+
+
+def merge(base, changes):
+    """``changes`` merged into a copy of ``base``, recursing into objects; a null value removes the key"""
+    merged = copy.deepcopy(base)
+    for key, value in changes.items():
+        if value is None:
+            merged.pop(key, None)
+        elif isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def _check_thresholds(thresholds, where):
+    """Rule parameters must be numbers (``enabled`` a boolean): they are compared on every reading"""
+    if not isinstance(thresholds, dict):
+        raise ValueError(f"{where} must map rule names to {{parameter: value}} objects")
+    for rule, params in thresholds.items():
+        if not isinstance(params, dict):
+            raise ValueError(f"{where}.{rule} must be a {{parameter: value}} object")
+        for name, value in params.items():
+            valid = isinstance(value, bool) if name == 'enabled' else \
+                isinstance(value, (int, float)) and not isinstance(value, bool)
+            if not valid:
+                raise ValueError(f"{where}.{rule}.{name} must be {'true or false' if name == 'enabled' else 'a number'}")
+    return thresholds
+
+
+class Settings:
+    """One validated, read-only version of the runtime settings"""
+    __slots__ = ('version', 'loaded_at', 'retention', 'thresholds', 'cohorts', 'patients', 'verbose_logging',
+                 'patient_thresholds', 'raw')
+
+    def __init__(self, raw, defaults, version=0):
+        if not isinstance(raw, dict):
+            raise ValueError("runtime config must be a JSON object")
+        unknown = set(raw) - set(SECTIONS)
+        if unknown:
+            raise ValueError(f"unknown setting {', '.join(sorted(unknown))}")
+        for section in ('retention', 'thresholds', 'cohorts', 'patients'):
+            if not isinstance(raw.get(section, {}), dict):
+                raise ValueError(f"{section} must be an object")
+        for section in ('cohorts', 'patients'):
+            for name, entry in raw.get(section, {}).items():
+                if not isinstance(entry, dict):
+                    raise ValueError(f"{section}.{name} must be an object")
+        retention = {**defaults, **raw.get('retention', {})}
+        for key, value in retention.items():
+            if key not in RETENTION_KEYS:
+                raise ValueError(f"unknown retention setting {key}")
+            if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+                raise ValueError(f"retention.{key} must be a positive integer")
+        thresholds = _check_thresholds(raw.get('thresholds', {}), 'thresholds')
+        cohorts = raw.get('cohorts', {})
+        patients = raw.get('patients', {})
+        for name, cohort in cohorts.items():
+            _check_thresholds(cohort.get('thresholds', {}), f"cohorts.{name}.thresholds")
+        # Each patient's cohort and own overrides combined once here instead of per reading
+        patient_thresholds = {}
+        for patient_id, patient in patients.items():
+            cohort_name = patient.get('cohort')
+            if cohort_name is not None and cohort_name not in cohorts:
+                raise ValueError(f"patient {patient_id} is in unknown cohort {cohort_name}")
+            cohort = cohorts.get(cohort_name, {})
+            combined = merge(cohort.get('thresholds', {}),
+                             _check_thresholds(patient.get('thresholds', {}), f"patients.{patient_id}.thresholds"))
+            if combined:
+                patient_thresholds[patient_id] = combined
+        if not isinstance(raw.get('verbose_logging', False), bool):
+            raise ValueError("verbose_logging must be true or false")
+        self.version = version
+        self.loaded_at = time.time()
+        self.retention = retention
+        self.thresholds = thresholds
+        self.cohorts = cohorts
+        self.patients = patients
+        self.verbose_logging = raw.get('verbose_logging', False)
+        self.patient_thresholds = patient_thresholds
+        self.raw = raw
+
+    def to_dict(self):
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "retention": self.retention,
+            "thresholds": self.thresholds,
+            "cohorts": self.cohorts,
+            "patients": self.patients,
+            "verbose_logging": self.verbose_logging
+        }
+
+
+class RuntimeConfig:
+    """The current Settings, reloaded from ``path`` and updated through update().
+
+    ``apply(settings, previous)`` puts a new version into effect before it
+    becomes ``current``; if it raises ValueError the version is rejected and
+    the previous one stays. Reloads and updates are serialised; reads are not.
+    """
+
+    def __init__(self, path, defaults, apply=None, poll_interval=2.0):
+        self.path = path
+        self.defaults = defaults
+        self.apply = apply
+        self.poll_interval = poll_interval
+        self.reloads = 0
+        self.rejected = 0
+        self.last_error = None
+        self.current = Settings({}, defaults)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._stop = threading.Event()
+        self._thread = None
+        if path and os.path.exists(path):
+            try:
+                self.reload()
+            except ValueError as e:
+                # Start on the defaults; the watcher picks up a corrected file
+                logger.error("runtime config %s rejected, using defaults: %s", path, e)
+
+    def _read(self):
+        try:
+            with open(self.path) as config:
+                return json.load(config)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{self.path}: {e}")
+
+    def _install(self, raw):
+        """Validate, apply and publish ``raw``; caller holds the lock"""
+        previous = self.current
+        try:
+            settings = Settings(raw, self.defaults, previous.version + 1)
+            if self.apply is not None:
+                self.apply(settings, previous)
+        except ValueError as e:
+            self.rejected += 1
+            self.last_error = str(e)
+            raise
+        self.current = settings
+        self.reloads += 1
+        self.last_error = None
+        return settings
+
+    def reload(self):
+        """Re-read the file; raises ValueError (keeping the current settings) if it is invalid"""
+        with self._lock:
+            self._mtime = self._file_mtime()
+            try:
+                raw = self._read()
+            except ValueError as e:
+                self.rejected += 1
+                self.last_error = str(e)
+                raise
+            return self._install(raw)
+
+    def update(self, changes):
+        """Merge ``changes`` into the settings, apply them and write them to the file"""
+        with self._lock:
+            # Based on the file, which another worker may have changed since the last poll;
+            # an unreadable file is replaced, starting from the settings in effect
+            try:
+                base = self._read() if self.path else self.current.raw
+            except ValueError:
+                base = self.current.raw
+            settings = self._install(merge(base, changes))
+            if self.path:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                temporary = f"{self.path}.{os.getpid()}.tmp"
+                with open(temporary, 'w') as config:
+                    json.dump(settings.raw, config, indent=2)
+                os.replace(temporary, self.path)
+                self._mtime = self._file_mtime()
+            return settings
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    def start(self):
+        """Poll the file for changes made by hand or by another worker"""
+        if self._thread is None and self.path:
+            self._thread = threading.Thread(target=self._run, name='config-watcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            if self._file_mtime() == self._mtime:
+                continue
+            try:
+                settings = self.reload()
+                logger.info("runtime config reloaded from %s (version %d)", self.path, settings.version)
+            except ValueError as e:
+                logger.error("runtime config %s rejected: %s", self.path, e)
+            except Exception:
+                logger.exception("runtime config reload failed")
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "version": self.current.version,
+            "loaded_at": self.current.loaded_at,
+            "reloads": self.reloads,
+            "rejected": self.rejected,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,341 @@
+"""Shared reading store for multi-process deployments.
+
+One broker process owns the per-patient ring buffers, the telemetry log
+(so there is a single writer), the offline-device detector and the alert
+incidents and notifications (so a condition seen by several workers is
+one incident and one page) and the rule engine (so the stateful rules see
+every reading of a patient, whichever worker received it); worker processes
+reach it over a local socket through ``RemoteStore``, which has the same
+interface as ``PatientStore``, ``RemoteRuleEngine``, and proxies of the
+IncidentTracker and notification stats.
+
+Start it standalone with ``python shared_store.py --address 127.0.0.1:50000``
+or from code with ``start_store_server()``. Connections are authenticated
+with HEALTH_STORE_AUTHKEY; start_store_server() generates a random key when
+it is unset and exports it, so child processes started afterwards (the
+broker, forked gunicorn workers) share it.
+"""
+import argparse
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+from multiprocessing.managers import BaseManager
+
+from alerts import IncidentTracker
+from heartbeat import OfflineDetector, offline_alert
+from notify import NotificationDispatcher, WebhookSink
+from rules import RuleEngine, compile_rules, load_rule_specs
+from store import PatientStore
+
+# How long a RemoteStore's size_hint() may be stale before it asks the broker again
+SIZE_HINT_TTL = 1.0
+# Rule definitions, the same file app.py reads
+RULES_CONFIG = os.environ.get('RULES_CONFIG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json'))
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class StoreService:
+    """Server-side wrapper returning only picklable values"""
+
+    def __init__(self, store, log=None, log_kind=None, heartbeats=None):
+        self._store = store
+        self._log = log
+        self._log_kind = log_kind
+        self._heartbeats = heartbeats
+
+    def append(self, record):
+        """Store a record; returns its seq and the new store size, saving the caller a len() round trip"""
+        self._store.append(record)
+        if self._log is not None:
+            self._log.append(self._log_kind, record)
+        if self._heartbeats is not None and record.get('device') is not None:
+            self._heartbeats.heartbeat(record['device'], record['patient_id'])
+        return record['seq'], len(self._store)
+
+    def size(self):
+        return len(self._store)
+
+    def state(self):
+        return len(self._store), self._store.last_seq, self._store.evictions
+
+    def keys(self):
+        return self._store.keys()
+
+    def records(self, key=None, since=None):
+        return list(self._store.iter_records(key, since))
+
+    def query(self, key=None, since=None, limit=None, start=None, end=None):
+        return list(self._store.query(key, since, limit, start, end))
+
+    def latest(self, key):
+        return self._store.latest(key)
+
+    def configure(self, per_key_capacity=None, max_records=None):
+        self._store.configure(per_key_capacity, max_records)
+
+
+class RemoteStore:
+    """Client-side stand-in for PatientStore backed by a StoreService proxy"""
+
+    def __init__(self, proxy):
+        self._proxy = proxy
+        self._size = 0
+        self._size_at = float('-inf')
+
+    def __len__(self):
+        return self._proxy.size()
+
+    def size_hint(self):
+        """Record count as of this process's last append (or at most SIZE_HINT_TTL seconds old)"""
+        if time.monotonic() - self._size_at > SIZE_HINT_TTL:
+            self._size, self._size_at = self._proxy.size(), time.monotonic()
+        return self._size
+
+    @property
+    def last_seq(self):
+        return self._proxy.state()[1]
+
+    @property
+    def evictions(self):
+        return self._proxy.state()[2]
+
+    @property
+    def version(self):
+        _, last_seq, evictions = self._proxy.state()
+        return f"{last_seq}-{evictions}"
+
+    def keys(self):
+        return self._proxy.keys()
+
+    def append(self, record):
+        record['seq'], self._size = self._proxy.append(record)
+        self._size_at = time.monotonic()
+        return record
+
+    def iter_records(self, key=None, since=None):
+        return iter(self._proxy.records(key, since))
+
+    def query(self, key=None, since=None, limit=None, start=None, end=None):
+        return iter(self._proxy.query(key, since, limit, start, end))
+
+    def latest(self, key):
+        return self._proxy.latest(key)
+
+    def configure(self, per_key_capacity=None, max_records=None):
+        self._proxy.configure(per_key_capacity, max_records)
+
+
+class IncidentService:
+    """Server-side wrapper of the broker's IncidentTracker; ``now`` stays on the broker's clock"""
+
+    def __init__(self, tracker):
+        self._tracker = tracker
+
+    def trigger(self, alert, sticky=False):
+        return self._tracker.trigger(alert, sticky)
+
+    def resolve(self, patient_id, rule, reason=None, device=None):
+        return self._tracker.resolve(patient_id, rule, reason, device)
+
+    def active(self):
+        return self._tracker.active()
+
+    def stats(self):
+        return self._tracker.stats()
+
+
+class RuleService:
+    """Server-side wrapper of the broker's RuleEngine; returns the names of the rules that fire"""
+
+    def __init__(self, engine):
+        self._engine = engine
+
+    def evaluate(self, patient_id, heart_rate, fall, now=None):
+        return [rule.name for rule in self._engine.evaluate(patient_id, heart_rate, fall, now)]
+
+    def configure(self, overrides=None, patient_overrides=None):
+        self._engine.configure(overrides, patient_overrides)
+
+    def stats(self):
+        return self._engine.stats()
+
+
+class RemoteRuleEngine:
+    """Client-side stand-in for RuleEngine: the broker keeps the per-patient state and evaluates.
+
+    Thresholds are overridden per patient, but a rule's name, alert type,
+    severity and message are not, so the fired names map back to local Rules.
+    """
+
+    def __init__(self, proxy, specs):
+        self._proxy = proxy
+        self.specs = specs
+        self.rules = compile_rules(specs)
+        # Rules disabled in the file can be enabled by an override
+        self._by_name = {rule.name: rule for rule in compile_rules([{**spec, 'enabled': True} for spec in specs])}
+
+    def evaluate(self, patient_id, heart_rate, fall, now=None):
+        return [self._by_name[name] for name in self._proxy.evaluate(patient_id, heart_rate, fall, now)]
+
+    def configure(self, overrides=None, patient_overrides=None):
+        self._proxy.configure(overrides, patient_overrides)
+
+    def stats(self):
+        return self._proxy.stats()
+
+
+class NotificationService:
+    def __init__(self, dispatcher):
+        self._dispatcher = dispatcher
+
+    def stats(self):
+        return self._dispatcher.stats()
+
+
+class StoreManager(BaseManager):
+    pass
+
+
+STORE_NAMES = ('readings', 'alerts', 'raw')
+SERVICE_NAMES = STORE_NAMES + ('incidents', 'notifications', 'rules')
+
+
+def notification_dispatcher():
+    """NotificationDispatcher configured from NOTIFY_* (NOTIFY_WEBHOOK_URL adds a webhook sink)"""
+    sinks = [WebhookSink(os.environ['NOTIFY_WEBHOOK_URL'])] if os.environ.get('NOTIFY_WEBHOOK_URL') else []
+    return NotificationDispatcher(
+        sinks,
+        rate=float(os.environ.get('NOTIFY_RATE', 1)),
+        burst=int(os.environ.get('NOTIFY_BURST', 10)),
+        max_queue=int(os.environ.get('NOTIFY_QUEUE_SIZE', 1000)),
+        max_attempts=int(os.environ.get('NOTIFY_MAX_ATTEMPTS', 5))
+    )
+
+
+def _serve(address, authkey, capacities, log_dir):
+    log = None
+    if log_dir:
+        from telemetry_log import TelemetryLog
+        log = TelemetryLog(log_dir)
+    stores = {
+        'readings': PatientStore(*capacities['readings']),
+        'alerts': PatientStore(*capacities['alerts']),
+        'raw': PatientStore(*capacities['raw'], key='auth_user', default_key='anonymous'),
+    }
+    if log is not None:
+        for kind, record in log.replay(int(os.environ.get('REPLAY_SEGMENTS', 4))):
+            stores['readings' if kind == 'reading' else 'alerts'].append(record)
+    # Incident transitions are stored (and logged) as alerts, which the workers relay to their
+    # dashboards, and notified from here, once, whichever worker saw the condition
+    notifications = notification_dispatcher()
+
+    def emit(record):
+        services['alerts'].append(record)
+        notifications.submit(record)
+    incidents = IncidentTracker(emit,
+                                resolve_after=float(os.environ.get('ALERT_RESOLVE_AFTER', 60)),
+                                escalate_after=float(os.environ.get('ALERT_ESCALATE_AFTER', 120)))
+    incidents.start()
+    # Every worker's readings arrive here, so this is the one place that can tell a device went quiet
+    detector = None
+    missed = int(os.environ.get('OFFLINE_AFTER_MISSED', 3))
+    if missed > 0:
+        interval = float(os.environ.get('REPORT_INTERVAL', 5))
+
+        def raise_offline_alert(device, last_seen, patient_id, silence):
+            incidents.trigger(offline_alert(patient_id, last_seen, device, silence, int(silence // interval)), sticky=True)
+
+        def resolve_offline_alert(device, patient_id, offline_seconds):
+            incidents.resolve(patient_id, 'device_offline',
+                              f"Device reporting again after {offline_seconds:.0f}s offline", device)
+
+        def retire_offline_device(device, patient_id, offline_seconds):
+            incidents.resolve(patient_id, 'device_offline',
+                              f"Device retired after {offline_seconds:.0f}s offline (no longer tracked)", device)
+        detector = OfflineDetector(raise_offline_alert, resolve_offline_alert, interval, missed,
+                                   on_retire=retire_offline_device,
+                                   retire_after=float(os.environ.get('OFFLINE_RETIRE_AFTER', 86400)))
+        detector.start()
+    rules = RuleEngine(load_rule_specs(RULES_CONFIG) if os.path.exists(RULES_CONFIG) else None,
+                       budget_us=float(os.environ.get('RULE_BUDGET_US', 50)))
+    services = {
+        'readings': StoreService(stores['readings'], log, 'reading', detector),
+        'alerts': StoreService(stores['alerts'], log, 'alert'),
+        'raw': StoreService(stores['raw']),
+        'incidents': IncidentService(incidents),
+        'notifications': NotificationService(notifications),
+        'rules': RuleService(rules),
+    }
+    for name in SERVICE_NAMES:
+        StoreManager.register(name, callable=lambda name=name: services[name])
+    manager = StoreManager(address=address, authkey=authkey.encode())
+    server = manager.get_server()
+    # Let SIGTERM unwind through serve_forever so the log's last group commit is flushed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        notifications.close()
+        if log is not None:
+            log.close()
+
+
+def start_store_server(address='127.0.0.1:50000', log_dir=None, env=None, timeout=10.0):
+    """Start the broker as a child process and wait until it accepts connections.
+
+    ``env`` overrides the retention variables (READINGS_PER_PATIENT, ...).
+    Without HEALTH_STORE_AUTHKEY a random key is generated and set in this
+    process's environment for the broker and later children to inherit.
+    """
+    if not os.environ.get('HEALTH_STORE_AUTHKEY'):
+        os.environ['HEALTH_STORE_AUTHKEY'] = secrets.token_hex(32)
+    command = [sys.executable, os.path.abspath(__file__), '--address', address]
+    if log_dir:
+        command += ['--log-dir', log_dir]
+    process = subprocess.Popen(command, env={**os.environ, **(env or {})})
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            connect(address)
+            return process
+        except (ConnectionError, OSError):
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.terminate()
+                raise RuntimeError(f"store server did not start on {address}")
+            time.sleep(0.05)
+
+
+def connect(address, authkey=None):
+    """Connect to a running broker; returns (readings, alerts, raw) RemoteStores and proxies of its
+    incident tracker (trigger/resolve/active/stats), notifications (stats) and rule engine (see RuleService)"""
+    authkey = authkey or os.environ.get('HEALTH_STORE_AUTHKEY')
+    if not authkey:
+        raise RuntimeError("HEALTH_STORE_AUTHKEY must be set to connect to the shared store")
+    for name in SERVICE_NAMES:
+        StoreManager.register(name)
+    manager = StoreManager(address=parse_address(address), authkey=authkey.encode())
+    manager.connect()
+    stores = tuple(RemoteStore(getattr(manager, name)()) for name in STORE_NAMES)
+    return stores + (manager.incidents(), manager.notifications(), manager.rules())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the shared reading store broker")
+    parser.add_argument('--address', default=os.environ.get('HEALTH_STORE_ADDRESS', '127.0.0.1:50000'))
+    parser.add_argument('--log-dir', default=os.environ.get('TELEMETRY_LOG_DIR') or None)
+    args = parser.parse_args()
+    if not os.environ.get('HEALTH_STORE_AUTHKEY'):
+        parser.error("set HEALTH_STORE_AUTHKEY to a random secret shared with the workers")
+    print(f"🗄️  Shared store listening on {args.address}", flush=True)
+    _serve(parse_address(args.address), os.environ['HEALTH_STORE_AUTHKEY'], {
+        'readings': (int(os.environ.get('READINGS_PER_PATIENT', 100)), int(os.environ.get('READINGS_MAX_RECORDS', 100000))),
+        'alerts': (int(os.environ.get('ALERTS_PER_PATIENT', 50)), int(os.environ.get('ALERTS_MAX_RECORDS', 10000))),
+        'raw': (int(os.environ.get('RAW_PER_DEVICE', 50)), int(os.environ.get('RAW_MAX_RECORDS', 5000))),
+    }, args.log_dir)
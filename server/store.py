@@ -0,0 +1,210 @@
+"""In-memory reading store: bounded ring buffers indexed per patient"""
+import heapq
+import itertools
+import threading
+from collections import OrderedDict, deque
+
+
+class RingBuffer:
+    """Fixed-capacity circular buffer with O(1) append and eviction"""
+    __slots__ = ('capacity', '_items', '_start', '_size')
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        """Iterate from oldest to newest"""
+        items, start, capacity = self._items, self._start, self.capacity
+        for offset in range(self._size):
+            yield items[(start + offset) % capacity]
+
+    def __getitem__(self, index):
+        if not 0 <= index < self._size:
+            raise IndexError("ring buffer index out of range")
+        return self._items[(self._start + index) % self.capacity]
+
+    def append(self, item):
+        """Append an item, returning the evicted oldest item (or None)"""
+        if self._size < self.capacity:
+            self._items[(self._start + self._size) % self.capacity] = item
+            self._size += 1
+            return None
+        evicted = self._items[self._start]
+        self._items[self._start] = item
+        self._start = (self._start + 1) % self.capacity
+        return evicted
+
+    def popleft(self):
+        """Remove and return the oldest item"""
+        if not self._size:
+            raise IndexError("pop from empty ring buffer")
+        item = self._items[self._start]
+        self._items[self._start] = None
+        self._start = (self._start + 1) % self.capacity
+        self._size -= 1
+        return item
+
+    def peekleft(self):
+        return self._items[self._start] if self._size else None
+
+    def latest(self):
+        if not self._size:
+            return None
+        return self._items[(self._start + self._size - 1) % self.capacity]
+
+    def resize(self, capacity):
+        """Change capacity, keeping the newest items; returns evicted items"""
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        items = list(self)
+        evicted = items[:max(0, len(items) - capacity)]
+        kept = items[len(evicted):]
+        self.capacity = capacity
+        self._items = kept + [None] * (capacity - len(kept))
+        self._start = 0
+        self._size = len(kept)
+        return evicted
+
+
+class PatientStore:
+    """Per-key ring buffers under a global record budget.
+
+    Every record gets a monotonically increasing ``seq``. When the global
+    budget is exceeded the oldest record of the least recently updated key is
+    evicted, so a chatty device only ever displaces its own history.
+    """
+
+    def __init__(self, per_key_capacity, max_records, key='patient_id', default_key='Unknown'):
+        self.per_key_capacity = per_key_capacity
+        self.max_records = max_records
+        self.key = key
+        self.default_key = default_key
+        self.evictions = 0
+        self._buffers = OrderedDict()
+        self._size = 0
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def size_hint(self):
+        """Record count for status responses; exact here, possibly a little stale for RemoteStore"""
+        return self._size
+
+    @property
+    def last_seq(self):
+        return self._last_seq
+
+    def keys(self):
+        with self._lock:
+            return list(self._buffers)
+
+    def append(self, record):
+        """Store a record, assigning its sequence number"""
+        key = record.get(self.key) or self.default_key
+        with self._lock:
+            seq = next(self._seq)
+            record['seq'] = seq
+            self._last_seq = seq
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                buffer = self._buffers[key] = RingBuffer(self.per_key_capacity)
+            else:
+                self._buffers.move_to_end(key)
+            if buffer.append(record) is None:
+                self._size += 1
+            else:
+                self.evictions += 1
+            while self._size > self.max_records:
+                self._evict_least_recent()
+        return record
+
+    def _evict_least_recent(self):
+        key, buffer = next(iter(self._buffers.items()))
+        buffer.popleft()
+        self._size -= 1
+        self.evictions += 1
+        if not len(buffer):
+            del self._buffers[key]
+
+    @property
+    def version(self):
+        """Changes whenever the stored contents change (usable as an ETag)"""
+        return f"{self._last_seq}-{self.evictions}"
+
+    @staticmethod
+    def _tail_after(buffer, since):
+        # Records within a buffer are in seq order: binary search for the first one after `since`
+        low, high = 0, len(buffer)
+        while low < high:
+            mid = (low + high) // 2
+            if buffer[mid]['seq'] <= since:
+                low = mid + 1
+            else:
+                high = mid
+        return [buffer[index] for index in range(low, len(buffer))]
+
+    def _snapshots(self, key=None, since=None):
+        # Copy references only, so iteration is safe against concurrent appends
+        with self._lock:
+            if key is not None:
+                buffer = self._buffers.get(key)
+                buffers = [buffer] if buffer is not None else []
+            else:
+                buffers = list(self._buffers.values())
+            if since is None:
+                return [list(buffer) for buffer in buffers]
+            return [self._tail_after(buffer, since) for buffer in buffers]
+
+    def iter_records(self, key=None, since=None):
+        """Yield records oldest first (merged across keys by seq)"""
+        snapshots = [snapshot for snapshot in self._snapshots(key, since) if snapshot]
+        if len(snapshots) == 1:
+            return iter(snapshots[0])
+        return heapq.merge(*snapshots, key=lambda record: record['seq'])
+
+    def query(self, key=None, since=None, limit=None, start=None, end=None):
+        """Select records by seq, key and ISO timestamp range.
+
+        With ``since`` the oldest ``limit`` newer records are returned so a
+        client can page forward; without it the newest ``limit`` records.
+        """
+        records = self.iter_records(key, since)
+        if start is not None or end is not None:
+            records = (record for record in records
+                       if (start is None or record['timestamp'] >= start)
+                       and (end is None or record['timestamp'] <= end))
+        if limit is None:
+            return records
+        if since is not None:
+            return itertools.islice(records, limit)
+        return iter(deque(records, maxlen=limit))
+
+    def latest(self, key):
+        with self._lock:
+            buffer = self._buffers.get(key)
+            return buffer.latest() if buffer is not None else None
+
+    def configure(self, per_key_capacity=None, max_records=None):
+        """Resize buffers in place, evicting the oldest records if needed"""
+        with self._lock:
+            if per_key_capacity is not None:
+                self.per_key_capacity = per_key_capacity
+                for buffer in self._buffers.values():
+                    evicted = len(buffer.resize(per_key_capacity))
+                    self._size -= evicted
+                    self.evictions += evicted
+            if max_records is not None:
+                self.max_records = max_records
+            while self._size > self.max_records:
+                self._evict_least_recent()
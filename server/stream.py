@@ -0,0 +1,113 @@
+"""Push channel for dashboards: fan out new readings and alerts over SSE"""
+import itertools
+import json
+import queue
+import threading
+
+from store import RingBuffer
+
+
+class Subscription:
+    """A single connected client, with optional patient and event-type filters"""
+
+    def __init__(self, patient_id=None, event_types=None, max_pending=1000):
+        self.patient_id = patient_id
+        self.event_types = event_types
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def wants(self, event):
+        if self.event_types and event['event'] not in self.event_types:
+            return False
+        return self.patient_id is None or event['patient_id'] == self.patient_id
+
+
+class EventBroker:
+    """Sends each event once to every subscriber, keeping a short replay history.
+
+    At most ``max_subscribers`` clients are connected at once (None: no limit).
+    """
+
+    def __init__(self, history_size=1000, max_subscribers=None):
+        self.max_subscribers = max_subscribers
+        self.rejected = 0
+        self._history = RingBuffer(history_size)
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event_type, record):
+        """Publish a record to all matching subscribers"""
+        with self._lock:
+            self._last_id = next(self._ids)
+            event = {
+                'id': self._last_id,
+                'event': event_type,
+                'patient_id': record.get('patient_id'),
+                'data': json.dumps(record)
+            }
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if not subscription.wants(event):
+                continue
+            try:
+                subscription.pending.put_nowait(event)
+            except queue.Full:
+                # A client that cannot keep up is disconnected; it resumes via Last-Event-ID
+                subscription.overflowed = True
+        return event['id']
+
+    def subscribe(self, patient_id=None, event_types=None, last_event_id=None):
+        """Register a subscriber and return it with the events it missed.
+
+        The subscription is None when ``max_subscribers`` clients are already connected.
+        """
+        subscription = Subscription(patient_id, event_types)
+        with self._lock:
+            if self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers:
+                self.rejected += 1
+                return None, [], False
+            self._subscribers.add(subscription)
+            missed = []
+            gap = False
+            if last_event_id is not None:
+                oldest = self._history.peekleft()
+                # Ids restart with the server: one ahead of ours was issued before a restart
+                gap = last_event_id > self._last_id or (oldest is not None and oldest['id'] > last_event_id + 1)
+                missed = [event for event in self._history
+                          if event['id'] > last_event_id and subscription.wants(event)]
+        return subscription, missed, gap
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+
+def format_sse(event):
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {event['data']}\n\n"
+
+
+def sse_events(broker, subscription, missed, gap, keepalive=15.0):
+    """Generate the SSE wire format for one subscription"""
+    try:
+        yield "retry: 3000\n\n"
+        if gap:
+            # History no longer covers the client's position: tell it to refetch
+            yield "event: reset\ndata: {}\n\n"
+        for event in missed:
+            yield format_sse(event)
+        while not subscription.overflowed:
+            try:
+                event = subscription.pending.get(timeout=keepalive)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
+    finally:
+        broker.unsubscribe(subscription)
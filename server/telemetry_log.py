@@ -0,0 +1,211 @@
+"""Durable append-only telemetry log with segment rotation and group commit"""
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Frame: payload length, CRC32 of payload, record kind; followed by the JSON payload
+HEADER = struct.Struct('<IIB')
+KINDS = {'reading': 0, 'alert': 1}
+KIND_NAMES = {code: name for name, code in KINDS.items()}
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+
+
+def encode_frame(kind, record):
+    payload = json.dumps(record, separators=(',', ':')).encode('utf-8')
+    return HEADER.pack(len(payload), zlib.crc32(payload), KINDS[kind]) + payload
+
+
+def scan_frames(data):
+    """Yield (kind, payload, end_offset) for each intact frame in a segment"""
+    view = memoryview(data)
+    offset, size, header_size = 0, len(data), HEADER.size
+    while offset + header_size <= size:
+        length, crc, kind = HEADER.unpack_from(view, offset)
+        start = offset + header_size
+        end = start + length
+        if end > size or kind not in KIND_NAMES:
+            return
+        payload = view[start:end]
+        if zlib.crc32(payload) != crc:
+            return
+        yield KIND_NAMES[kind], payload, end
+        offset = end
+
+
+def list_segments(directory):
+    """Segment paths in ``directory``, oldest first"""
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+    return [os.path.join(directory, name) for name in names]
+
+
+def read_segments(paths, kinds=None, contains=None):
+    """Yield (kind, record) from segment files, oldest first.
+
+    Frames of other ``kinds``, or whose JSON does not contain the bytes
+    ``contains``, are skipped before they are parsed. Safe to call while
+    another process appends: reading stops at the last complete frame.
+    """
+    for path in paths:
+        try:
+            with open(path, 'rb') as segment:
+                data = segment.read()
+        except FileNotFoundError:
+            # Rotated away since it was listed
+            continue
+        for kind, payload, _ in scan_frames(data):
+            if kinds is not None and kind not in kinds:
+                continue
+            payload = payload.tobytes()
+            if contains is not None and contains not in payload:
+                continue
+            yield kind, json.loads(payload)
+
+
+class TelemetryLog:
+    """Append-only log of readings and alerts on local disk.
+
+    ``append`` only queues an encoded frame; a background thread writes
+    everything queued since the last flush with one write and one fsync
+    (group commit). Segments rotate at ``segment_bytes`` and only the newest
+    ``max_segments`` are kept.
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, max_segments=64, flush_interval=0.05):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.flush_interval = flush_interval
+        self.records_written = 0
+        self.bytes_written = 0
+        self.fsyncs = 0
+        self.truncated_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+
+        segments = self.segments()
+        if segments:
+            self.truncated_bytes = self._recover_tail(segments[-1])
+        # Segments left empty by runs that wrote nothing (restarts, the debug reloader) are
+        # dropped so they don't push history out of replay() and max_segments
+        for path in segments[:-1]:
+            if os.path.getsize(path) == 0:
+                os.remove(path)
+        if segments and os.path.getsize(segments[-1]) == 0:
+            self._segment_id = self._segment_number(segments[-1])
+        else:
+            # A fresh segment, so a recovered tail is never appended to
+            self._segment_id = self._segment_number(segments[-1]) + 1 if segments else 1
+        self._file = self._open_segment()
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, name='telemetry-log-flusher', daemon=True)
+        self._flusher.start()
+
+    def segments(self):
+        """Segment paths, oldest first"""
+        return list_segments(self.directory)
+
+    @staticmethod
+    def _segment_number(path):
+        return int(os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._segment_id:08d}{SEGMENT_SUFFIX}")
+        return open(path, 'ab')
+
+    @staticmethod
+    def _recover_tail(path):
+        """Truncate a torn write left by a crash; returns the bytes removed"""
+        with open(path, 'rb') as segment:
+            data = segment.read()
+        good = 0
+        for _, _, end in scan_frames(data):
+            good = end
+        if good < len(data):
+            with open(path, 'r+b') as segment:
+                segment.truncate(good)
+        return len(data) - good
+
+    @staticmethod
+    def _size(path):
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+
+    def append(self, kind, record):
+        """Queue a record for the next group commit"""
+        frame = encode_frame(kind, record)
+        with self._cond:
+            self._pending.append(frame)
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                if not self._pending and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                batch, self._pending = self._pending, []
+                closed = self._closed
+            if batch:
+                self._write(batch)
+            if closed:
+                return
+
+    def _write(self, batch):
+        data = b''.join(batch)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.fsyncs += 1
+        self.records_written += len(batch)
+        self.bytes_written += len(data)
+        if self._file.tell() >= self.segment_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        self._segment_id += 1
+        self._file = self._open_segment()
+        segments = self.segments()
+        for path in segments[:max(0, len(segments) - self.max_segments)]:
+            os.remove(path)
+
+    def flush(self, timeout=5.0):
+        """Block until everything appended so far is on disk"""
+        deadline = time.monotonic() + timeout
+        target = self.records_written + len(self._pending)
+        while self.records_written < target and time.monotonic() < deadline:
+            with self._cond:
+                self._cond.notify()
+            time.sleep(self.flush_interval / 10)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._flusher.join()
+        self._file.close()
+
+    def replay(self, segments=None):
+        """Yield (kind, record) from the newest ``segments`` non-empty segments, oldest first"""
+        paths = [path for path in self.segments() if self._size(path)]
+        if segments is not None:
+            paths = paths[-segments:]
+        return read_segments(paths)
+
+    def stats(self):
+        return {
+            "directory": self.directory,
+            "segments": len(self.segments()),
+            "records_written": self.records_written,
+            "bytes_written": self.bytes_written,
+            "fsyncs": self.fsyncs,
+            "pending": len(self._pending),
+            "truncated_bytes_on_recovery": self.truncated_bytes
+        }
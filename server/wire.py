@@ -0,0 +1,44 @@
+"""Compact binary reading frames, an alternative to base64 AES JSON.
+
+A request body is one or more fixed-size frames (little-endian):
+
+    uint32 device_id | uint32 seq | uint32 timestamp (unix s, 0 = unknown)
+    uint16 heart_rate | uint8 fall | pad | float32 accel_magnitude
+
+The layout is versioned by Content-Type; ``+aes`` means the body is
+AES-128-CBC encrypted with PKCS#7 padding (no base64).
+"""
+import struct
+
+FRAME_V1 = struct.Struct('<IIIHBxf')
+CONTENT_TYPES = {
+    'application/vnd.health-monitor.reading.v1': FRAME_V1,
+}
+AES_SUFFIX = '+aes'
+
+
+class FrameError(ValueError):
+    pass
+
+
+def frame_format(content_type):
+    """(struct, encrypted) for a binary Content-Type, or None for anything else"""
+    if not content_type:
+        return None
+    media_type = content_type.split(';', 1)[0].strip().lower()
+    encrypted = media_type.endswith(AES_SUFFIX)
+    if encrypted:
+        media_type = media_type[:-len(AES_SUFFIX)]
+    frame = CONTENT_TYPES.get(media_type)
+    return (frame, encrypted) if frame is not None else None
+
+
+def iter_frames(body, frame=FRAME_V1):
+    """Unpack every frame in the body straight from its buffer"""
+    if not body or len(body) % frame.size:
+        raise FrameError(f"body of {len(body or b'')} bytes is not a whole number of {frame.size}-byte frames")
+    return frame.iter_unpack(memoryview(body))
+
+
+def encode_frame(device_id, seq, timestamp, heart_rate, fall, accel_magnitude=0.0, frame=FRAME_V1):
+    return frame.pack(device_id, seq, int(timestamp), heart_rate, fall, accel_magnitude)
@@ -0,0 +1,36 @@
+"""The server and benchmark modules import each other as siblings, like when run from their directories"""
+import base64
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('server', 'benchmarks'):
+    sys.path.insert(0, os.path.join(ROOT, directory))
+
+# Credentials of the shared firmware account in server/devices.json
+DEVICE_AUTH = {'Authorization': 'Basic ' + base64.b64encode(b'iotuser:iotpass').decode('ascii')}
+ADMIN_TOKEN = 'test-admin-token'
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """app.py as a scratch instance: in memory only, nothing read from or written to server/data"""
+    scratch = tmp_path_factory.mktemp('app')
+    os.environ.update({
+        'TELEMETRY_LOG_DIR': '',
+        'LOG_LEVEL': 'ERROR',
+        'RUNTIME_CONFIG': str(scratch / 'runtime_config.json'),
+        'INGEST_SPILL_PATH': str(scratch / 'ingest-spill.jsonl'),
+        'CONFIG_ADMIN_TOKEN': ADMIN_TOKEN,
+    })
+    for name in ('CAPTURE_DIR', 'HEALTH_STORE_ADDRESS', 'NOTIFY_WEBHOOK_URL'):
+        os.environ.pop(name, None)
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
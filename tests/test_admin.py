@@ -0,0 +1,19 @@
+import pytest
+
+from conftest import ADMIN_TOKEN
+
+ADMIN = {'Authorization': f'Bearer {ADMIN_TOKEN}'}
+
+
+@pytest.mark.parametrize('path', ['/metrics/profiler?action=stop', '/capture?action=stop', '/config/reload'])
+def test_admin_endpoints_need_the_token(client, path):
+    assert client.post(path).status_code == 401
+    assert client.post(path, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.post(path, headers=ADMIN).status_code == 200
+
+
+def test_profiler_start_and_stop(client):
+    assert client.post('/metrics/profiler?action=start&interval=0.0001', headers=ADMIN).status_code == 400
+    assert client.post('/metrics/profiler?action=start', headers=ADMIN).get_json()['running']
+    assert not client.post('/metrics/profiler?action=stop', headers=ADMIN).get_json()['running']
+    assert client.get('/metrics/profiler').status_code == 200
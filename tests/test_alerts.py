@@ -0,0 +1,69 @@
+import time
+
+from alerts import IncidentTracker
+
+
+def alert(patient_id='P1', rule='tachycardia', severity='MEDIUM', **fields):
+    return {'patient_id': patient_id, 'rule': rule, 'severity': severity, 'message': 'HR high', **fields}
+
+
+def tracker():
+    emitted = []
+    return IncidentTracker(emitted.append, resolve_after=60.0, escalate_after=120.0), emitted
+
+
+def statuses(emitted):
+    return [(record['status'], record['severity']) for record in emitted]
+
+
+def test_repeats_coalesce_into_one_incident():
+    incidents, emitted = tracker()
+    now = time.monotonic()
+    assert incidents.trigger(alert(), now=now)['status'] == 'open'
+    for offset in range(1, 10):
+        assert incidents.trigger(alert(), now=now + offset * 5) is None
+    assert incidents.trigger(alert(rule='falls'), now=now + 50)['status'] == 'open'
+    assert incidents.trigger(alert(patient_id='P2'), now=now + 50)['status'] == 'open'
+    assert len(emitted) == 3 and incidents.stats()['coalesced'] == 9
+    [incident] = [incident for incident in incidents.active() if incident['rule'] == 'tachycardia'
+                  and incident['patient_id'] == 'P1']
+    assert (incident['status'], incident['occurrences']) == ('ongoing', 10)
+
+
+def test_resolves_after_quiet_period():
+    incidents, emitted = tracker()
+    now = time.monotonic()
+    incidents.trigger(alert(), now=now)
+    incidents.trigger(alert(), now=now + 30)
+    assert incidents.check(now + 80) == []
+    [resolved] = incidents.check(now + 92)
+    assert resolved['status'] == 'resolved' and resolved['occurrences'] == 2
+    assert incidents.active() == []
+    # The condition coming back is a new incident
+    assert incidents.trigger(alert(), now=now + 100)['incident_id'] != resolved['incident_id']
+
+
+def test_escalates_while_active_up_to_critical():
+    incidents, emitted = tracker()
+    now = time.monotonic()
+    incidents.trigger(alert(), now=now)
+    for offset in range(5, 400, 5):
+        incidents.trigger(alert(), now=now + offset)
+        incidents.check(now + offset)
+    assert statuses(emitted) == [('open', 'MEDIUM'), ('escalated', 'HIGH'), ('escalated', 'CRITICAL')]
+    assert incidents.stats()['transitions'] == {'open': 1, 'escalated': 2, 'resolved': 0}
+
+
+def test_sticky_incidents_only_end_through_resolve():
+    incidents, emitted = tracker()
+    now = time.monotonic()
+    offline = alert(rule='device_offline', device='iotuser@P1')
+    incidents.trigger(offline, sticky=True, now=now)
+    incidents.trigger(alert(patient_id='P9', rule='device_offline', device='iotuser@P9'), sticky=True, now=now)
+    incidents.check(now + 1000)
+    assert len(incidents.active()) == 2
+    # Keyed by patient and device: the wrong patient resolves nothing
+    assert incidents.resolve('P2', 'device_offline', 'back', device='iotuser@P1') is None
+    record = incidents.resolve('P1', 'device_offline', 'back', device='iotuser@P1')
+    assert (record['status'], record['message'], record['device']) == ('resolved', 'back', 'iotuser@P1')
+    assert [incident['device'] for incident in incidents.active()] == ['iotuser@P9']
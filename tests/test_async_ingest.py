@@ -0,0 +1,41 @@
+import asyncio
+import threading
+
+import pytest
+
+from pipeline import IngestPipeline
+
+
+def test_pipeline_reports_a_backlog_before_submit_blocks():
+    started, release = threading.Event(), threading.Event()
+
+    def handle(payload):
+        started.set()
+        release.wait()
+    pipeline = IngestPipeline(workers=1, max_queue=4)
+    pipeline.register('reading', handle, reliable=True)
+    pipeline.submit('reading', {})
+    # The worker holds the first event; the queue fills behind it
+    started.wait()
+    for _ in range(2):
+        assert not pipeline.backlogged()
+        pipeline.submit('reading', {})
+    assert pipeline.backlogged()
+    release.set()
+    pipeline.join()
+    assert not pipeline.backlogged()
+
+
+@pytest.mark.parametrize('backlogged, inline', [(False, True), (True, False)])
+def test_dispatch_leaves_the_loop_when_submit_may_block(app_module, monkeypatch, backlogged, inline):
+    import async_ingest
+
+    def handler(body, headers, remote_addr):
+        return threading.current_thread(), 200, {}
+    monkeypatch.setattr(app_module, 'ingest_update', handler)
+    monkeypatch.setattr(app_module.pipeline, 'backlogged', lambda: backlogged)
+    server = async_ingest.IngestServer(offload_all=False)
+    # No Authorization header: nothing to verify, so only the backlog decides
+    thread, _, _ = asyncio.run(server._dispatch(handler, b'', {}, '127.0.0.1'))
+    assert (thread is threading.current_thread()) == inline
+    server.executor.shutdown()
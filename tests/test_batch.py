@@ -0,0 +1,35 @@
+import base64
+import json
+
+from conftest import DEVICE_AUTH
+from firmware import encrypt_data, reading_json
+
+
+def plain(message):
+    return base64.b64encode(message.encode()).decode('ascii')
+
+
+def test_batch_reports_each_item(client):
+    items = [plain(reading_json(72, 0, 'B1')), encrypt_data(reading_json(150, 1, 'B1')),
+             '!!!not-base64', plain('{"heart_rate":')]
+    response = client.post('/update/batch', data=json.dumps(items), headers=DEVICE_AUTH)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['batch_size'], body['accepted'], body['rejected']) == (4, 2, 2)
+    assert [(result['index'], result['status'], result['is_critical']) for result in body['results']] == [
+        (0, 'accepted', False), (1, 'accepted', True), (2, 'rejected', False), (3, 'rejected', False)]
+    assert body['results'][0]['error'] is None
+    assert body['results'][3]['error']
+
+
+def test_newline_delimited_batch(client, app_module):
+    items = [encrypt_data(reading_json(60 + index, 0, 'B2')) for index in range(3)]
+    response = client.post('/update/batch', data='\n'.join(items) + '\n', headers=DEVICE_AUTH)
+    assert [result['status'] for result in response.get_json()['results']] == ['accepted'] * 3
+    stored = list(app_module.processed_health_data.query('B2'))
+    assert [record['heart_rate'] for record in stored] == [60, 61, 62]
+
+
+def test_batch_needs_device_credentials(client):
+    response = client.post('/update/batch', data=plain(reading_json(72, 0, 'B3')))
+    assert response.status_code == 401
@@ -0,0 +1,41 @@
+from capture import CaptureRecorder, list_captures, read_capture
+
+
+def test_capture_round_trip(tmp_path):
+    recorder = CaptureRecorder(str(tmp_path), flush_interval=0.01)
+    recorder.record('/update', 'Basic aW90dXNlcjppb3RwYXNz', 'text/plain', b'payload-1')
+    recorder.record('/update/batch', None, 'application/json', b'[]')
+    recorder.record('/update', 'Basic aW90dXNlcjppb3RwYXNz', None, b'')
+    recorder.close()
+    captured = list(read_capture(list_captures(str(tmp_path))))
+    assert [request[1:] for request in captured] == [
+        ('/update', 'Basic aW90dXNlcjppb3RwYXNz', 'text/plain', b'payload-1'),
+        ('/update/batch', None, 'application/json', b'[]'),
+        ('/update', 'Basic aW90dXNlcjppb3RwYXNz', None, b''),
+    ]
+    assert captured[0][0] <= captured[1][0] <= captured[2][0]
+    assert recorder.stats()['recorded'] == 3
+
+
+def test_capture_rotates_and_keeps_newest_segments(tmp_path):
+    recorder = CaptureRecorder(str(tmp_path), segment_bytes=64, max_segments=2, flush_interval=0.01)
+    for index in range(5):
+        recorder.record('/update', None, 'text/plain', bytes([index]) * 100)
+        # One write per request, so each lands in (and rotates) its own segment
+        while recorder.stats()['recorded'] <= index:
+            pass
+    recorder.close()
+    segments = list_captures(str(tmp_path))
+    assert len(segments) == 2
+    assert [body[0] for *_, body in read_capture(segments)] == [4]
+
+
+def test_torn_tail_ends_the_segment(tmp_path):
+    recorder = CaptureRecorder(str(tmp_path), flush_interval=0.01)
+    recorder.record('/update', None, 'text/plain', b'complete')
+    recorder.record('/update', None, 'text/plain', b'torn')
+    recorder.close()
+    [segment] = list_captures(str(tmp_path))
+    with open(segment, 'r+b') as capture:
+        capture.truncate(capture.seek(0, 2) - 2)
+    assert [body for *_, body in read_capture([segment])] == [b'complete']
@@ -0,0 +1,30 @@
+import base64
+
+import pytest
+
+pytest.importorskip('cryptography')
+
+from cipher import DeviceCipher, KeyRing  # noqa: E402
+from firmware import encrypt_data, reading_json  # noqa: E402
+
+
+def test_decrypts_firmware_payloads():
+    cipher = KeyRing('mysecretkey12345').get('iotuser')
+    for message in (reading_json(72, 0), reading_json(131, 1, 'P042'), 'x' * 15, 'x' * 16):
+        assert cipher.decrypt(base64.b64decode(encrypt_data(message))) == message.encode()
+
+
+def test_decrypt_many_matches_one_at_a_time():
+    cipher = DeviceCipher('mysecretkey12345')
+    messages = [reading_json(60 + index, index % 2) for index in range(20)]
+    ciphertexts = [base64.b64decode(encrypt_data(message)) for message in messages]
+    assert cipher.decrypt_many(ciphertexts + [b'short']) == [message.encode() for message in messages] + [None]
+
+
+def test_per_device_keys():
+    ring = KeyRing('mysecretkey12345')
+    ring.set_key('ward-7', 'anotherkey123456')
+    payload = base64.b64decode(encrypt_data(reading_json(80, 0), key='anotherkey123456'))
+    assert ring.get('ward-7').decrypt(payload) == reading_json(80, 0).encode()
+    assert ring.get('iotuser').decrypt(payload) != reading_json(80, 0).encode()
+    assert KeyRing().get('iotuser') is None
@@ -0,0 +1,38 @@
+import base64
+import json
+
+from conftest import DEVICE_AUTH
+from firmware import reading_json
+
+
+def post(client, patient_id, headers=DEVICE_AUTH):
+    body = base64.b64encode(reading_json(72, 0, patient_id).encode())
+    return client.post('/update', data=body, headers=headers)
+
+
+def devices(app_module, patient_id):
+    return [record['device'] for record in app_module.processed_health_data.query(patient_id)]
+
+
+def test_shared_login_is_tracked_per_patient(client, app_module):
+    assert post(client, 'DV1').status_code == 200
+    assert post(client, 'DV2').status_code == 200
+    assert devices(app_module, 'DV1') == ['iotuser@DV1']
+    assert devices(app_module, 'DV2') == ['iotuser@DV2']
+
+
+def test_offline_incident_resolves_under_its_patient(app_module):
+    app_module.raise_offline_alert('iotuser@DV3', 0.0, 'DV3', 15.0)
+    active = [(incident['patient_id'], incident['device']) for incident in app_module.incidents.active()]
+    assert ('DV3', 'iotuser@DV3') in active
+    app_module.resolve_offline_alert('iotuser@DV3', 'DV3', 20.0)
+    assert all(incident['device'] != 'iotuser@DV3' for incident in app_module.incidents.active())
+
+
+def test_device_identity():
+    from app import device_identity
+    assert device_identity('P1-watch') == 'P1-watch'
+    assert device_identity('iotuser', patient_id='P1') == 'iotuser@P1'
+    assert device_identity('gateway', 7) == 'gateway/7'
+    assert device_identity(None, 7) == 'device-7'
+    assert device_identity(None, patient_id='P1') is None
@@ -0,0 +1,77 @@
+import time
+
+from heartbeat import OfflineDetector, TimerWheel
+
+
+def test_timer_wheel_fires_at_deadline():
+    wheel = TimerWheel(tick=1.0, slots=8, now=0)
+    wheel.schedule(3.0, 'a')
+    wheel.schedule(5.5, 'b')
+    assert wheel.advance(2.9) == []
+    assert wheel.advance(3.0) == ['a']
+    assert wheel.advance(5.9) == []
+    assert wheel.advance(6.0) == ['b']
+    assert wheel.size == 0
+
+
+def test_timer_wheel_deadlines_past_one_lap():
+    wheel = TimerWheel(tick=1.0, slots=4, now=0)
+    wheel.schedule(10.0, 'far')
+    wheel.schedule(2.0, 'near')
+    assert wheel.advance(9.0) == ['near']
+    assert wheel.size == 1
+    assert wheel.advance(10.0) == ['far']
+
+
+def test_timer_wheel_catches_up_after_a_stall():
+    wheel = TimerWheel(tick=1.0, slots=4, now=0)
+    wheel.schedule(2.0, 'a')
+    wheel.schedule(3.0, 'b')
+    assert sorted(wheel.advance(100.0)) == ['a', 'b']
+    # Deadlines already in the past fire on the next tick
+    wheel.schedule(50.0, 'late')
+    assert wheel.advance(101.0) == ['late']
+
+
+def test_offline_detector_reports_each_silence_once():
+    offline, online, retired = [], [], []
+    detector = OfflineDetector(lambda *event: offline.append(event[:3]), lambda *event: online.append(event[:2]),
+                               interval=1.0, missed=3, tick=1.0, slots=16,
+                               on_retire=lambda *event: retired.append(event[:2]), retire_after=10.0)
+    started = time.monotonic()
+    detector.heartbeat('dev-1', 'P1')
+    assert detector.check(started + 2.0) == 0
+    # Timeout is interval * missed = 3s; the second check is past it (plus the tick rounding)
+    assert detector.check(started + 5.0) == 1
+    assert [(device, patient_id) for device, _, patient_id in offline] == [('dev-1', 'P1')]
+    assert detector.check(started + 6.0) == 0
+    detector.heartbeat('dev-1', 'P1')
+    assert online == [('dev-1', 'P1')]
+    assert detector.stats()['offline'] == 0
+
+
+def test_offline_detector_retires_silent_devices():
+    offline, retired = [], []
+    detector = OfflineDetector(lambda *event: offline.append(event[0]), interval=1.0, missed=2, tick=1.0, slots=16,
+                               on_retire=lambda *event: retired.append(event[:2]), retire_after=10.0)
+    started = time.monotonic()
+    detector.heartbeat('dev-1', 'P1')
+    detector.check(started + 4.0)
+    detector.check(started + 10.0)
+    assert offline == ['dev-1'] and retired == []
+    detector.check(started + 16.0)
+    assert retired == [('dev-1', 'P1')]
+    assert detector.stats()['devices'] == 0 and detector.retired == 1
+
+
+def test_back_online_reports_the_patient_it_went_offline_for():
+    offline, online = [], []
+    detector = OfflineDetector(lambda *event: offline.append(event[2]), lambda *event: online.append(event[1]),
+                               interval=1.0, missed=2, tick=1.0, slots=16)
+    started = time.monotonic()
+    detector.heartbeat('watch-1', 'P1')
+    detector.check(started + 4.0)
+    detector.heartbeat('watch-1', 'P2')
+    assert offline == ['P1'] and online == ['P1']
+    detector.check(started + 10.0)
+    assert offline == ['P1', 'P2']
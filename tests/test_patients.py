@@ -0,0 +1,49 @@
+import pytest
+
+from patients import PatientIndex
+
+
+def reading(patient_id, heart_rate):
+    return {'patient_id': patient_id, 'heart_rate': heart_rate, 'fall': 0, 'timestamp': '', 'seq': 1}
+
+
+def walk(index, now, **query):
+    pages, cursor = [], None
+    while True:
+        items, cursor, _ = index.roster(now, cursor=cursor, **query)
+        pages.append([item['patient_id'] for item in items])
+        if cursor is None:
+            return pages
+
+
+@pytest.fixture
+def index():
+    index = PatientIndex(open_seconds=300, stale_seconds=30)
+    for number in range(7):
+        index.add_reading(reading(f"P{number}", 60 + number * 10), 1000.0 + number)
+    index.add_alert({'patient_id': 'P2', 'severity': 'CRITICAL'}, 1010.0)
+    index.add_alert({'patient_id': 'P5', 'severity': 'LOW'}, 1010.0)
+    return index
+
+
+def test_roster_cursor_visits_every_patient_once(index):
+    assert walk(index, 1020.0, sort='patient_id', limit=3) == [['P0', 'P1', 'P2'], ['P3', 'P4', 'P5'], ['P6']]
+    assert walk(index, 1020.0, sort='heart_rate', limit=4) == [['P6', 'P5', 'P4', 'P3'], ['P2', 'P1', 'P0']]
+    assert walk(index, 1020.0, sort='severity', limit=2) == [['P2', 'P5'], ['P6', 'P4'], ['P3', 'P1'], ['P0']]
+    assert walk(index, 1020.0, sort='severity', status='critical', limit=1) == [['P2'], ['P5']]
+
+
+def test_roster_cursor_is_stable_across_new_patients(index):
+    items, cursor, _ = index.roster(1020.0, sort='patient_id', limit=3)
+    index.add_reading(reading('P00', 50), 1015.0)
+    items, cursor, summary = index.roster(1020.0, sort='patient_id', cursor=cursor, limit=10)
+    assert [item['patient_id'] for item in items] == ['P3', 'P4', 'P5', 'P6']
+    assert cursor is None and summary['patients'] == 8
+
+
+def test_roster_rejects_foreign_cursors(index):
+    _, cursor, _ = index.roster(1020.0, sort='patient_id', limit=1)
+    with pytest.raises(ValueError):
+        index.roster(1020.0, sort='heart_rate', cursor=cursor)
+    with pytest.raises(ValueError):
+        index.roster(1020.0, sort='patient_id', cursor='not-a-cursor')
@@ -0,0 +1,47 @@
+import json
+
+from conftest import DEVICE_AUTH
+from firmware import encrypt_data, reading_json
+
+
+def ingest(client, patient_id, heart_rates):
+    items = [encrypt_data(reading_json(heart_rate, 0, patient_id)) for heart_rate in heart_rates]
+    assert client.post('/update/batch', data=json.dumps(items), headers=DEVICE_AUTH).status_code == 200
+
+
+def page(client, **query):
+    response = client.get('/data', query_string=query)
+    assert response.status_code == 200
+    return response, [record['heart_rate'] for record in json.loads(response.get_data())]
+
+
+def test_since_and_limit_page_forward_without_gaps(client):
+    ingest(client, 'Q1', range(60, 67))
+    response, newest = page(client, patient_id='Q1', limit=2)
+    assert newest == [65, 66]
+    seen, since = [], 0
+    while True:
+        response, heart_rates = page(client, patient_id='Q1', since=since, limit=3)
+        if not heart_rates:
+            break
+        seen += heart_rates
+        since = int(response.headers['X-Last-Seq'])
+    assert seen == list(range(60, 67))
+    # Nothing new: the cursor stays where it was
+    assert int(response.headers['X-Last-Seq']) == since
+
+
+def test_etag_changes_with_contents_and_query(client):
+    ingest(client, 'Q2', [70])
+    response, _ = page(client, patient_id='Q2')
+    etag = response.headers['ETag']
+    assert client.get('/data?patient_id=Q2', headers={'If-None-Match': etag}).status_code == 304
+    assert page(client, patient_id='Q2', limit=1)[0].headers['ETag'] != etag
+    ingest(client, 'Q2', [71])
+    assert client.get('/data?patient_id=Q2', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_bad_query_arguments_are_rejected(client):
+    assert client.get('/data?limit=-1').status_code == 400
+    assert client.get('/data?start=yesterday').status_code == 400
+    assert client.get('/critical-alerts?end=not-a-time').status_code == 400
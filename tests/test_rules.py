@@ -0,0 +1,83 @@
+import pytest
+
+from rules import RuleEngine, apply_overrides
+from shared_store import RemoteRuleEngine, RuleService
+
+SPECS = [
+    {"name": "fall_high_hr", "type": "fall_with_high_hr", "threshold": 100},
+    {"name": "tachycardia", "type": "sustained_above", "threshold": 120, "readings": 3},
+    {"name": "baseline", "type": "ewma_deviation", "alpha": 0.05, "sigmas": 4, "warmup": 30},
+    {"name": "falls", "type": "repeated_falls", "count": 3, "window_seconds": 600},
+]
+
+
+def fired(engine, patient_id, heart_rate, fall=0, now=0.0):
+    return [rule.name for rule in engine.evaluate(patient_id, heart_rate, fall, now)]
+
+
+def test_fall_with_high_heart_rate():
+    engine = RuleEngine(SPECS[:1])
+    assert fired(engine, 'P1', 101, 1) == ['fall_high_hr']
+    assert fired(engine, 'P1', 100, 1) == []
+    assert fired(engine, 'P1', 140, 0) == []
+
+
+def test_sustained_above_fires_while_it_holds():
+    engine = RuleEngine(SPECS[1:2])
+    history = [bool(fired(engine, 'P1', heart_rate)) for heart_rate in [130] * 5 + [110] + [130] * 3]
+    assert history == [False, False, True, True, True, False, False, False, True]
+    # State is per patient
+    assert fired(engine, 'P2', 130) == []
+
+
+def test_ewma_adapts_to_a_lasting_baseline_shift():
+    engine = RuleEngine(SPECS[2:3])
+    for index in range(200):
+        assert not fired(engine, 'P1', 70 + index % 3)
+    shifted = [bool(fired(engine, 'P1', 110 + index % 3)) for index in range(2000)]
+    assert shifted[0]
+    assert sum(shifted) < 50
+    assert not any(shifted[-1000:])
+    # Back on the old baseline after the new one is learned is an anomaly again
+    assert fired(engine, 'P1', 40) == ['baseline']
+
+
+def test_repeated_falls_within_the_window():
+    engine = RuleEngine(SPECS[3:])
+    assert not fired(engine, 'P1', 70, 1, now=0.0)
+    assert not fired(engine, 'P1', 70, 1, now=100.0)
+    assert fired(engine, 'P1', 70, 1, now=200.0) == ['falls']
+    assert fired(engine, 'P1', 70, 0, now=500.0) == ['falls']
+    assert not fired(engine, 'P1', 70, 0, now=700.0)
+    assert not fired(engine, 'P2', 70, 1, now=1000.0)
+
+
+def test_overrides_keep_state_and_apply_per_patient():
+    engine = RuleEngine(SPECS[1:2])
+    fired(engine, 'P1', 130)
+    fired(engine, 'P1', 130)
+    engine.configure({'tachycardia': {'threshold': 125}}, {'P2': {'tachycardia': {'threshold': 140}}})
+    assert fired(engine, 'P1', 130) == ['tachycardia']
+    assert [bool(fired(engine, 'P2', 130)) for _ in range(4)] == [False] * 4
+    engine.configure({'tachycardia': {'enabled': False}})
+    assert fired(engine, 'P1', 130) == []
+
+
+def test_overrides_are_validated():
+    with pytest.raises(ValueError, match='no rule named'):
+        apply_overrides(SPECS, {'missing': {'threshold': 1}})
+    with pytest.raises(ValueError, match='has no parameter'):
+        apply_overrides(SPECS, {'tachycardia': {'window_seconds': 10}})
+    assert apply_overrides(SPECS, {'baseline': {'anomaly_alpha': 0.01}})[2]['anomaly_alpha'] == 0.01
+
+
+def test_remote_engine_maps_fired_names_to_rules():
+    specs = [SPECS[0], {**SPECS[1], 'enabled': False}]
+    engine = RemoteRuleEngine(RuleService(RuleEngine(specs)), specs)
+    assert [rule.name for rule in engine.rules] == ['fall_high_hr']
+    engine.configure({'tachycardia': {'enabled': True}})
+    for _ in range(2):
+        engine.evaluate('P1', 130, 0)
+    [rule] = engine.evaluate('P1', 130, 0)
+    assert (rule.name, rule.kind) == ('tachycardia', 'sustained_above')
+    assert engine.stats()['evaluations'] == 3
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from conftest import ADMIN_TOKEN
+from runtime_config import RuntimeConfig, Settings, merge
+
+DEFAULTS = {'readings_per_patient': 200, 'alerts_max_records': 20000}
+
+
+def test_merge_recurses_and_null_removes():
+    base = {'retention': {'readings_per_patient': 100}, 'thresholds': {'fall_high_hr': {'threshold': 100}}}
+    merged = merge(base, {'retention': {'alerts_max_records': 50}, 'thresholds': {'fall_high_hr': None}})
+    assert merged == {'retention': {'readings_per_patient': 100, 'alerts_max_records': 50}, 'thresholds': {}}
+    # The base is left alone
+    assert base['thresholds'] == {'fall_high_hr': {'threshold': 100}}
+
+
+@pytest.mark.parametrize('raw', [
+    [],
+    {'colour': 'blue'},
+    {'retention': {'readings_per_patient': 0}},
+    {'retention': {'readings_per_patient': True}},
+    {'retention': {'unknown_limit': 5}},
+    {'thresholds': {'fall_high_hr': {'threshold': '100'}}},
+    {'thresholds': {'fall_high_hr': {'enabled': 1}}},
+    {'cohorts': {'cardiac': []}},
+    {'patients': {'P1': {'cohort': 'missing'}}},
+    {'verbose_logging': 'yes'},
+])
+def test_invalid_settings_are_rejected(raw):
+    with pytest.raises(ValueError):
+        Settings(raw, DEFAULTS)
+
+
+def test_patient_thresholds_beat_their_cohort():
+    settings = Settings({
+        'cohorts': {'cardiac': {'thresholds': {'tachycardia': {'threshold': 110},
+                                               'fall_high_hr': {'threshold': 95}}}},
+        'patients': {'P1': {'cohort': 'cardiac', 'thresholds': {'fall_high_hr': {'threshold': 90}}},
+                     'P2': {'cohort': 'cardiac'},
+                     'P3': {}},
+    }, DEFAULTS)
+    assert settings.patient_thresholds['P1'] == {'tachycardia': {'threshold': 110}, 'fall_high_hr': {'threshold': 90}}
+    assert settings.patient_thresholds['P2']['fall_high_hr'] == {'threshold': 95}
+    assert 'P3' not in settings.patient_thresholds
+    assert settings.retention == DEFAULTS
+
+
+def test_update_writes_the_file_and_rejections_keep_the_previous_version(tmp_path):
+    path = tmp_path / 'runtime_config.json'
+    applied = []
+
+    def apply(settings, previous):
+        if settings.retention['readings_per_patient'] > 1000:
+            raise ValueError("too many readings")
+        applied.append(settings.version)
+
+    config = RuntimeConfig(str(path), DEFAULTS, apply)
+    config.update({'retention': {'readings_per_patient': 50}})
+    assert config.current.version == 1
+    assert json.loads(path.read_text()) == {'retention': {'readings_per_patient': 50}}
+
+    for changes in ({'retention': {'readings_per_patient': 5000}}, {'verbose_logging': 'yes'}):
+        with pytest.raises(ValueError):
+            config.update(changes)
+    assert config.current.retention['readings_per_patient'] == 50
+    assert config.stats()['rejected'] == 2
+    assert json.loads(path.read_text()) == {'retention': {'readings_per_patient': 50}}
+
+    # A hand edit is picked up by reload(); a broken one is rejected
+    path.write_text(json.dumps({'verbose_logging': True}))
+    assert config.reload().verbose_logging
+    path.write_text('{not json')
+    with pytest.raises(ValueError):
+        config.reload()
+    assert config.current.verbose_logging
+    assert applied == [1, 2]
+
+
+def test_config_endpoint(client):
+    admin = {'Authorization': f'Bearer {ADMIN_TOKEN}'}
+    assert client.patch('/config', json={'verbose_logging': True}).status_code == 401
+    assert client.patch('/config', json={'verbose_logging': 'yes'}, headers=admin).status_code == 400
+    response = client.patch('/config', json={'verbose_logging': True}, headers=admin)
+    assert response.status_code == 200
+    assert response.get_json()['settings']['verbose_logging'] is True
+    client.patch('/config', json={'verbose_logging': None}, headers=admin)
+    assert client.get('/config').get_json()['settings']['verbose_logging'] is False
@@ -0,0 +1,73 @@
+import pytest
+
+from store import PatientStore, RingBuffer
+
+
+def test_ring_buffer_evicts_oldest_when_full():
+    buffer = RingBuffer(3)
+    assert [buffer.append(item) for item in range(3)] == [None, None, None]
+    assert buffer.append(3) == 0
+    assert buffer.append(4) == 1
+    assert list(buffer) == [2, 3, 4]
+    assert len(buffer) == 3
+    assert buffer[0] == 2 and buffer.latest() == 4 and buffer.peekleft() == 2
+    with pytest.raises(IndexError):
+        buffer[3]
+
+
+def test_ring_buffer_popleft_after_wraparound():
+    buffer = RingBuffer(2)
+    for item in range(5):
+        buffer.append(item)
+    assert buffer.popleft() == 3
+    buffer.append(5)
+    assert list(buffer) == [4, 5]
+    assert buffer.popleft() == 4 and buffer.popleft() == 5
+    with pytest.raises(IndexError):
+        buffer.popleft()
+    assert buffer.latest() is None
+
+
+def test_ring_buffer_resize_keeps_newest():
+    buffer = RingBuffer(4)
+    for item in range(6):
+        buffer.append(item)
+    assert buffer.resize(2) == [2, 3]
+    assert list(buffer) == [4, 5]
+    assert buffer.resize(5) == []
+    for item in range(6, 9):
+        assert buffer.append(item) is None
+    assert list(buffer) == [4, 5, 6, 7, 8]
+    assert buffer.append(9) == 4
+    with pytest.raises(ValueError):
+        buffer.resize(0)
+
+
+def records(store, key=None, **query):
+    return [record['seq'] for record in store.query(key, **query)]
+
+
+def test_patient_store_query_pages_forward_with_since():
+    store = PatientStore(per_key_capacity=100, max_records=1000)
+    for index in range(10):
+        store.append({'patient_id': 'P1' if index % 2 else 'P2', 'timestamp': f"2024-01-01T00:00:{index:02d}"})
+    assert records(store, limit=3) == [8, 9, 10]
+    assert records(store, since=0, limit=4) == [1, 2, 3, 4]
+    assert records(store, since=4, limit=4) == [5, 6, 7, 8]
+    assert records(store, since=8, limit=4) == [9, 10]
+    assert records(store, since=10, limit=4) == []
+    assert records(store, 'P1', since=2, limit=2) == [4, 6]
+    assert records(store, start="2024-01-01T00:00:03", end="2024-01-01T00:00:05") == [4, 5, 6]
+
+
+def test_patient_store_evicts_least_recently_updated_key():
+    store = PatientStore(per_key_capacity=3, max_records=4)
+    for patient_id in ('P1', 'P1', 'P2', 'P2', 'P2', 'P2'):
+        store.append({'patient_id': patient_id, 'timestamp': ''})
+    # P2 overflowed its own buffer once; the global budget then took P1's oldest record
+    assert len(store) == 4 and store.evictions == 2
+    assert records(store, 'P1') == [2]
+    assert records(store, 'P2') == [4, 5, 6]
+    store.configure(per_key_capacity=1)
+    assert records(store) == [2, 6]
+    assert store.last_seq == 6 and store.version == "6-4"
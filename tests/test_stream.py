@@ -0,0 +1,31 @@
+from stream import EventBroker
+
+
+def publish(broker, count):
+    for number in range(count):
+        broker.publish('reading', {'patient_id': 'P1', 'heart_rate': 60 + number})
+
+
+def test_resume_from_last_event_id():
+    broker = EventBroker(history_size=10)
+    publish(broker, 5)
+    _, missed, gap = broker.subscribe(last_event_id=3)
+    assert [event['id'] for event in missed] == [4, 5] and not gap
+
+
+def test_reset_when_history_no_longer_covers_the_client():
+    broker = EventBroker(history_size=3)
+    publish(broker, 6)
+    _, missed, gap = broker.subscribe(last_event_id=1)
+    assert [event['id'] for event in missed] == [4, 5, 6] and gap
+
+
+def test_reset_when_the_client_is_ahead_after_a_restart():
+    broker = EventBroker(history_size=10)
+    _, missed, gap = broker.subscribe(last_event_id=500)
+    assert missed == [] and gap
+    publish(broker, 2)
+    _, missed, gap = broker.subscribe(last_event_id=500)
+    assert missed == [] and gap
+    _, _, gap = broker.subscribe(last_event_id=2)
+    assert not gap
@@ -0,0 +1,23 @@
+import pytest
+
+from wire import FRAME_V1, FrameError, encode_frame, frame_format, iter_frames
+
+
+def test_frames_round_trip():
+    frames = [(7, 1, 1700000000, 72, 0, 1.5), (7, 2, 0, 180, 1, 0.0)]
+    body = b''.join(encode_frame(*frame) for frame in frames)
+    assert len(body) == 2 * FRAME_V1.size
+    assert list(iter_frames(body)) == frames
+
+
+@pytest.mark.parametrize('body', [b'', None, b'\x00' * (FRAME_V1.size + 1)])
+def test_partial_frames_are_rejected(body):
+    with pytest.raises(FrameError):
+        iter_frames(body)
+
+
+def test_frame_format_from_content_type():
+    assert frame_format('application/vnd.health-monitor.reading.v1') == (FRAME_V1, False)
+    assert frame_format('Application/VND.health-monitor.reading.v1+aes; charset=binary') == (FRAME_V1, True)
+    assert frame_format('text/plain') is None
+    assert frame_format(None) is None